@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import helpers  # noqa: E402
+from excel_utils import NumericColumn  # noqa: E402
+from helpers import add_percentages_to_values, format_percentages, format_values  # noqa: E402
+
+
+def per_cell_format(column) -> list[str]:
+    """
+    The formatting done before the batched formatter: format_values and add_percentages_to_values per cell.
+    """
+    values = [round(value * 100) if isinstance(value, (int, float)) else value for value in column]
+    return [add_percentages_to_values(value) for value in values]
+
+
+def batched_format(column) -> list[str]:
+    return format_percentages(format_values(column))
+
+
+def build_column(num_values: int, seed: int) -> NumericColumn:
+    """
+    A value column like the reader returns: mostly shares between 0 and 1, with the odd placeholder,
+    blank, negative, whole number and exact half.
+    """
+    rng = random.Random(seed)
+    specials = ["--", "*", None, -0.25, 3, 0.125, 0.005, 1.5, True, "12"]
+    column = NumericColumn()
+    for _ in range(num_values):
+        column.append(rng.choice(specials) if rng.random() < 0.05 else rng.random())
+    return column
+
+
+def best_time(func, column, repeat: int) -> tuple[float, list[str]]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(column)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare per-cell value formatting with the batched formatter.")
+    parser.add_argument("--values", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    column = build_column(options.values, seed=0)
+    old_time, old_result = best_time(per_cell_format, column, options.repeat)
+    new_time, new_result = best_time(batched_format, column, options.repeat)
+    assert old_result == new_result, "batched formatting differs from per-cell formatting"
+
+    print(f"{options.values} values, NumPy {'available' if helpers.numpy is not None else 'not installed'}")
+    print(f"{'formatter':<22}{'time (s)':>10}")
+    print(f"{'per cell':<22}{old_time:>10.4f}")
+    print(f"{'batched':<22}{new_time:>10.4f}")
+    if helpers.numpy is not None:
+        numpy_module, helpers.numpy = helpers.numpy, None
+        try:
+            plain_time, plain_result = best_time(batched_format, column, options.repeat)
+        finally:
+            helpers.numpy = numpy_module
+        assert plain_result == new_result, "NumPy and pure Python rounding differ"
+        print(f"{'batched, no NumPy':<22}{plain_time:>10.4f}")
+    print(f"speedup x{old_time / new_time:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from options import FORMATS  # noqa: E402
+from report_utils import run_report  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+ARGS = {"ordering": "All", "total_position": "Top", "font_type": "Tahoma", "margin": "1.0",
+        "extra_columns_flag": True, "extra_columns": "5"}
+
+
+def best_time(file_path: str, formats: list[str], repeat: int) -> float:
+    """
+    Fastest of repeat reports of the workbook in the given formats.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_report(file_path, dict(ARGS, formats=formats))
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time each output format, and all formats from one read of the "
+                                                 "workbook against one report per format.")
+    parser.add_argument("--sheets", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = build_workbook(os.path.join(tmp, "bench.xlsx"), options.sheets, options.rows, 5)
+        print(f"{'formats':<24}{'time (s)':>10}")
+        separate = 0.0
+        for name in FORMATS:
+            seconds = best_time(file_path, [name], options.repeat)
+            separate += seconds
+            print(f"{name:<24}{seconds:>10.3f}")
+        print(f"{'one report per format':<24}{separate:>10.3f}")
+        print(f"{'all from one read':<24}{best_time(file_path, list(FORMATS), options.repeat):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
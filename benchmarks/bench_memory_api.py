@@ -0,0 +1,82 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_utils import run_report, write_report  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+ARGS = {"ordering": "All", "total_position": "Top", "font_type": "Tahoma", "font_size": "9", "margin": "1.0",
+        "extra_columns_flag": True, "extra_columns": "5"}
+
+
+def through_files(workbook: bytes) -> bytes:
+    """
+    The report of workbook bytes by way of temporary files: the workbook is written out, run_report reads it
+    and the report is read back.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "report.xlsx")
+        with open(input_path, "wb") as file:
+            file.write(workbook)
+        with open(run_report(input_path, ARGS), "rb") as file:
+            return file.read()
+
+
+def in_memory(workbook: bytes) -> bytes:
+    """
+    The report of workbook bytes written by write_report into a buffer.
+    """
+    output = io.BytesIO()
+    write_report(workbook, output, ARGS)
+    return output.getvalue()
+
+
+def body(document: bytes) -> bytes:
+    """
+    The word/document.xml of a .docx.
+    """
+    with zipfile.ZipFile(io.BytesIO(document)) as package:
+        return package.read("word/document.xml")
+
+
+def measure(render, workbook: bytes, repeat: int) -> tuple[float, bytes]:
+    """
+    Renders the report repeat times.
+    :return: Tuple of the fastest time and the report
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        document = render(workbook)
+        best = min(best, time.perf_counter() - start)
+    return best, document
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare reports of workbook bytes made through temporary files "
+                                                 "with the in-memory API.")
+    parser.add_argument("--sheets", type=int, nargs="+", default=[5, 50, 200])
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    print(f"{'sheets':>7}{'files (s)':>11}{'memory (s)':>12}{'saved (ms)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for sheets in options.sheets:
+            path = build_workbook(os.path.join(tmp, f"bench_{sheets}.xlsx"), sheets, options.rows, 5)
+            with open(path, "rb") as file:
+                workbook = file.read()
+            files, expected = measure(through_files, workbook, options.repeat)
+            memory, document = measure(in_memory, workbook, options.repeat)
+            assert body(document) == body(expected), "the in-memory report differs from the one written to disk"
+            print(f"{sheets:>7}{files:>11.3f}{memory:>12.3f}{1000 * (files - memory):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_utils import run_report  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+ARGS = {"ordering": "All", "total_position": "Top", "font_type": "Tahoma", "font_size": "9", "margin": "1.0",
+        "extra_columns_flag": True, "extra_columns": "5"}
+
+
+def measure(file_path: str, named_styles: bool, engine: str, repeat: int) -> tuple[float, int, int]:
+    """
+    Generates the report repeat times.
+    :return: Tuple of the fastest time, the size of word/document.xml and the size of the .docx.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output_path = run_report(file_path, dict(ARGS, named_styles=named_styles, table_engine=engine))
+        times.append(time.perf_counter() - start)
+    with zipfile.ZipFile(output_path) as package:
+        xml_size = package.getinfo("word/document.xml").file_size
+    return min(times), xml_size, os.path.getsize(output_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare inline run properties with named styles.")
+    parser.add_argument("--sheets", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", nargs="+", choices=["XML", "python-docx"], default=["XML"],
+                        help="Table engines to compare (python-docx is much slower)")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = build_workbook(os.path.join(tmp, "bench.xlsx"), options.sheets, options.rows, 5)
+        print(f"{'engine':<12}{'styles':<8}{'time (s)':>10}{'document.xml (KiB)':>20}{'.docx (KiB)':>13}")
+        for engine in options.engine:
+            for named_styles in (False, True):
+                seconds, xml_size, size = measure(file_path, named_styles, engine, options.repeat)
+                print(f"{engine:<12}{'named' if named_styles else 'inline':<8}{seconds:>10.3f}"
+                      f"{xml_size / 1024:>20.0f}{size / 1024:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_utils import run_report  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+ARGS = {"ordering": "All", "total_position": "Top", "font_type": "Tahoma", "font_size": "9", "margin": "1.0",
+        "extra_columns_flag": True, "extra_columns": "5"}
+
+
+def measure(file_path: str, max_rows: int, max_cols: int, repeat: int) -> tuple[float, int, int, int]:
+    """
+    Generates the report repeat times with the given table size limits.
+    :return: Tuple of the fastest time, the number of tables, the number of page breaks and the size of
+        word/document.xml
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output_path = run_report(file_path, dict(ARGS, max_table_rows=max_rows, max_table_cols=max_cols))
+        times.append(time.perf_counter() - start)
+    with zipfile.ZipFile(output_path) as package:
+        xml = package.read("word/document.xml")
+    return min(times), xml.count(b"<w:tbl>"), xml.count(b'w:type="page"'), len(xml)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare reports of oversized sheets with tables split into "
+                                                 "continuation tables of different sizes.")
+    parser.add_argument("--sheets", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-rows", type=int, nargs="+", default=[0, 200, 40],
+                        help="Row limits to compare, 0 for no limit; the column limit is a fifth of each")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = build_workbook(os.path.join(tmp, "bench.xlsx"), options.sheets, options.rows, 5)
+        print(f"{options.sheets} sheets x {options.rows} rows")
+        print(f"{'max rows':>9}{'max cols':>9}{'time (s)':>10}{'tables':>8}{'page breaks':>13}"
+              f"{'document.xml (KiB)':>20}")
+        for max_rows in options.max_rows:
+            max_cols = max_rows // 5
+            seconds, tables, breaks, xml_size = measure(file_path, max_rows, max_cols, options.repeat)
+            print(f"{max_rows or '-':>9}{max_cols or '-':>9}{seconds:>10.3f}{tables:>8}{breaks:>13}"
+                  f"{xml_size / 1024:>20.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_utils import read_excel, get_question_data, read_workbook  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+
+def current_path(file_path: str, num_extra_cols: int):
+    """
+    The reading done by run_report before read_workbook: two full workbook loads.
+    """
+    return read_excel(file_path, True, num_extra_cols), get_question_data(file_path)
+
+
+def streaming_path(file_path: str, num_extra_cols: int):
+    """
+    The single read-only pass used by run_report.
+    """
+    return read_workbook(file_path, True, num_extra_cols)
+
+
+def measure(func, *func_args, repeat: int = 3) -> tuple[float, int, object]:
+    """
+    Times a reader and records its peak traced memory.
+    :return: Tuple of best wall time in seconds, peak memory in bytes and the reader's result
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*func_args)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(*func_args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the double-load reader with the streaming reader.")
+    parser.add_argument("--sheets", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--extra-cols", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = build_workbook(os.path.join(tmp, "bench.xlsx"), options.sheets, options.rows, options.extra_cols)
+        print(f"{options.sheets} sheets x {options.rows} rows x {options.extra_cols} extra columns, "
+              f"{os.path.getsize(file_path) / 1024:.0f} KiB")
+
+        old_time, old_peak, old_result = measure(current_path, file_path, options.extra_cols, repeat=options.repeat)
+        new_time, new_peak, new_result = measure(streaming_path, file_path, options.extra_cols, repeat=options.repeat)
+
+    assert old_result == new_result, "read_workbook output differs from read_excel/get_question_data"
+    print(f"{'reader':<28}{'time (s)':>10}{'peak (MiB)':>12}")
+    print(f"{'read_excel+get_question_data':<28}{old_time:>10.3f}{old_peak / 2 ** 20:>12.1f}")
+    print(f"{'read_workbook':<28}{new_time:>10.3f}{new_peak / 2 ** 20:>12.1f}")
+    print(f"speedup x{old_time / new_time:.2f}, peak memory x{old_peak / new_peak:.2f} smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import csv
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl  # noqa: E402
+from excel_utils import read_workbook  # noqa: E402
+from reader_utils import READERS  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+
+def export_csv(file_path: str, directory: str) -> str:
+    """
+    Saves every sheet of a workbook as a CSV file in a directory, in the layout CsvDirectoryReader reads.
+    :return: The directory
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    os.makedirs(directory)
+    for sheet_name in workbook.sheetnames:
+        with open(os.path.join(directory, f"{sheet_name}.csv"), "w", newline="", encoding="utf-8") as file:
+            csv.writer(file).writerows(["" if value is None else value for value in row]
+                                       for row in workbook[sheet_name].iter_rows(values_only=True))
+    workbook.close()
+    return directory
+
+
+def export_xls(file_path: str, xls_path: str) -> str | None:
+    """
+    Saves a workbook as a legacy .xls with xlwt, if it is installed.
+    :return: The .xls path, or None without xlwt
+    """
+    if importlib.util.find_spec("xlwt") is None:
+        return None
+    import xlwt
+    source = openpyxl.load_workbook(file_path, read_only=True)
+    book = xlwt.Workbook()
+    for sheet_name in source.sheetnames:
+        sheet = book.add_sheet(sheet_name)
+        for row_index, row in enumerate(source[sheet_name].iter_rows(values_only=True)):
+            for col_index, value in enumerate(row):
+                if value is not None:
+                    sheet.write(row_index, col_index, value)
+    source.close()
+    book.save(xls_path)
+    return xls_path
+
+
+def measure(file_path: str, reader: str, num_extra_cols: int, repeat: int) -> tuple[float, object]:
+    """
+    Reads the workbook with one backend.
+    :return: Tuple of the fastest time and the parsed workbook
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = read_workbook(file_path, True, num_extra_cols, reader)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time every workbook reader backend on the same synthetic "
+                                                 "workbook, saved as .xlsx, .xls and a directory of CSV files.")
+    parser.add_argument("--sheets", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--extra-cols", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xlsx_path = build_workbook(os.path.join(tmp, "bench.xlsx"), options.sheets, options.rows, options.extra_cols)
+        inputs = {
+            "xlsx": xlsx_path,
+            "openpyxl": xlsx_path,
+            "xls": export_xls(xlsx_path, os.path.join(tmp, "bench.xls")),
+            "csv": export_csv(xlsx_path, os.path.join(tmp, "bench"))
+        }
+        results = {}
+        for name, reader in READERS.items():
+            if inputs[name] is not None and reader.available():
+                results[name] = measure(inputs[name], name, options.extra_cols, options.repeat)
+
+    expected = results["openpyxl"][1]
+    print(f"{options.sheets} sheets x {options.rows} rows x {options.extra_cols} extra columns")
+    print(f"{'reader':<10}{'input':<8}{'time (s)':>10}{'vs openpyxl':>13}")
+    for name, reader in READERS.items():
+        if name not in results:
+            print(f"{name:<10}{'-':<8}  skipped, needs {reader.requires or 'xlwt'}")
+            continue
+        seconds, result = results[name]
+        assert result == expected, f"the {name} reader's sheets differ from openpyxl's"
+        kind = "dir" if name == "csv" else os.path.splitext(inputs[name])[1]
+        print(f"{name:<10}{kind:<8}{seconds:>10.3f}{'x%.2f' % (results['openpyxl'][0] / seconds):>13}")
+
+
+if __name__ == "__main__":
+    main()
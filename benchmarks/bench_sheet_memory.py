@@ -0,0 +1,73 @@
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_utils import read_workbook  # noqa: E402
+from helpers import SheetData  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+
+def as_plain(content: SheetData) -> dict[str, list]:
+    """
+    The sheet as it was held before SheetData: a dict of lists, with a string object per header and subset
+    and a Python list per value column.
+    """
+    def copy_text(item):
+        return item.encode().decode() if type(item) is str else item
+
+    return {
+        "headers": [copy_text(header) for header in content.headers],
+        "values": [list(column) for column in content.values],
+        "subsets": [copy_text(subset) for subset in content.subsets],
+        "header_kinds": list(content.header_kinds)
+    }
+
+
+def retained(build) -> tuple[int, object]:
+    """
+    Memory held by what build returns, as traced by tracemalloc.
+    :return: Tuple of the bytes allocated by build and still held once it returns, and its result.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the memory held by a parsed workbook, as SheetData and "
+                                                 "as the dicts of lists it replaced.")
+    parser.add_argument("--sheets", type=int, default=400)
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--extra-cols", type=int, default=5)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = build_workbook(os.path.join(tmp, "bench.xlsx"), options.sheets, options.rows, options.extra_cols)
+        start = time.perf_counter()
+        read_workbook(file_path, True, options.extra_cols)
+        seconds = time.perf_counter() - start
+        compact, data = retained(lambda: read_workbook(file_path, True, options.extra_cols)[0])
+
+    plain, _ = retained(lambda: {name: as_plain(content) for name, content in data.items()})
+    cells = sum(len(content.headers) * (len(content.values) + 1) for content in data.values())
+    print(f"{options.sheets} sheets x {options.rows} rows x {options.extra_cols} extra columns, {cells} cells, "
+          f"read in {seconds:.3f} s")
+    print(f"{'sheet model':<16}{'held (MiB)':>12}{'bytes/cell':>12}")
+    print(f"{'dict of lists':<16}{plain / 2 ** 20:>12.2f}{plain / cells:>12.1f}")
+    print(f"{'SheetData':<16}{compact / 2 ** 20:>12.2f}{compact / cells:>12.1f}")
+    print(f"x{plain / compact:.2f} smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What each entry point imports before it can do anything, as the code run in a fresh interpreter
+TARGETS = {
+    "gui": "import gui",
+    "cli": "import cli",
+    "service": "import service",
+    "pipeline": "import report_utils; report_utils.preload()",
+}
+# Libraries an entry point should only import when it needs them
+HEAVY = ("docx", "openpyxl", "lxml", "tkinter")
+
+
+def import_times(code: str) -> dict[str, tuple[int, int]]:
+    """
+    Runs code in a fresh interpreter under -X importtime.
+    :param code: Python code to run from the project root.
+    :return: Dictionary of module name to (cumulative microseconds, nesting depth), in import order.
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(cumulative), depth)
+    return modules
+
+
+def measure(code: str, startup: set[str], repeat: int) -> tuple[int, dict[str, int], set[str]]:
+    """
+    Measures the imports code triggers, leaving out those the interpreter makes on its own at startup.
+    :param code: Python code to run.
+    :param startup: Modules imported by an empty interpreter.
+    :param repeat: Runs; the fastest of each is kept.
+    :return: Tuple of the total microseconds, the cumulative microseconds of every module imported at the
+        top two levels, and the heavy libraries imported.
+    """
+    total, modules, heavy = None, {}, set()
+    for _ in range(repeat):
+        times = {name: time for name, time in import_times(code).items() if name not in startup}
+        run_total = sum(cumulative for cumulative, depth in times.values() if depth == 0)
+        total = run_total if total is None else min(total, run_total)
+        for name, (cumulative, depth) in times.items():
+            if depth <= 1:
+                modules[name] = min(modules.get(name, cumulative), cumulative)
+        heavy |= {name for name in times if name.split(".")[0] in HEAVY}
+    return total, modules, {name.split(".")[0] for name in heavy}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the import time of each entry point with -X importtime.")
+    parser.add_argument("--target", nargs="+", choices=TARGETS, default=list(TARGETS), help="Entry points to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per entry point; the fastest is kept")
+    parser.add_argument("--top", type=int, default=0, metavar="N", help="Also list the N slowest imports of each")
+    options = parser.parse_args()
+
+    # Warm the bytecode cache, so the first target doesn't pay for compiling the project
+    subprocess.run([sys.executable, "-m", "compileall", "-q", ROOT], check=True)
+    startup = set(import_times("pass"))
+    print(f"{'entry point':<12}{'import (ms)':>12}  heavy libraries")
+    for target in options.target:
+        total, modules, heavy = measure(TARGETS[target], startup, options.repeat)
+        print(f"{target:<12}{total / 1000:>12.1f}  {', '.join(sorted(heavy)) or '-'}")
+        for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:options.top]:
+            print(f"  {name:<40}{cumulative / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
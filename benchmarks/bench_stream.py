@@ -0,0 +1,58 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profile_utils import peak_rss  # noqa: E402
+from synthetic import build_workbook  # noqa: E402
+
+
+def run_child(file_path: str, streaming: bool) -> None:
+    """
+    Generates one report and prints its wall time and the process's peak RSS. Runs in a fresh process,
+    so the peak belongs to this report alone; most of the memory is lxml's, which tracemalloc can't see.
+    """
+    from report_utils import run_report
+
+    start = time.perf_counter()
+    run_report(file_path, {"ordering": "All", "total_position": "Top", "font_type": "Tahoma", "margin": "1.0",
+                           "extra_columns_flag": True, "extra_columns": "5", "streaming": streaming})
+    print(time.perf_counter() - start, peak_rss())
+
+
+def measure(file_path: str, streaming: bool) -> tuple[float, int]:
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", file_path] +
+                            (["--streaming"] if streaming else []),
+                            check=True, capture_output=True, text=True).stdout
+    elapsed, peak = output.split()
+    return float(elapsed), int(peak)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare peak memory of saving the whole document with streaming it.")
+    parser.add_argument("--sheets", type=int, nargs="+", default=[100, 400, 1600])
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--child", metavar="FILE", help=argparse.SUPPRESS)
+    parser.add_argument("--streaming", action="store_true", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        run_child(options.child, options.streaming)
+        return
+
+    print(f"{'sheets':>7}{'save (s)':>10}{'peak (MiB)':>12}{'stream (s)':>12}{'peak (MiB)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_sheets in options.sheets:
+            file_path = build_workbook(os.path.join(tmp, f"bench_{num_sheets}.xlsx"), num_sheets, options.rows, 5)
+            save_time, save_peak = measure(file_path, streaming=False)
+            stream_time, stream_peak = measure(file_path, streaming=True)
+            print(f"{num_sheets:>7}{save_time:>10.2f}{save_peak / 2 ** 20:>12.1f}"
+                  f"{stream_time:>12.2f}{stream_peak / 2 ** 20:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
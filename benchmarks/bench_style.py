@@ -0,0 +1,135 @@
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+from docx.enum.text import WD_UNDERLINE  # noqa: E402
+from docx.shared import Pt, Inches  # noqa: E402
+from lxml import etree  # noqa: E402
+from docx_utils import gen_vert_table, set_table_margin, remove_table_borders, style_table  # noqa: E402
+from helpers import SheetData  # noqa: E402
+from options import ReportOptions  # noqa: E402
+from xml_utils import build_vert_table  # noqa: E402
+
+OPTIONS = ReportOptions(total_position="Top", ordering="Vertical", header_side="Right", gridlines=False, font_size=9,
+                        font_type="Tahoma", text_type="All Caps", margin=1.0, table_engine="python-docx")
+
+
+def multi_pass_style_table(table, options: ReportOptions) -> None:
+    """
+    style_table as it was before the single-pass plan: one full walk over the table per styling concern.
+    """
+    args = {
+        "total_position": options.total_position, "ordering": options.ordering, "header_side": options.header_side,
+        "gridlines": options.gridlines, "font_size": options.font_size, "font_type": options.font_type,
+        "text_type": options.text_type, "margin": options.margin
+    }
+    if args["ordering"] == "Vertical":
+        for row in table.rows:
+            for i, cell in enumerate(row.cells):
+                if args["header_side"] == "Right" and i == 0:
+                    cell.width = Inches(args["margin"])
+                elif args["header_side"] == "Left" and i != 0:
+                    cell.width = Inches(args["margin"])
+        if args["header_side"] == "Left":
+            set_table_margin(table, args["margin"])
+    if not args["gridlines"]:
+        remove_table_borders(table)
+    if args["text_type"] == "All Caps":
+        for row in table.rows:
+            for cell in row.cells:
+                for paragraph in cell.paragraphs:
+                    paragraph.text = paragraph.text.upper()
+    if args["font_type"]:
+        for row in table.rows:
+            for cell in row.cells:
+                if cell.paragraphs and cell.paragraphs[0].runs:
+                    cell.paragraphs[0].runs[0].font.name = args["font_type"]
+                    cell.paragraphs[0].runs[0].font.size = Pt(args["font_size"])
+    for row in table.rows:
+        for i, cell in enumerate(row.cells):
+            for paragraph in cell.paragraphs:
+                if "total" in paragraph.text.lower():
+                    for run in paragraph.runs:
+                        if args["total_position"] == "Inline":
+                            run.bold = True
+                            run.underline = WD_UNDERLINE.SINGLE
+                        else:
+                            run.bold = True
+                            run.italic = True
+                            run.text = run.text.upper()
+
+                    connected_cell = row.cells[i - 1] \
+                        if (args["header_side"] == "Right" and args["ordering"] == "Vertical") else row.cells[i + 1]
+                    for connected_paragraph in connected_cell.paragraphs:
+                        for connected_run in connected_paragraph.runs:
+                            if args["total_position"] == "Inline":
+                                connected_run.bold = True
+                                connected_run.underline = WD_UNDERLINE.SINGLE
+                            else:
+                                connected_run.bold = True
+                                connected_run.italic = True
+                                connected_run.text = connected_run.text.upper()
+
+
+def synthetic_content(num_rows: int, num_cols: int) -> SheetData:
+    headers = [f"Answer {i}" if i % 25 else "Total" for i in range(num_rows)]
+    values = [[(i * 7 + col) % 100 if i % 13 else "--" for i in range(num_rows)] for col in range(num_cols)]
+    return SheetData(headers, values, [])
+
+
+def time_styling(content: SheetData, styler, repeat: int) -> tuple[float, bytes]:
+    """
+    Times only the styling of an already generated table.
+    """
+    best, xml = float("inf"), b""
+    for _ in range(repeat):
+        document = Document()
+        table = gen_vert_table(document, copy.deepcopy(content), OPTIONS)
+        start = time.perf_counter()
+        styler(table, OPTIONS)
+        best = min(best, time.perf_counter() - start)
+        xml = etree.tostring(table._tbl)
+    return best, xml
+
+
+def time_builder(content: SheetData, repeat: int) -> tuple[float, bytes]:
+    """
+    Times the table builder, which styles each cell as it is created, including generating the table.
+    """
+    best, xml = float("inf"), b""
+    for _ in range(repeat):
+        document = Document()
+        start = time.perf_counter()
+        table = build_vert_table(document, copy.deepcopy(content), OPTIONS)
+        best = min(best, time.perf_counter() - start)
+        xml = etree.tostring(table._tbl)
+    return best, xml
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time table styling on a large vertical table.")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--cols", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    content = synthetic_content(options.rows, options.cols)
+    multi_time, multi_xml = time_styling(content, multi_pass_style_table, options.repeat)
+    fused_time, fused_xml = time_styling(content, style_table, options.repeat)
+    build_time, build_xml = time_builder(content, options.repeat)
+    assert multi_xml == fused_xml == build_xml, "styled tables differ"
+
+    print(f"{options.rows} rows x {options.cols + 1} columns")
+    print(f"{'styling':<34}{'time (s)':>10}")
+    print(f"{'multi-pass style_table':<34}{multi_time:>10.3f}")
+    print(f"{'single-pass style_table':<34}{fused_time:>10.3f}")
+    print(f"{'build_vert_table (incl. creation)':<34}{build_time:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
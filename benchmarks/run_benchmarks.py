@@ -0,0 +1,187 @@
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import build_workbook  # noqa: E402
+
+ORDERINGS = ("Vertical", "Horizontal", "All")
+TOTAL_POSITIONS = ("Top", "Bottom", "Inline")
+# Stages shown in the results table and their column labels; --detail lists every recorded stage
+SHOWN_STAGES = {"load_workbook": "load", "read_sheet": "read", "render_sheet": "render", "save": "save"}
+SWEEPS = ("sheets", "rows", "extra_cols", "options")
+
+
+def case(sweep: str, sheets: int = 50, rows: int = 40, extra_cols: int = 3, ordering: str = "All",
+         total_position: str = "Top") -> dict:
+    """
+    One benchmark case: a synthetic workbook and the options it is reported with.
+    """
+    name = f"{sweep}:{sheets}s-{rows}r-{extra_cols}c-{ordering}-{total_position}"
+    return {"name": name, "sheets": sheets, "rows": rows, "extra_cols": extra_cols, "ordering": ordering,
+            "total_position": total_position}
+
+
+def build_cases(sweeps: list[str], quick: bool) -> list[dict]:
+    """
+    The cases of the requested sweeps. Each sweep varies one dimension around the default case; "options"
+    covers every ordering and total position.
+    :param sweeps: Sweep names, see SWEEPS.
+    :param quick: Use smaller workbooks, e.g. for a check before committing.
+    """
+    scale = 5 if quick else 1
+    cases = []
+    if "sheets" in sweeps:
+        cases += [case("sheets", sheets=sheets // scale) for sheets in (50, 200, 800)]
+    if "rows" in sweeps:
+        cases += [case("rows", sheets=20 // scale, rows=rows) for rows in (20, 200, 1000)]
+    if "extra_cols" in sweeps:
+        cases += [case("extra_cols", sheets=50 // scale, extra_cols=extra_cols) for extra_cols in (0, 5, 10)]
+    if "options" in sweeps:
+        cases += [case("options", sheets=50 // scale, ordering=ordering, total_position=total_position)
+                  for ordering, total_position in itertools.product(ORDERINGS, TOTAL_POSITIONS)]
+    return cases
+
+
+def run_child(spec: dict) -> None:
+    """
+    Generates one report with memory tracing on and prints the trace's summary as JSON. Runs in a fresh
+    process, so the peak memory belongs to this report alone.
+    """
+    from profile_utils import tracing
+    from report_utils import run_report
+
+    args = {"ordering": spec["ordering"], "total_position": spec["total_position"], "font_type": "Tahoma",
+            "font_size": "9", "text_type": "Title", "header_side": "Right", "margin": "1.0",
+            "extra_columns_flag": spec["extra_cols"] > 0, "extra_columns": str(spec["extra_cols"])}
+    trace_path = spec["workbook"] + ".trace.json"
+    with tracing(trace_path, memory=True):
+        run_report(spec["workbook"], args)
+    with open(trace_path, encoding="utf-8") as file:
+        print(json.dumps(json.load(file)["otherData"]))
+
+
+def measure(spec: dict, repeat: int) -> dict:
+    """
+    Runs a case repeat times, each in a new process, and keeps the fastest time of every stage and the
+    lowest peak memory.
+    :return: Dictionary of the stages (seconds and peak_rss_growth), counters and peak_rss_bytes.
+    """
+    result = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+                                check=True, capture_output=True, text=True).stdout
+        run = json.loads(output)
+        if result is None:
+            result = run
+            continue
+        for name, stage in run["stages"].items():
+            best = result["stages"].setdefault(name, stage)
+            best["seconds"] = min(best["seconds"], stage["seconds"])
+            best["peak_rss_growth"] = min(best.get("peak_rss_growth", 0), stage.get("peak_rss_growth", 0))
+        result["peak_rss_bytes"] = min(result["peak_rss_bytes"], run["peak_rss_bytes"])
+    return result
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list[str]:
+    """
+    Lists the cases whose total time or peak memory grew past the tolerance since the baseline.
+    :param results: Results of this run by case name.
+    :param baseline: Results of the baseline run by case name.
+    :param time_tolerance: Allowed relative slowdown, e.g. 0.15 for 15%.
+    :param memory_tolerance: Allowed relative growth of the peak memory.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        seconds, base_seconds = result["stages"]["report"]["seconds"], base["stages"]["report"]["seconds"]
+        if seconds > base_seconds * (1 + time_tolerance):
+            regressions.append(f"{name}: {base_seconds:.3f}s -> {seconds:.3f}s (+{seconds / base_seconds - 1:.0%})")
+        peak, base_peak = result["peak_rss_bytes"], base["peak_rss_bytes"]
+        if peak and base_peak and peak > base_peak * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak {base_peak / 2 ** 20:.1f} MiB -> {peak / 2 ** 20:.1f} MiB "
+                               f"(+{peak / base_peak - 1:.0%})")
+    return regressions
+
+
+def print_result(name: str, result: dict, base: dict | None, detail: bool) -> None:
+    """
+    Prints a case's row of the results table and, with detail, the time and peak memory growth of every
+    stage compared with the baseline.
+    """
+    stages = result["stages"]
+    seconds = stages["report"]["seconds"]
+    change = f"{seconds / base['stages']['report']['seconds'] - 1:>+8.0%}" if base else f"{'':>8}"
+    shown = "".join(f"{stages.get(stage, {}).get('seconds', 0.0):>12.3f}" for stage in SHOWN_STAGES)
+    print(f"{name:<40}{seconds:>10.3f}{change}{shown}{(result['peak_rss_bytes'] or 0) / 2 ** 20:>12.1f}", flush=True)
+    if not detail:
+        return
+    for stage_name, stage in stages.items():
+        base_stage = base["stages"].get(stage_name) if base else None
+        change = f"{stage['seconds'] / base_stage['seconds'] - 1:>+8.0%}" \
+            if base_stage and base_stage["seconds"] else f"{'':>8}"
+        print(f"  {stage_name:<22}{stage['calls']:>6} calls{stage['seconds']:>10.3f}s{change}"
+              f"{stage.get('peak_rss_growth', 0) / 2 ** 20:>10.1f} MiB peak growth")
+    for cache, rate in result.get("hit_rates", {}).items():
+        print(f"  {cache + ' hit rate':<28}{rate:>16.1%}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Time every report stage on synthetic workbooks and compare with a stored baseline."
+    )
+    parser.add_argument("--sweep", nargs="+", choices=SWEEPS, default=list(SWEEPS), help="Sweeps to run")
+    parser.add_argument("--quick", action="store_true", help="Smaller workbooks")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic workbooks")
+    parser.add_argument("--baseline", metavar="FILE", help="Results of an earlier run to compare against")
+    parser.add_argument("--save", metavar="FILE", help="Save the results, e.g. as the new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.15, help="Allowed slowdown (default 0.15)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10,
+                        help="Allowed peak memory growth (default 0.10)")
+    parser.add_argument("--detail", action="store_true", help="Show the time and memory of every stage")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        run_child(json.loads(options.child))
+        return 0
+
+    baseline = {}
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+
+    stage_header = "".join(f"{label + ' (s)':>12}" for label in SHOWN_STAGES.values())
+    print(f"{'case':<40}{'total (s)':>10}{'change':>8}{stage_header}{'peak (MiB)':>12}")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workbooks = {}
+        for spec in build_cases(options.sweep, options.quick):
+            shape = (spec["sheets"], spec["rows"], spec["extra_cols"])
+            if shape not in workbooks:
+                workbooks[shape] = build_workbook(os.path.join(tmp, "bench_{}_{}_{}.xlsx".format(*shape)),
+                                                  *shape, seed=options.seed)
+            result = measure(dict(spec, workbook=workbooks[shape]), options.repeat)
+            results[spec["name"]] = result
+            print_result(spec["name"], result, baseline.get(spec["name"]), options.detail)
+
+    if options.save:
+        with open(options.save, "w", encoding="utf-8") as file:
+            json.dump({"seed": options.seed, "repeat": options.repeat, "results": results}, file, indent=1)
+
+    regressions = compare(results, baseline, options.time_tolerance, options.memory_tolerance)
+    for regression in regressions:
+        print(f"[regression] {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
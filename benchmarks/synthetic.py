@@ -0,0 +1,64 @@
+import argparse
+import random
+import openpyxl
+
+ANSWERS = ["Very Satisfied", "Satisfied", "Neutral", "Dissatisfied", "Very Dissatisfied", "Don't Know"]
+SUBSETS = ["Male", "Female", "18-34", "35-54", "55+", "North", "South", "East", "West", "Urban", "Rural"]
+
+
+def build_workbook(path: str, num_sheets: int = 10, num_rows: int = 20, num_extra_cols: int = 3,
+                   seed: int = 0) -> str:
+    """
+    Writes a synthetic crosstab workbook in the layout read_excel and get_question_data expect.
+    Every sheet has a pre-data block, a "BASE=" marker, a subset header row, the numeric 1 start row
+    and then answer rows mixed with "Total" and "**D/S" rows.
+    :param path: Where to save the workbook
+    :param num_sheets: Number of sheets to generate
+    :param num_rows: Number of answer rows per sheet
+    :param num_extra_cols: Number of subset columns after column B
+    :param seed: Random seed so that runs are reproducible
+    :return: The path the workbook was written to
+    """
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    num_value_cols = 1 + num_extra_cols
+
+    for index in range(num_sheets):
+        sheet = workbook.create_sheet(f"Table {index + 1}")
+        sheet.append([f"Q{index + 1}. How satisfied are you with item {index + 1}?"])
+        sheet.append(["Among all respondents"])
+        sheet.append([None])
+        sheet.append(["BASE= All respondents"] + [rng.randint(200, 2000) for _ in range(num_value_cols)])
+        sheet.append([None, "(A)Total"] + [f"({chr(66 + col)}){SUBSETS[col % len(SUBSETS)]}"
+                                           for col in range(num_extra_cols)])
+        sheet.append([None] + list(range(1, num_value_cols + 1)))
+
+        headers = [ANSWERS[row % len(ANSWERS)] + ("" if row < len(ANSWERS) else f" {row}")
+                   for row in range(num_rows)]
+        headers.insert(rng.randint(0, len(headers)), "Total")
+        headers.insert(rng.randint(0, len(headers)), "**D/S")
+        for header in headers:
+            row = [header]
+            for _ in range(num_value_cols):
+                roll = rng.random()
+                row.append("--" if roll < 0.05 else "*" if roll < 0.1 else round(rng.random(), 4))
+            sheet.append(row)
+
+    workbook.save(path)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic crosstab workbook.")
+    parser.add_argument("path")
+    parser.add_argument("--sheets", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--extra-cols", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+    print(build_workbook(options.path, options.sheets, options.rows, options.extra_cols, options.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from contextlib import nullcontext
+from typing import BinaryIO, Iterator
+from docx import Document
+from docx_utils import render_sheet_fragment
+from excel_utils import open_workbook, read_sheet, requested_columns, select_sheets
+from options import DEFAULT_CACHE_DIR, ReportOptions  # noqa: F401
+from page_utils import paginate
+from profile_utils import count
+from progress_utils import expect_sheets, sheet_done
+from reader_utils import csv_sheets
+from stream_utils import save_fragments
+
+CACHE_VERSION = "4"
+
+
+def file_digest(file_path: str | BinaryIO) -> str:
+    """
+    Hashes a file's contents, so a cache entry is found again for a renamed or copied workbook
+    and never for an edited one. A directory read as a workbook is hashed from the names and contents of
+    its CSV files.
+    :param file_path: Path to the file, or to a directory of CSV files, or the workbook as a seekable binary
+        file (see reader_utils.workbook_file), which hashes the same as the file it was read from.
+    :return: Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    if not isinstance(file_path, str):
+        paths = {"": file_path}
+    else:
+        paths = csv_sheets(file_path) if os.path.isdir(file_path) else {"": file_path}
+    for name, path in paths.items():
+        digest.update(repr(name).encode())
+        with open(path, "rb") if isinstance(path, str) else nullcontext(path) as file:
+            position = file.tell()
+            file.seek(0)
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+            file.seek(position)
+    return digest.hexdigest()
+
+
+def cache_key(*parts) -> str:
+    """
+    Combines the parts that decide an entry's contents into one key.
+    :param parts: Values with a stable repr.
+    """
+    return hashlib.sha256(repr((CACHE_VERSION,) + parts).encode()).hexdigest()
+
+
+def parse_key(digest: str, sheet_name: str, options: ReportOptions) -> tuple:
+    """
+    What a sheet's parsed data depends on: the workbook contents, the sheet and the columns read.
+    :param digest: Workbook digest from file_digest.
+    :param sheet_name: Name of the sheet.
+    :param options: Report options.
+    """
+    return "sheet", digest, sheet_name, options.extra_columns_flag, options.extra_columns
+
+
+def render_key(digest: str, sheet_name: str, options: ReportOptions) -> tuple:
+    """
+    What a sheet's rendered XML depends on: its parsed data and the styling options. Options that don't
+    change the output are left out, and so is the sheet's position: page breaks are added around the
+    fragments (see page_utils.paginate), so a fragment is reused wherever the sheet lands.
+    :param digest: Workbook digest from file_digest.
+    :param sheet_name: Name of the sheet.
+    :param options: Report options.
+    """
+    return "table", parse_key(digest, sheet_name, options), options.rendering()
+
+
+class DiskCache:
+    """
+    Size-bounded store of pickled values in a directory, one file per key. A file's modification time is
+    refreshed on every hit, so evict() drops the least recently used entries first. Writes are atomic, so
+    several processes can share one cache.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        :param directory: Directory holding the cache files.
+        :param max_bytes: Size the cache is trimmed back to by evict().
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".pkl")
+
+    def get(self, key: str):
+        """
+        Returns the value stored under the key, or None.
+        :param key: Key from cache_key.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            count("cache_misses")
+            return None
+        self.hits += 1
+        count("cache_hits")
+        return value
+
+    def put(self, key: str, value) -> None:
+        """
+        Stores a value under the key.
+        :param key: Key from cache_key.
+        :param value: Picklable value.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".pkl"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def cached_fragments(file_path: str | BinaryIO, digest: str, options: ReportOptions,
+                     cache: DiskCache) -> Iterator[tuple[list[bytes], float]]:
+    """
+    Yields the rendered fragment and estimated height of each sheet in workbook order (see
+    docx_utils.render_sheet_fragment), from the cache where possible.
+    The workbook is opened on the first sheet that has to be read, and closed once all sheets are done.
+    :param file_path: Absolute path to the Excel file, or the workbook as a seekable binary file.
+    :param digest: Workbook digest from file_digest.
+    :param options: Report options.
+    :param cache: Cache the sheet names, parsed sheets and fragments are kept in.
+    """
+    workbook = None
+    try:
+        names_key = cache_key("sheet names", digest)
+        sheet_names = cache.get(names_key)
+        if sheet_names is None:
+            workbook = open_workbook(file_path, options.reader)
+            sheet_names = workbook.sheetnames
+            cache.put(names_key, sheet_names)
+        sheet_names = select_sheets(sheet_names, options.sheets)
+
+        expect_sheets(len(sheet_names))
+        columns = requested_columns(options.extra_columns_flag, options.extra_columns)
+        scratch = None
+        for sheet_name in sheet_names:
+            table_key = cache_key(*render_key(digest, sheet_name, options))
+            rendered = cache.get(table_key)
+            if rendered is None:
+                sheet_key = cache_key(*parse_key(digest, sheet_name, options))
+                parsed = cache.get(sheet_key)
+                if parsed is None:
+                    if workbook is None:
+                        workbook = open_workbook(file_path, options.reader)
+                    parsed = read_sheet(workbook, sheet_name, columns, options.extra_columns_flag)
+                    cache.put(sheet_key, parsed)
+                content, pre_data = parsed
+                if scratch is None:
+                    scratch = Document()
+                rendered = render_sheet_fragment(scratch, sheet_name, content, pre_data, options)
+                cache.put(table_key, rendered)
+            sheet_done(sheet_name)
+            yield rendered
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+
+def write_doc_cached(file_path: str | BinaryIO, output_path: str | BinaryIO, options: ReportOptions) -> None:
+    """
+    Generates the report like write_doc, reusing cached work: a sheet whose data and styling are unchanged
+    is copied from the cache as rendered XML, a sheet whose styling changed is re-rendered from its cached
+    parse, and only sheets of a new or edited workbook are read. The workbook isn't opened at all when
+    every sheet is cached.
+    :param file_path: Absolute path to the Excel file, or the workbook as a seekable binary file.
+    :param output_path: Path to save the generated Word document, or a writable binary stream.
+    :param options: Report options; cache_dir and cache_size_mb locate and bound the cache.
+    """
+    cache = DiskCache(options.cache_dir, options.cache_size_mb * 1024 * 1024)
+    save_fragments(paginate(cached_fragments(file_path, file_digest(file_path), options, cache)), output_path,
+                   options)
+    cache.evict()
@@ -0,0 +1,199 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import traceback
+from options import DEFAULT_CACHE_DIR, FORMATS, READERS, WORKBOOK_EXTENSIONS
+from reader_utils import csv_sheets
+from report_utils import run_report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser. The options and defaults mirror the GUI.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate Word table reports from Excel workbooks without the GUI."
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="Excel files, directories of Excel files or glob patterns (e.g. 'drops/*.xlsx'); "
+                             "a directory holding .csv files is also read as a workbook, one sheet per file")
+    parser.add_argument("--recursive", action="store_true", help="Also search subdirectories of directory inputs")
+    parser.add_argument("--font-type", default="Tahoma")
+    parser.add_argument("--font-size", default="9")
+    parser.add_argument("--total-position", choices=["Top", "Bottom", "Inline"], default="Top")
+    parser.add_argument("--text-type", choices=["Title", "All Caps"], default="Title")
+    parser.add_argument("--header-side", choices=["Right", "Left"], default="Right")
+    parser.add_argument("--ordering", choices=["Vertical", "Horizontal", "All"], default="Vertical")
+    parser.add_argument("--margin", default="1.0")
+    parser.add_argument("--gridlines", action="store_true", help="Keep table gridlines")
+    parser.add_argument("--max-rows", type=int, default=0, metavar="N",
+                        help="Split vertical tables into continuation tables of at most N rows")
+    parser.add_argument("--max-cols", type=int, default=0, metavar="N",
+                        help="Split horizontal tables into continuation tables of at most N columns")
+    parser.add_argument("--subsets", type=int, metavar="N",
+                        help="Read N subset columns after the values column")
+    parser.add_argument("--table-engine", choices=["XML", "python-docx"], default="XML")
+    parser.add_argument("--named-styles", action="store_true",
+                        help="Format cells through named styles defined once per report, for smaller documents")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes used inside each report")
+    parser.add_argument("--cache", nargs="?", const=DEFAULT_CACHE_DIR, default="", metavar="DIR",
+                        help=f"Reuse parsed sheets and rendered tables from earlier runs (default DIR: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=512, metavar="MB", help="Size limit of the cache")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update existing reports, re-rendering only the sheets that changed")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write each sheet to the report as it is rendered, keeping memory flat for huge workbooks")
+    parser.add_argument("--trace", action="store_true",
+                        help="Write the time spent per stage and sheet to a JSON trace next to each report")
+    parser.add_argument("--profile", action="store_true", help="Write cProfile statistics next to each report")
+    parser.add_argument("--format", nargs="+", choices=list(FORMATS), default=["docx"], dest="formats",
+                        help="Output formats, all written from one read of the workbook (default: docx)")
+    parser.add_argument("--sheets", nargs="+", default=[], metavar="PATTERN",
+                        help="Only report these sheets: names, globs ('Q1*'), regular expressions ('re:^Banner') "
+                             "or position ranges ('#1-5', '#10-'); the others are never parsed")
+    parser.add_argument("--reader", choices=["auto", *READERS], default="auto",
+                        help="Workbook reader backend (default: the fastest installed one that reads the input)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Number of workbooks processed at the same time")
+    return parser
+
+
+def args_from_options(options: argparse.Namespace) -> dict[str, str]:
+    """
+    Converts parsed command-line options into the args dictionary the GUI passes to run_report.
+    :param options: Parsed command-line options.
+    """
+    return {
+        "total_position": options.total_position,
+        "font_type": options.font_type,
+        "font_size": options.font_size,
+        "text_type": options.text_type,
+        "header_side": options.header_side,
+        "ordering": options.ordering,
+        "gridlines": options.gridlines,
+        "margin": options.margin,
+        "max_table_rows": str(options.max_rows),
+        "max_table_cols": str(options.max_cols),
+        "extra_columns_flag": options.subsets is not None,
+        "extra_columns": str(options.subsets or 0),
+        "table_engine": options.table_engine,
+        "named_styles": options.named_styles,
+        "workers": str(options.workers),
+        "cache_dir": options.cache,
+        "cache_size_mb": str(options.cache_size),
+        "incremental": options.incremental,
+        "streaming": options.stream,
+        "trace": options.trace,
+        "profile": options.profile,
+        "formats": options.formats,
+        "reader": options.reader,
+        "sheets": options.sheets
+    }
+
+
+def collect_inputs(inputs: list[str], recursive: bool = False) -> list[str]:
+    """
+    Expands files, directories and glob patterns into a sorted list of Excel files and of directories of
+    CSV files, which are read as workbooks.
+    :param inputs: Paths or glob patterns from the command line.
+    :param recursive: Whether directories are searched recursively.
+    """
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            if csv_sheets(item):
+                files.add(os.path.abspath(item))
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            matches = glob.glob(pattern, recursive=recursive)
+        else:
+            matches = glob.glob(item, recursive=recursive) or [item]
+        for match in matches:
+            # Skip Office lock files and anything that isn't a workbook
+            if match.lower().endswith(WORKBOOK_EXTENSIONS) and not os.path.basename(match).startswith("~$"):
+                files.add(os.path.abspath(match))
+            elif os.path.isdir(match) and match != item and (recursive or not os.path.isdir(item)) \
+                    and csv_sheets(match):
+                files.add(os.path.abspath(match))
+            elif match == item and not os.path.isdir(item):
+                files.add(os.path.abspath(match))
+    return sorted(files)
+
+
+def process_file(file_path: str, args: dict[str, str]) -> tuple[str, str | None, float, str | None]:
+    """
+    Runs one report, catching any failure so the rest of the batch carries on.
+    :param file_path: Absolute path to the Excel file.
+    :param args: Dictionary containing report options.
+    :return: Tuple of the input path, the output path, seconds taken and the error (None on success).
+    """
+    start = time.perf_counter()
+    try:
+        output_path = run_report(file_path, args)
+        return file_path, output_path, time.perf_counter() - start, None
+    except Exception:
+        return file_path, None, time.perf_counter() - start, traceback.format_exc(limit=-3)
+
+
+def run_batch(files: list[str], args: dict[str, str], jobs: int) -> list[tuple[str, str | None, float, str | None]]:
+    """
+    Generates a report for every file with a bounded pool of worker processes, printing each result as
+    it finishes.
+    :param files: Excel files to process.
+    :param args: Dictionary containing report options.
+    :param jobs: Maximum number of reports generated at the same time.
+    :return: One result tuple per file, as returned by process_file, in completion order.
+    """
+    results = []
+    if jobs <= 1 or len(files) <= 1:
+        for file_path in files:
+            result = process_file(file_path, args)
+            report_result(result)
+            results.append(result)
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=min(jobs, len(files))) as executor:
+        futures = [executor.submit(process_file, file_path, args) for file_path in files]
+        for future in as_completed(futures):
+            result = future.result()
+            report_result(result)
+            results.append(result)
+    return results
+
+
+def report_result(result: tuple[str, str | None, float, str | None]) -> None:
+    """
+    Prints the outcome and timing of one report.
+    :param result: Result tuple from process_file.
+    """
+    file_path, output_path, seconds, error = result
+    if error is None:
+        print(f"[ok]     {seconds:8.2f}s  {file_path} -> {output_path}", flush=True)
+    else:
+        print(f"[failed] {seconds:8.2f}s  {file_path}\n{error}", file=sys.stderr, flush=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Entry point for headless report generation.
+    :param argv: Command-line arguments, defaults to sys.argv[1:].
+    :return: Exit status, 1 if any report failed.
+    """
+    options = build_parser().parse_args(argv)
+    files = collect_inputs(options.inputs, options.recursive)
+    if not files:
+        print("No Excel files found", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    results = run_batch(files, args_from_options(options), options.jobs)
+    failures = [result for result in results if result[3] is not None]
+    print(f"{len(results) - len(failures)} of {len(results)} reports written in "
+          f"{time.perf_counter() - start:.2f}s, {len(failures)} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
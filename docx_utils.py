@@ -1,30 +1,24 @@
+from typing import BinaryIO, Iterable
+from lxml import etree
 from docx import Document
-from docx.shared import Pt, Inches
+from docx.shared import Inches
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT, WD_UNDERLINE
 from docx.oxml import parse_xml
-from docx.oxml.ns import nsdecls
-from helpers import add_percentages_to_values, move_totals
-
-ARGS = {}
-
-
-def initialize_args(args: dict[str, str]) -> None:
-    """
-    Initializes the global ARGS dictionary with values from the provided args.
-    :param args: Dictionary containing report options.
-    """
-    global ARGS
-    ARGS = {
-        "total_position": args.get("total_position", ""),
-        "ordering": args.get("ordering", ""),
-        "header_side": args.get("header_side", ""),
-        "gridlines": args.get("gridlines", False),
-        "font_size": int(args.get("font_size", 12)),
-        "font_type": args.get("font_type", ""),
-        "text_type": args.get("text_type", ""),
-        "margin": float(args.get("margin", "")),
-        "extra_cols": args.get("extra_columns_flag", False)
-    }
+from docx.oxml.ns import nsdecls, qn
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from helpers import SheetData, format_percentages, mentions_total, order_totals
+from options import ReportOptions
+from page_utils import Paginator, sheet_height, table_chunks
+from profile_utils import count, span
+from progress_utils import sheet_done
+from xml_utils import (add_report_styles, build_vert_table, build_horiz_table, cell_cache, horiz_table_cells,
+                       run_properties_xml, style_plan, total_cells, total_marks, vert_table_cells)
+
+W_T = qn("w:t")
+W_R = qn("w:r")
+W_PPR = qn("w:pPr")
+PLAIN_RUN_TAGS = {W_T, qn("w:tab"), qn("w:br")}
 
 
 # Thanks Copilot <3
@@ -72,81 +66,145 @@ def set_table_margin(table, margin: Inches) -> None:
     tbl_pr.append(parse_xml(tbl_ind_xml))
 
 
-def style_table(table) -> None:
+def style_total_run(run, plan: dict) -> None:
     """
-    Styles the table based on the provided arguments.
-    :param table: The table to be styled.
+    Styles a run belonging to a total row, bold plus underlined (inline totals) or italic capitals.
+    :param run: The run object from python-docx.
+    :param plan: Style plan from style_plan.
     """
+    run.bold = True
+    if plan["total_underline"]:
+        run.underline = WD_UNDERLINE.SINGLE
+    if plan["total_italic"]:
+        run.italic = True
+    if plan["total_upper"]:
+        run.text = run.text.upper()
 
-    # Styles Margin
-    if ARGS["ordering"] == "Vertical":
-        for row in table.rows:
-            for i, cell in enumerate(row.cells):
-                if ARGS["header_side"] == "Right" and i == 0:
-                    cell.width = Inches(ARGS["margin"])
-                elif ARGS["header_side"] == "Left" and i != 0:
-                    cell.width = Inches(ARGS["margin"])
 
-        if ARGS["header_side"] == "Left":
-            set_table_margin(table, ARGS["margin"])
+def is_plain_run(r) -> bool:
+    """
+    Checks that a run has no formatting and holds nothing but text, tabs and line breaks, so its
+    properties and text can be rewritten in place.
+    :param r: The <w:r> element.
+    """
+    previous = None
+    for child in r:
+        if child.tag not in PLAIN_RUN_TAGS or (child.tag == previous == W_T):
+            return False
+        previous = child.tag
+    return True
 
-    # Determines gridlines visibility
-    if not ARGS["gridlines"]:
-        remove_table_borders(table)
 
-    # Styles text to be all caps
-    if ARGS["text_type"] == "All Caps":
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    paragraph.text = paragraph.text.upper()
-
-    # Styles font with size and type
-    if ARGS["font_type"]:
-        for row in table.rows:
-            for cell in row.cells:
-                if cell.paragraphs and cell.paragraphs[0].runs:
-                    cell.paragraphs[0].runs[0].font.name = ARGS["font_type"]
-                    cell.paragraphs[0].runs[0].font.size = Pt(ARGS["font_size"])
-
-    # Styles text depending on specific total positions which determine underlined/italicized/etc.
-    for row in table.rows:
-        for i, cell in enumerate(row.cells):
-            for paragraph in cell.paragraphs:
-                if "total" in paragraph.text.lower():
-                    for run in paragraph.runs:
-                        if ARGS["total_position"] == "Inline":
-                            run.bold = True
-                            run.underline = WD_UNDERLINE.SINGLE
-                        else:
-                            run.bold = True
-                            run.italic = True
-                            run.text = run.text.upper()
+def paragraph_text(p) -> str:
+    """
+    Reads the text of a paragraph the same way p.text does, walking plain runs directly instead of
+    running python-docx's xpath query.
+    :param p: The <w:p> element.
+    """
+    parts = []
+    for child in p:
+        if child.tag == W_R and is_plain_run(child):
+            parts.extend(str(element) for element in child)
+        elif child.tag != W_PPR:
+            return p.text
+    return "".join(parts)
 
-                    connected_cell = row.cells[i - 1] \
-                        if (ARGS["header_side"] == "Right" and ARGS["ordering"] == "Vertical") else row.cells[i + 1]
-                    for connected_paragraph in connected_cell.paragraphs:
-                        for connected_run in connected_paragraph.runs:
-                            if ARGS["total_position"] == "Inline":
-                                connected_run.bold = True
-                                connected_run.underline = WD_UNDERLINE.SINGLE
-                            else:
-                                connected_run.bold = True
-                                connected_run.italic = True
-                                connected_run.text = connected_run.text.upper()
 
+def style_table(table, options: ReportOptions, mentions: list[list[int]] | None = None) -> None:
+    """
+    Styles the table based on the provided options.
+    The styling is compiled once into a plan and applied in a single pass over the cells of each row.
+    :param table: The table to be styled.
+    :param options: Report options; options.ordering is the layout of the table ("Vertical" or "Horizontal").
+    :param mentions: For a table generated from a sheet, the total mentions of the cells of each row, from
+        xml_utils.total_cells. Without it every paragraph's text is searched.
+    """
+    plan = style_plan(options)
+    run_properties = {}
+    # Parsed run properties are shared by every table of the document and cloned into each run
+    cells = cell_cache(table.part)
+    hits, misses = cells.hits, cells.misses
+
+    # Explicit margin when the headers are on the left of a vertical table
+    if plan["table_indent"] is not None:
+        set_table_margin(table, plan["table_indent"])
+
+    # Determines gridlines visibility
+    if plan["remove_borders"]:
+        remove_table_borders(table)
+    elif plan["table_style"] != "TableGrid":
+        table._tbl.tblPr.style = plan["table_style"]
+
+    for row_index, tr in enumerate(table._tbl.tr_lst):
+        tcs = tr.tc_lst
+        # Totals, and the cells connected to them, are underlined/italicized/etc. depending on the position
+        if mentions is not None:
+            totals = total_marks([[mention] for mention in mentions[row_index]], plan)
+        else:
+            texts = [[paragraph_text(p) for p in tc.p_lst] for tc in tcs]
+            totals = total_marks([[mentions_total(text, plan["caps"]) for text in paragraphs] for paragraphs in texts],
+                                 plan)
+
+        for i, tc in enumerate(tcs):
+            if (plan["margin_first"] and i == 0) or (plan["margin_rest"] and i != 0):
+                tc.width = plan["margin"]
+
+            for n, p in enumerate(tc.p_lst):
+                runs = p.r_lst
+                if plan["caps"]:
+                    # Same as paragraph.text = paragraph.text.upper() for an unformatted single run
+                    if not runs:
+                        runs = [p.add_r()]
+                    elif len(runs) == 1 and len(p) == len(runs) + (p.pPr is not None) and is_plain_run(runs[0]):
+                        for t in runs[0].iterchildren(W_T):
+                            t.text = t.text.upper()
+                    else:
+                        paragraph = Paragraph(p, table)
+                        paragraph.text = paragraph.text.upper()
+                        runs = p.r_lst
+
+                for k, r in enumerate(runs):
+                    font = bool(plan["font_name"]) and n == 0 and k == 0
+                    total = (i, n) in totals or (i, None) in totals
+                    if not (font or total):
+                        continue
+                    if r.rPr is None and is_plain_run(r):
+                        key = (font, total)
+                        if key not in run_properties:
+                            run_properties[key] = run_properties_xml(plan, font, total)
+                        r.insert(0, cells.run_properties(run_properties[key]))
+                        if total and plan["total_upper"]:
+                            for t in r.iterchildren(W_T):
+                                t.text = t.text.upper()
+                        continue
+
+                    run = Run(r, Paragraph(p, table))
+                    if plan["named_styles"]:
+                        style = plan["run_styles"][(font, total)]
+                        if style:
+                            r.get_or_add_rPr().style = style
+                        if total and plan["total_upper"]:
+                            run.text = run.text.upper()
+                        continue
+                    if font:
+                        run.font.name = plan["font_name"]
+                        run.font.size = plan["font_size"]
+                    if total:
+                        style_total_run(run, plan)
+
+    cells.counted(hits, misses)
     return table
 
 
-def populate_subset_row(table, subsets, header_side):
+def populate_subset_row(table, subsets, options: ReportOptions):
     """
-    Populates a row in the table with subsets based on the header_side.
+    Populates a row in the table with subsets based on the header side.
     :param table: The table object from python-docx.
     :param subsets: List of subsets to populate the row.
-    :param header_side: Determines whether 'Subsets' is placed on the left or right.
+    :param options: Report options; options.header_side determines whether 'Subsets' is placed on the left or right.
     """
     row = table.add_row()
-    if header_side == "Right":
+    if options.header_side == "Right":
         for col, subset in enumerate(subsets[1:]):
             subset_cell = row.cells[col]
             subset_cell.text = subset
@@ -155,7 +213,7 @@ def populate_subset_row(table, subsets, header_side):
         subset_cell = row.cells[len(subsets) - 1]
         subset_cell.text = subsets[0]
         subset_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-    elif header_side == "Left":
+    elif options.header_side == "Left":
         subset_cell = row.cells[0]
         subset_cell.text = subsets[0]
         subset_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
@@ -166,115 +224,238 @@ def populate_subset_row(table, subsets, header_side):
             subset_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
 
-def gen_vert_table(document: Document, content: dict[str, list[str]]):
+def gen_vert_table(document: Document, content: SheetData, options: ReportOptions):
     """
-    Generates a vertical table in a Word document based on the provided content and styles it according to ARGS.
+    Generates a vertical table in a Word document based on the provided content, laid out according to options.
 
     :param document: The Word document object where the table will be added.
-    :param content: A dictionary containing "headers" and "values" as keys with their respective lists.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
     :return: The generated and styled vertical table object.
     """
-    num_cols = 2 + len(content.get("values")) - 1
+    num_cols = 2 + len(content.values) - 1
     table = document.add_table(rows=0, cols=num_cols)
     table.style = 'Table Grid'
-    if content["subsets"]:
-        populate_subset_row(table, content["subsets"], ARGS["header_side"])
-    for header, values in zip(content["headers"], zip(*content["values"])):
+    if content.subsets:
+        populate_subset_row(table, content.subsets, options)
+    for header, values in zip(content.headers, zip(*map(format_percentages, content.values))):
         row = table.add_row()
-        if ARGS["header_side"] == "Right":
+        if options.header_side == "Right":
             for col, value in enumerate(values):
                 value_cell = row.cells[col]
-                value_cell.text = add_percentages_to_values(value)
+                value_cell.text = value
                 value_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
             row.cells[num_cols - 1].text = str(header) if header is not None else ""
         else:
             for col, value in enumerate(values):
                 value_cell = row.cells[col + 1]
-                value_cell.text = add_percentages_to_values(value)
+                value_cell.text = value
                 value_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
             row.cells[0].text = str(header) if header is not None else ""
 
     return table
 
 
-def gen_horiz_table(document: Document, content: dict[str, list[str]]):
+def gen_horiz_table(document: Document, content: SheetData):
     """
     Generates a horizontal table in a Word document based on the provided content.
 
     :param document: The Word document object where the table will be added.
-    :param content: A dictionary containing "headers" and "values" as keys with their respective lists.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
     :return: The generated horizontal table object.
     """
-    num_cols = len(content["headers"]) + (1 if content["subsets"] else 0)
-    num_rows = 2 + len(content.get("values")) - 1
+    num_cols = len(content.headers) + (1 if content.subsets else 0)
+    num_rows = 2 + len(content.values) - 1
     table = document.add_table(rows=num_rows, cols=num_cols)
     table.style = 'Table Grid'
-    for col, header in enumerate(content["headers"]):
+    for col, header in enumerate(content.headers):
         table.cell(0, col).text = str(header) if header is not None else "  "
-    for row, values in enumerate(content["values"]):
+    for row, values in enumerate(map(format_percentages, content.values)):
         for col, value in enumerate(values):
             value_cell = table.cell(row+1, col)
-            value_cell.text = add_percentages_to_values(value)
+            value_cell.text = value
             value_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
     return table
 
 
-def write_doc(data: dict[str, dict[str, list[str]]], pre_data: list[list[str]], output_path: str,
-              args: dict[str, str]) -> None:
+def add_vert_table(document: Document, content: SheetData, options: ReportOptions) -> None:
     """
-    Writes dictionaries of headers and values into tables in a .docx file.
-    :param data: Dictionary with sheet names as keys and dictionaries of headers and values as values.
-    :param pre_data: List of pre-data content associated with each sheet.
-    :param output_path: Path to save the generated Word document.
-    :param args: Dictionary containing report options such as total position, font type, font size, ordering, etc.
+    Adds a styled vertical table using the table engine chosen in the options.
+    :param document: The Word document object where the table will be added.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
     """
-    initialize_args(args)
+    count("tables")
+    count("table_cells", (len(content.headers) + bool(content.subsets)) * (len(content.values) + 1))
+    if options.table_engine == "python-docx":
+        with span("gen_vert_table"):
+            table = gen_vert_table(document, content, options)
+        with span("style_table"):
+            vertical = options.with_ordering("Vertical")
+            rows = vert_table_cells(content, options.header_side, style_plan(vertical)["caps"])
+            style_table(table, vertical, total_cells(rows))
+    else:
+        with span("build_vert_table"):
+            build_vert_table(document, content, options)
 
-    document = Document()
-    i = 0
 
-    for sheet_name, content in data.items():
+def add_horiz_table(document: Document, content: SheetData, options: ReportOptions) -> None:
+    """
+    Adds a styled horizontal table, with its subset column, using the table engine chosen in the options.
+    :param document: The Word document object where the table will be added.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
+    """
+    count("tables")
+    count("table_cells", (len(content.values) + 1) * (len(content.headers) + bool(content.subsets)))
+    if options.table_engine == "python-docx":
+        with span("gen_horiz_table"):
+            table = gen_horiz_table(document, content)
+        with span("style_table"):
+            horizontal = options.with_ordering("Horizontal")
+            style_table(table, horizontal, total_cells(horiz_table_cells(content, style_plan(horizontal)["caps"])))
+        if content.subsets:
+            for j, subset in enumerate(content.subsets):
+                subset_cell = table.cell(j, len(table.rows[0].cells) - 1)
+                subset_cell.text = subset
+                subset_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    else:
+        with span("build_horiz_table"):
+            build_horiz_table(document, content, options)
+
+
+def add_vert_tables(document: Document, content: SheetData, options: ReportOptions) -> None:
+    """
+    Adds the vertical table, split into continuation tables of at most options.max_table_rows rows that each
+    repeat the subset row. An empty paragraph separates them, so Word doesn't join them back together.
+    :param document: The Word document object where the tables will be added.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
+    """
+    for i, chunk in enumerate(table_chunks(content, options.max_table_rows)):
+        if i:
+            document.add_paragraph()
+        add_vert_table(document, chunk, options)
+
+
+def add_horiz_tables(document: Document, content: SheetData, options: ReportOptions) -> None:
+    """
+    Adds the horizontal table, split into continuation tables of at most options.max_table_cols columns that
+    each repeat the subset column, like add_vert_tables.
+    :param document: The Word document object where the tables will be added.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
+    """
+    for i, chunk in enumerate(table_chunks(content, options.max_table_cols)):
+        if i:
+            document.add_paragraph()
+        add_horiz_table(document, chunk, options)
+
+
+def render_sheet(document: Document, sheet_name: str, content: SheetData, pre_data: list[str],
+                 page_break: bool, options: ReportOptions) -> None:
+    """
+    Adds one sheet to the document: a page break if it starts a new page, then its heading, pre-data
+    paragraphs and table(s).
+    :param document: The Word document object the sheet is added to.
+    :param sheet_name: Name of the sheet, used as the heading.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param pre_data: Pre-data content of the sheet.
+    :param page_break: Whether the sheet starts a new page, from page_utils.Paginator.
+    :param options: Report options.
+    """
+    with span("render_sheet", sheet=sheet_name):
+        if page_break:
+            document.add_page_break()
         document.add_heading(sheet_name, level=1)
-        for question_data in pre_data[i]:
+        for question_data in pre_data:
             document.add_paragraph(question_data)
-        if ARGS["total_position"] == "Bottom":
-            content["headers"], content["values"] = move_totals(content["headers"], content["values"], "Bottom")
-        elif ARGS["total_position"] == "Top":
-            content["headers"], content["values"] = move_totals(content["headers"], content["values"], "Top")
-
-        if ARGS["ordering"] == "Vertical":
-            table = gen_vert_table(document, content)
-            style_table(table)
-        elif ARGS["ordering"] == "Horizontal":
-            table = gen_horiz_table(document, content)
-            style_table(table)
-            if content["subsets"]:
-                for j, subset in enumerate(content["subsets"]):
-                    subset_cell = table.cell(j, len(table.rows[0].cells) - 1)
-                    subset_cell.text = subset
-                    subset_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+        if options.total_position == "Bottom":
+            order_totals(content, "Bottom")
+        elif options.total_position == "Top":
+            order_totals(content, "Top")
+
+        if options.ordering == "Vertical":
+            add_vert_tables(document, content, options)
+        elif options.ordering == "Horizontal":
+            add_horiz_tables(document, content, options)
         else:
-            table_v = gen_vert_table(document, content)
-            ARGS["ordering"] = "Vertical"
-            style_table(table_v)
+            add_vert_tables(document, content, options)
             document.add_paragraph("\n")
-            if ARGS["total_position"] != "Inline":
-                content["headers"], content["values"] = move_totals(content["headers"], content["values"], "Top")
-            table_h = gen_horiz_table(document, content)
-            ARGS["ordering"] = "Horizontal"
-            style_table(table_h)
-            if content["subsets"]:
-                for j, subset in enumerate(content["subsets"]):
-                    subset_cell = table_h.cell(j, len(table_h.rows[0].cells) - 1)
-                    subset_cell.text = subset
-                    subset_cell.paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            document.add_page_break()
-            ARGS["ordering"] = "Both"
+            if options.total_position != "Inline":
+                order_totals(content, "Top")
+            add_horiz_tables(document, content, options)
+
+
+def render_sheet_fragment(document: Document, sheet_name: str, content: SheetData,
+                          pre_data: list[str], options: ReportOptions) -> tuple[list[bytes], float]:
+    """
+    Renders one sheet into a scratch document and returns the serialized body elements it produced.
+    The scratch document is left empty again so it can be reused for the next sheet. The fragment has no
+    page break, since where breaks go depends on the sheets before it; page_utils.paginate adds them.
+    :param document: Empty scratch document made with Document().
+    :return: Tuple of the XML of the sheet's body elements in document order, ready for splice_fragments,
+        and the sheet's estimated height from page_utils.sheet_height.
+    """
+    height = sheet_height(sheet_name, content, pre_data, options)
+    render_sheet(document, sheet_name, content, pre_data, False, options)
+    body = document.element.body
+    fragment = []
+    for child in list(body):
+        if child.tag != qn("w:sectPr"):
+            fragment.append(etree.tostring(child))
+            body.remove(child)
+    return fragment, height
+
+
+def splice_fragments(document: Document, fragments: Iterable[list[bytes]]) -> None:
+    """
+    Appends sheet fragments made by render_sheet_fragment to the document body, in the order given.
+    :param document: The Word document object the fragments are added to.
+    :param fragments: One list of serialized body elements per sheet.
+    """
+    body = document.element.body
+    sect_pr = body.sectPr
+    for fragment in fragments:
+        for xml in fragment:
+            element = parse_xml(xml)
+            if sect_pr is not None:
+                sect_pr.addprevious(element)
+            else:
+                body.append(element)
+
+
+def write_doc(data: dict[str, SheetData], pre_data: list[list[str]], output_path: str,
+              options: ReportOptions) -> None:
+    """
+    Writes the parsed sheets into tables in a .docx file.
+    :param data: Dictionary with sheet names as keys and their parsed data (see helpers.SheetData) as values.
+    :param pre_data: List of pre-data content associated with each sheet.
+    :param output_path: Path to save the generated Word document.
+    :param options: Report options such as total position, font type, font size, ordering, etc.
+    """
+    write_sheets(((sheet_name, content, pre_data[i]) for i, (sheet_name, content) in enumerate(data.items())),
+                 output_path, options)
+
+
+def write_sheets(sheets: Iterable[tuple[str, SheetData, list[str]]], output_path: str | BinaryIO,
+                 options: ReportOptions) -> None:
+    """
+    Writes the report like write_doc, from sheets that may be read one at a time (excel_utils.iter_workbook),
+    so each sheet is rendered as soon as it is read and its progress is reported.
+    :param sheets: Sheet name, data and pre-data of each sheet, in workbook order.
+    :param output_path: Path to save the generated Word document, or a writable binary stream.
+    :param options: Report options.
+    """
+    document = Document()
+    add_report_styles(document, options)
 
-        i += 1
-        if ARGS["ordering"] == "Vertical" or ARGS["ordering"] == "Horizontal":
-            if i % 2 == 0:
-                document.add_page_break()
+    paginator = Paginator()
+    for sheet_name, content, pre_data in sheets:
+        page_break = paginator.place(sheet_height(sheet_name, content, pre_data, options))
+        render_sheet(document, sheet_name, content, pre_data, page_break, options)
+        sheet_done(sheet_name)
 
-    document.save(output_path)
+    with span("save"):
+        document.save(output_path)
@@ -1,84 +1,292 @@
-import openpyxl
-from helpers import format_headers, format_values
+import re
+from array import array
+from fnmatch import fnmatchcase
+from typing import BinaryIO, Iterable, Iterator
+from helpers import PermutedColumn, SheetData, format_headers, format_values, intern_strings
+from options import SHEET_RANGE
+from profile_utils import count, span
+from progress_utils import expect_sheets
+from reader_utils import WorkbookReader, reader_for
 
 
-def read_excel(file_path: str, extra_columns_flag: bool, num_extra_cols: int) -> dict[str, dict[str, list[str]]]:
+class NumericColumn:
     """
-    Reads an Excel file and extracts headers from the first column and values from the second column
-    for all sheets. Returns a dictionary with sheet names as keys and extracted data as values.
-    :param file_path: Absolute path to file
+    Compact buffer for one column of cells. Numbers are packed into a double array and the few
+    non-numeric cells (None, "--", "*", labels) are kept aside by row index.
+    Behaves like the list of cells it replaces for reading, slicing and index().
+    """
+    __slots__ = ("numbers", "text")
+
+    def __init__(self, numbers: array | None = None, text: dict[int, object] | None = None):
+        self.numbers = numbers if numbers is not None else array("d")
+        self.text = text if text is not None else {}
+
+    def append(self, value) -> None:
+        if type(value) is int or type(value) is float:
+            self.numbers.append(value)
+        else:
+            self.text[len(self.numbers)] = value
+            self.numbers.append(0.0)
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.numbers))
+            if step != 1:
+                return list(self)[index]
+            text = {i - start: value for i, value in self.text.items() if start <= i < stop}
+            return NumericColumn(self.numbers[start:stop], text)
+        if index < 0:
+            index += len(self.numbers)
+        if index in self.text:
+            return self.text[index]
+        return self.numbers[index]
+
+    def __iter__(self):
+        text = self.text
+        if not text:
+            return iter(self.numbers)
+        return (text[i] if i in text else number for i, number in enumerate(self.numbers))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, NumericColumn, PermutedColumn)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def index(self, value) -> int:
+        for i, cell in enumerate(self):
+            if cell == value:
+                return i
+        raise ValueError(f"{value!r} is not in column")
+
+
+def extract_columns(rows: Iterable[tuple], columns: list[int],
+                    text_columns: Iterable[int] = (1,)) -> list[list | NumericColumn]:
+    """
+    Fills every requested column from a single pass over the rows.
+    :param rows: Row tuples of cell values, starting at column 1
+    :param columns: 1-based indices of the columns to extract, in the order they should be returned
+    :param text_columns: Columns holding text, which are returned as plain lists
+    :return: One buffer per requested column; lists for text columns and NumericColumn for the others
+    """
+    text_columns = set(text_columns)
+    buffers = [[] if col in text_columns else NumericColumn() for col in columns]
+    appenders = [(col - 1, buffer.append) for col, buffer in zip(columns, buffers)]
+
+    for row in rows:
+        width = len(row)
+        for offset, append in appenders:
+            append(row[offset] if offset < width else None)
+
+    return buffers
+
+
+def requested_columns(extra_columns_flag: bool, num_extra_cols: int) -> list[int]:
+    """
+    The columns a report needs: headers in A, values in B and, with subsets, the extra columns after it.
     :param extra_columns_flag: Flag to read and parse extra lines of data
     :param num_extra_cols: Defines how many extra lines of data to parse
     """
-    workbook = openpyxl.load_workbook(file_path)
-    data = {}
+    return list(range(1, 3 + (num_extra_cols if extra_columns_flag else 0)))
 
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
 
-        headers = [row[0] for row in sheet.iter_rows(
-            min_row=1, max_row=sheet.max_row, min_col=1, max_col=1, values_only=True
-        )]
+def sheet_matches(sheet_name: str, position: int, pattern: str) -> bool:
+    """
+    Whether a sheet is selected by one pattern of a sheet selection (see options.parse_sheets).
+    :param sheet_name: Name of the sheet
+    :param position: 1-based position of the sheet in the workbook
+    :param pattern: A sheet name, a glob, "re:" and a regular expression, or a range of positions ("#1-5")
+    """
+    if pattern.startswith("re:"):
+        return re.search(pattern[3:], sheet_name) is not None
+    if pattern.startswith("#"):
+        first, _, last = SHEET_RANGE.fullmatch(pattern).groups()
+        return int(first) <= position and (last == "" or position <= int(last or first))
+    if any(char in pattern for char in "*?["):
+        return fnmatchcase(sheet_name, pattern)
+    return sheet_name == pattern
 
-        values = [[row[0] for row in sheet.iter_rows(
-            min_row=1, max_row=sheet.max_row, min_col=2, max_col=2, values_only=True
-        )]]
 
-        if extra_columns_flag:
-            for col in range(3, 3 + num_extra_cols):
-                values.append([
-                    row[0] for row in sheet.iter_rows(
-                        min_row=1, max_row=sheet.max_row, min_col=col, max_col=col, values_only=True
-                    )
-                ])
-
-        try:
-            start_index = values[0].index(1) + 1
-            filtered_headers = format_headers(headers[start_index:])
-            filtered_values = [value[start_index:] for value in values]
+def select_sheets(sheet_names: list[str], patterns: tuple[str, ...]) -> list[str]:
+    """
+    The sheets a report covers, in workbook order: those matching any of the patterns, or all of them when
+    there are none. Only the names are looked at, so sheets that aren't selected are never read.
+    :param sheet_names: Names of the workbook's sheets
+    :param patterns: Sheet selection from options.parse_sheets
+    :raises ValueError: If a sheet named in the selection doesn't exist, or nothing is selected
+    """
+    if not patterns:
+        return list(sheet_names)
+    missing = [pattern for pattern in patterns if not pattern.startswith(("re:", "#"))
+               and not any(char in pattern for char in "*?[") and pattern not in sheet_names]
+    if missing:
+        raise ValueError(f"No sheet named {', '.join(map(repr, missing))}")
+    selected = [name for position, name in enumerate(sheet_names, 1)
+                if any(sheet_matches(name, position, pattern) for pattern in patterns)]
+    if not selected:
+        raise ValueError(f"No sheet matches {', '.join(patterns)}")
+    return selected
+
+
+def parse_sheet(headers: list, values: list[list], extra_columns_flag: bool) -> SheetData:
+    """
+    Turns the raw columns of one sheet into its headers, formatted values and subsets, and classifies the
+    headers (see helpers.classify_headers) once for reordering and styling.
+    :param headers: Raw cells of the first column
+    :param values: Raw cells of the second column and of any extra columns
+    :param extra_columns_flag: Flag to parse the subset row above the numeric start row
+    """
+    try:
+        start_index = values[0].index(1) + 1
+        filtered_headers = format_headers(headers[start_index:])
+        filtered_values = [value[start_index:] for value in values]
+        with span("format_values"):
             filtered_values = [format_values(values) for values in filtered_values]
-            subsets = []
-            if extra_columns_flag:
-                subsets = [value[start_index - 2][1:] for value in values]
-                subsets.insert(0, ' ')
-
-        except ValueError:
-            filtered_headers = []
-            filtered_values = []
-            subsets = []
-
-        data[sheet_name] = {
-            "headers": filtered_headers,
-            "values": filtered_values,
-            "subsets": subsets
-        }
+        subsets = []
+        if extra_columns_flag:
+            subsets = intern_strings([value[start_index - 2][1:] for value in values])
+            subsets.insert(0, ' ')
+
+    except ValueError:
+        filtered_headers = []
+        filtered_values = []
+        subsets = []
+
+    return SheetData(filtered_headers, filtered_values, subsets)
+
+
+def parse_pre_data(headers: list) -> list[str]:
+    """
+    Extracts the prerequisite data (question text etc.) sitting above the "BASE=" row of a sheet.
+    :param headers: Raw cells of the first column
+    """
+    try:
+        # Magic line - Essentially searches through the list by enumerating the list, then checking the instance
+        # to make sure it's a string, then searching to see if it contains the string
+        end_index = next(
+            (i for i, header in enumerate(headers) if isinstance(header, str) and "BASE=" in header), -1) - 1
+        filtered_headers = headers[:end_index]
+    except ValueError:
+        filtered_headers = []
+
+    return filtered_headers
+
+
+def read_excel(file_path: str, extra_columns_flag: bool, num_extra_cols: int, reader: str = "auto",
+               sheets: tuple[str, ...] = ()) -> dict[str, SheetData]:
+    """
+    Reads an Excel file and extracts headers from the first column and values from the second column
+    for all sheets. Returns a dictionary with sheet names as keys and extracted data as values.
+    :param file_path: Absolute path to file, or to a directory of CSV files
+    :param extra_columns_flag: Flag to read and parse extra lines of data
+    :param num_extra_cols: Defines how many extra lines of data to parse
+    :param reader: Reader backend, see open_workbook
+    :param sheets: Sheet selection (see select_sheets); every sheet by default
+    """
+    columns = requested_columns(extra_columns_flag, num_extra_cols)
+    data = {}
+
+    with open_workbook(file_path, reader) as workbook:
+        for sheet_name in select_sheets(workbook.sheetnames, sheets):
+            headers, *values = extract_columns(workbook.rows(sheet_name, columns[-1]), columns)
+
+            data[sheet_name] = parse_sheet(headers, values, extra_columns_flag)
 
     return data
 
 
-def get_question_data(file_path: str) -> list[list[str]]:
+def get_question_data(file_path: str, reader: str = "auto", sheets: tuple[str, ...] = ()) -> list[list[str]]:
     """
     Reads an Excel file and extracts the prerequisite data on each sheet
-    :param file_path: Absolute path to file
+    :param file_path: Absolute path to file, or to a directory of CSV files
+    :param reader: Reader backend, see open_workbook
+    :param sheets: Sheet selection (see select_sheets); every sheet by default
     """
-    workbook = openpyxl.load_workbook(file_path)
     pre_data = []
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
+    with open_workbook(file_path, reader) as workbook:
+        for sheet_name in select_sheets(workbook.sheetnames, sheets):
+            headers = [row[0] for row in workbook.rows(sheet_name, 1)]
 
-        headers = [row[0] for row in sheet.iter_rows(
-            min_row=1, max_row=sheet.max_row, min_col=1, max_col=1, values_only=True
-        )]
+            pre_data.append(parse_pre_data(headers))
 
-        try:
-            # Magic line - Essentially searches through the list by enumerating the list, then checking the instance
-            # to make sure it's a string, then searching to see if it contains the string
-            end_index = next(
-                (i for i, header in enumerate(headers) if isinstance(header, str) and "BASE=" in header), -1) - 1
-            filtered_headers = headers[:end_index]
-        except ValueError:
-            filtered_headers = []
+    return pre_data
 
-        pre_data.append(filtered_headers)
 
-    return pre_data
+def read_sheet(workbook: WorkbookReader, sheet_name: str, columns: list[int],
+               extra_columns_flag: bool) -> tuple[SheetData, list[str]]:
+    """
+    Reads one sheet of an open workbook in a single pass.
+    :param workbook: Workbook from open_workbook
+    :param sheet_name: Name of the sheet
+    :param columns: Columns to extract, as returned by requested_columns
+    :param extra_columns_flag: Flag to read and parse extra lines of data
+    :return: Tuple of the sheet's data (as read_excel) and its pre-data (as get_question_data)
+    """
+    with span("read_sheet", sheet=sheet_name):
+        with span("iter_rows"):
+            headers, *values = extract_columns(workbook.rows(sheet_name, columns[-1]), columns)
+        count("rows", len(headers))
+        count("cells", len(headers) * len(columns))
+        with span("parse_sheet"):
+            return parse_sheet(headers, values, extra_columns_flag), parse_pre_data(headers)
+
+
+def open_workbook(file_path: str | BinaryIO, reader: str = "auto") -> WorkbookReader:
+    """
+    Opens a workbook with a reader backend (see reader_utils), which reads sheets one at a time as their
+    rows are iterated. The workbook must be closed after use.
+    :param file_path: Absolute path to file, or to a directory of CSV files, or the workbook as a seekable
+        binary file (see reader_utils.workbook_file)
+    :param reader: Name of the backend, or "auto" for the fastest installed one that reads the file
+    :raises ValueError: If no backend reads the file or the backend it needs isn't installed
+    """
+    backend = reader_for(file_path, reader)
+    with span("load_workbook", reader=backend.name):
+        return backend(file_path)
+
+
+def iter_workbook(file_path: str | BinaryIO, extra_columns_flag: bool, num_extra_cols: int, reader: str = "auto",
+                  sheets: tuple[str, ...] = ()) -> Iterator[tuple[str, SheetData, list[str]]]:
+    """
+    Reads an Excel file one sheet at a time, so only the sheet being processed is held in memory.
+    :param file_path: Absolute path to file, or to a directory of CSV files, or the workbook as a seekable
+        binary file
+    :param extra_columns_flag: Flag to read and parse extra lines of data
+    :param num_extra_cols: Defines how many extra lines of data to parse
+    :param reader: Reader backend, see open_workbook
+    :param sheets: Sheet selection (see select_sheets); every sheet by default
+    :return: Iterator of the sheet name, data (as read_excel) and pre-data (as get_question_data) of each
+        selected sheet
+    """
+    columns = requested_columns(extra_columns_flag, num_extra_cols)
+
+    with open_workbook(file_path, reader) as workbook:
+        sheet_names = select_sheets(workbook.sheetnames, sheets)
+        expect_sheets(len(sheet_names))
+        for sheet_name in sheet_names:
+            count("sheets")
+            yield sheet_name, *read_sheet(workbook, sheet_name, columns, extra_columns_flag)
+
+
+def read_workbook(file_path: str, extra_columns_flag: bool, num_extra_cols: int, reader: str = "auto",
+                  sheets: tuple[str, ...] = ()) -> tuple[dict[str, SheetData], list[list[str]]]:
+    """
+    Reads an Excel file once and extracts everything read_excel and get_question_data would, walking the
+    rows of every sheet a single time.
+    :param file_path: Absolute path to file, or to a directory of CSV files
+    :param extra_columns_flag: Flag to read and parse extra lines of data
+    :param num_extra_cols: Defines how many extra lines of data to parse
+    :param reader: Reader backend, see open_workbook
+    :param sheets: Sheet selection (see select_sheets); every sheet by default
+    :return: Tuple of the sheet data (as read_excel) and the pre-data (as get_question_data)
+    """
+    data = {}
+    pre_data = []
+    for sheet_name, content, sheet_pre_data in iter_workbook(
+            file_path, extra_columns_flag, num_extra_cols, reader, sheets):
+        data[sheet_name] = content
+        pre_data.append(sheet_pre_data)
+
+    return data, pre_data
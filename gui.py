@@ -1,6 +1,52 @@
 import os
+import queue
+import threading
+import traceback
 from tkinter import Tk, filedialog, Label, Button, Entry, StringVar, OptionMenu, Frame, Spinbox, BooleanVar, Checkbutton
-from report_utils import run_report
+from tkinter.ttk import Progressbar
+from options import DEFAULT_CACHE_DIR
+from progress_utils import Progress, ReportCancelled, reporting
+from report_utils import preload, run_report
+
+# How often the GUI checks for news from the report being generated, in milliseconds
+POLL_INTERVAL_MS = 100
+
+
+def describe_progress(done: int, total: int, eta: float | None) -> str:
+    """
+    Status line for a report in progress, e.g. "Sheet 12 of 200, about 1:05 left".
+    :param done: Sheets finished.
+    :param total: Sheets in the workbook, 0 while it is being opened.
+    :param eta: Estimated seconds left, if known.
+    """
+    if not total:
+        return "Opening workbook..."
+    if done >= total:
+        return "Saving..."
+    text = f"Sheet {done + 1} of {total}"
+    if eta is not None:
+        minutes, seconds = divmod(round(eta), 60)
+        text += f", about {minutes}:{seconds:02d} left"
+    return text
+
+
+def generate_in_background(file_path: str, args: dict[str, str], progress: Progress, events: queue.Queue) -> None:
+    """
+    Generates a report on a worker thread. Tk may only be used from its own thread, so the outcome is put
+    on the events queue for the GUI to pick up.
+    :param file_path: Absolute path to the Excel file.
+    :param args: Dictionary containing report options.
+    :param progress: Progress of the report, which also carries its cancellation.
+    :param events: Queue receiving ("done", output path), ("cancelled", None) or ("failed", error text).
+    """
+    try:
+        with reporting(progress):
+            output_path = run_report(file_path, args)
+        events.put(("done", output_path))
+    except ReportCancelled:
+        events.put(("cancelled", None))
+    except Exception:
+        events.put(("failed", traceback.format_exc(limit=-3)))
 
 
 def open_gui() -> None:
@@ -8,11 +54,17 @@ def open_gui() -> None:
     Opens a GUI for selecting an Excel file and configuring report options.
     The GUI allows the user to select a file, choose the position of totals, font type, font size,
     text type, and run the report generation process.
+    Reports are generated on a background thread, with a progress bar and a Cancel button that stops
+    between sheets, and the window stays open for further reports. The report pipeline is imported on a
+    background thread once the window is up.
     The GUI uses Tkinter for the interface.
     """
     root = Tk()
     root.title("Table Generator")
-    root.geometry("350x650")
+    # Import the report pipeline while the user picks a file and options, so the window appears at once
+    # and the first report doesn't wait for it either
+    threading.Thread(target=preload, daemon=True).start()
+    root.geometry("350x1060")
 
     file_frame = Frame(root)
     file_frame.pack(pady=10)
@@ -22,11 +74,17 @@ def open_gui() -> None:
     def select_file():
         path = filedialog.askopenfilename(
             title="Select Excel File",
-            filetypes=[("Excel files", "*.xlsx *.xls")]
+            filetypes=[("Excel files", "*.xlsx *.xlsm *.xls")]
         )
         file_var.set(path)
         file_label.config(text=os.path.basename(path) if path else "No file selected")
 
+    def select_folder():
+        # A folder of .csv files is read as a workbook, one sheet per file
+        path = filedialog.askdirectory(title="Select Folder of CSV Files")
+        file_var.set(path)
+        file_label.config(text=os.path.basename(path) + "/" if path else "No file selected")
+
     file_var = StringVar()
     Button(
         file_frame,
@@ -35,6 +93,13 @@ def open_gui() -> None:
         activebackground="#cccccc",
         activeforeground="#000000"
     ).pack(side="left", padx=5)
+    Button(
+        file_frame,
+        text="CSV folder",
+        command=select_folder,
+        activebackground="#cccccc",
+        activeforeground="#000000"
+    ).pack(side="left")
 
     common_fonts = ["Arial", "Calibri", "Times New Roman", "Verdana", "Courier New", "Georgia", "Tahoma", "Helvetica"]
     Label(root, text="Font Type:").pack()
@@ -89,6 +154,18 @@ def open_gui() -> None:
     margin_var = StringVar(value="1.0")
     Entry(root, textvariable=margin_var).pack()
 
+    # Longer tables are split into continuation tables (see page_utils.table_chunks)
+    Label(root, text="\nMax rows / columns per table (0 for no limit):").pack()
+    max_rows_var = StringVar(value="0")
+    Entry(root, textvariable=max_rows_var).pack()
+    max_cols_var = StringVar(value="0")
+    Entry(root, textvariable=max_cols_var).pack()
+
+    # Comma-separated names, globs, re: patterns or #ranges (see options.parse_sheets)
+    Label(root, text="\nSheets (blank for all, e.g. Q1*, #3-7):").pack()
+    sheets_var = StringVar()
+    Entry(root, textvariable=sheets_var).pack()
+
     grid_var = BooleanVar(value=False)
     Checkbutton(
         root,
@@ -122,7 +199,131 @@ def open_gui() -> None:
     extra_entry = Entry(extra_frame, textvariable=extra_num_var, state="disabled", width=5)
     extra_entry.pack(side="left")
 
+    Label(root, text="\nWorker processes:").pack()
+    workers_var = StringVar(value="1")
+    Spinbox(
+        root,
+        values=tuple(str(i) for i in range(1, (os.cpu_count() or 1) + 1)),
+        textvariable=workers_var,
+        width=5,
+        state="readonly"
+    ).pack()
+    workers_var.set("1")
+
+    cache_var = BooleanVar(value=False)
+    Checkbutton(
+        root,
+        text="Reuse cached sheets",
+        variable=cache_var,
+        onvalue=True,
+        offvalue=False
+    ).pack()
+
+    incremental_var = BooleanVar(value=False)
+    Checkbutton(
+        root,
+        text="Only update changed sheets",
+        variable=incremental_var,
+        onvalue=True,
+        offvalue=False
+    ).pack()
+
+    named_styles_var = BooleanVar(value=False)
+    Checkbutton(
+        root,
+        text="Named styles (smaller document)",
+        variable=named_styles_var,
+        onvalue=True,
+        offvalue=False
+    ).pack()
+
+    streaming_var = BooleanVar(value=False)
+    Checkbutton(
+        root,
+        text="Low memory (write sheets as they are done)",
+        variable=streaming_var,
+        onvalue=True,
+        offvalue=False
+    ).pack()
+
+    trace_var = BooleanVar(value=False)
+    Checkbutton(
+        root,
+        text="Write timing trace",
+        variable=trace_var,
+        onvalue=True,
+        offvalue=False
+    ).pack()
+
+    # Extra output formats, written from the same read of the workbook as the .docx
+    Label(root, text="\nAlso write:").pack()
+    format_frame = Frame(root)
+    format_frame.pack()
+    format_vars = {}
+    for name, text in (("html", "HTML"), ("csv", "CSV"), ("md", "Markdown")):
+        format_vars[name] = BooleanVar(value=False)
+        Checkbutton(
+            format_frame,
+            text=text,
+            variable=format_vars[name],
+            onvalue=True,
+            offvalue=False
+        ).pack(side="left")
+
+    status_var = StringVar()
+    running = {}
+
+    def poll():
+        events = running["events"]
+        while True:
+            try:
+                kind, value = events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                done, total, eta = value
+                progress_bar.config(maximum=max(total, 1), value=done)
+                # Keep "Cancelling..." up until the report has stopped
+                if not running["progress"].cancelled:
+                    status_var.set(describe_progress(done, total, eta))
+                continue
+            if kind == "done":
+                print(f"Report written to {value}")
+                status_var.set(f"Report written to {os.path.basename(value)}")
+            elif kind == "cancelled":
+                status_var.set("Cancelled")
+            else:
+                print(value)
+                status_var.set("Failed: " + value.strip().splitlines()[-1])
+            closing = running.get("closing", False)
+            running.clear()
+            if closing:
+                root.destroy()
+                return
+            progress_bar.config(value=0)
+            run_button.config(state="normal")
+            cancel_button.config(state="disabled")
+            return
+        root.after(POLL_INTERVAL_MS, poll)
+
+    def on_cancel():
+        if running:
+            running["progress"].cancel()
+            status_var.set("Cancelling after the current sheet...")
+
+    def on_close():
+        if not running:
+            root.destroy()
+            return
+        # Let the report stop after the current sheet and clean up (temporary files, cache writes, the
+        # incremental manifest) before the window and the process go away; poll() closes it then
+        running["progress"].cancel()
+        running["closing"] = True
+        status_var.set("Closing after the current sheet...")
+
     def on_run():
+        if running:
+            return
         if not file_var.get():
             file_label.config(text="Please select a file!")
             return
@@ -135,18 +336,59 @@ def open_gui() -> None:
             "ordering": ordering_var.get(),
             "gridlines": grid_var.get(),
             "margin": margin_var.get(),
+            "max_table_rows": max_rows_var.get(),
+            "max_table_cols": max_cols_var.get(),
             "extra_columns_flag": extra_var.get(),
-            "extra_columns": extra_num_var.get()
+            "extra_columns": extra_num_var.get(),
+            "workers": workers_var.get(),
+            "cache_dir": DEFAULT_CACHE_DIR if cache_var.get() else "",
+            "incremental": incremental_var.get(),
+            "named_styles": named_styles_var.get(),
+            "streaming": streaming_var.get(),
+            "trace": trace_var.get(),
+            "formats": ["docx"] + [name for name, var in format_vars.items() if var.get()],
+            "sheets": sheets_var.get()
         }
-        run_report(file_var.get(), args)
-        root.quit()
+        events = queue.Queue()
+        running["events"] = events
+        # Called on the worker thread, so only the numbers are passed on
+        running["progress"] = Progress(lambda progress: events.put(
+            ("progress", (progress.done, progress.total, progress.eta()))
+        ))
+        status_var.set("Opening workbook...")
+        run_button.config(state="disabled")
+        cancel_button.config(state="normal")
+        # Not a daemon thread: if the main loop ends while a report runs, the process still waits for the
+        # report to finish instead of killing it halfway through writing
+        threading.Thread(
+            target=generate_in_background,
+            args=(file_var.get(), args, running["progress"], running["events"])
+        ).start()
+        root.after(POLL_INTERVAL_MS, poll)
 
-    Button(
-        root,
+    button_frame = Frame(root)
+    button_frame.pack(pady=10)
+    run_button = Button(
+        button_frame,
         text="Generate Report",
         command=on_run,
         activebackground="#cccccc",
         activeforeground="#000000"
-    ).pack(pady=10)
+    )
+    run_button.pack(side="left", padx=5)
+    cancel_button = Button(
+        button_frame,
+        text="Cancel",
+        command=on_cancel,
+        state="disabled",
+        activebackground="#cccccc",
+        activeforeground="#000000"
+    )
+    cancel_button.pack(side="left", padx=5)
+
+    progress_bar = Progressbar(root, length=300, mode="determinate")
+    progress_bar.pack()
+    Label(root, textvariable=status_var, wraplength=320).pack()
 
+    root.protocol("WM_DELETE_WINDOW", on_close)
     root.mainloop()
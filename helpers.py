@@ -1,19 +1,187 @@
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Cell values shown as they are instead of as percentages
+PLACEHOLDERS = ("--", "*")
+PERCENTAGE_STRINGS = tuple(f"{i}%" for i in range(101))
+# Header classification flags, see classify_headers
+HEADER_DS = 1
+HEADER_TOTAL = 2
+HEADER_CAPS_TOTAL = 4
+# Total mention flags, see mentions_total
+MENTIONS_TOTAL = 1
+MENTIONS_TOTAL_UPPER = 2
+# Below this many values a column is rounded faster without NumPy
+NUMPY_MIN_VALUES = 512
+# Typecodes tried in turn for a column of whole percentages, see pack_percentages
+INTEGER_TYPECODES = ("h", "q")
+# Codes at the bottom of a PercentColumn's range that stand for its text cells
+TEXT_CODES = 256
+
+
+class PercentColumn:
+    """
+    Compact column of formatted values (see format_values): whole percentages packed into an integer array,
+    two bytes each when they fit, and the column's few distinct text cells (None, "--", "*", labels) kept
+    once and referred to by codes reserved at the bottom of the array's range.
+    Behaves like the list of values it replaces for reading.
+    """
+    __slots__ = ("numbers", "text", "base")
+    __hash__ = None
+
+    def __init__(self, numbers: array, text: tuple = ()):
+        """
+        :param numbers: The percentages, with base + i in place of a cell holding text[i].
+        :param text: The distinct text cells.
+        """
+        self.numbers = numbers
+        self.text = text
+        self.base = -2 ** (8 * numbers.itemsize - 1)
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        number = self.numbers[index]
+        return self.text[number - self.base] if number < self.base + TEXT_CODES else number
+
+    def __iter__(self):
+        if not self.text:
+            return iter(self.numbers)
+        text, base, limit = self.text, self.base, self.base + TEXT_CODES
+        return (text[number - base] if number < limit else number for number in self.numbers)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, tuple, PercentColumn, PermutedColumn)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"PercentColumn({list(self)!r})"
+
+
+class SheetData:
+    """
+    The parsed content of one sheet (see excel_utils.parse_sheet): its formatted headers, a column of
+    formatted values for the values column and each subset column, the subset row and the classification
+    of each header. Header and subset strings are interned, so the labels repeated on every sheet of a
+    survey are stored once, value columns are PercentColumn arrays and header kinds are packed into bytes.
+    Reordering replaces the fields with views (see order_totals), so copy() is enough to reorder a sheet
+    without changing the original.
+    """
+    __slots__ = ("headers", "values", "subsets", "header_kinds")
+    __hash__ = None
+
+    def __init__(self, headers: list[str], values: list, subsets: list[str], header_kinds: array | None = None):
+        """
+        :param headers: Formatted headers.
+        :param values: Formatted value columns, each with one value per header.
+        :param subsets: Subset row, empty without subsets.
+        :param header_kinds: Classification of each header, worked out from the headers if not given.
+        """
+        self.headers = headers
+        self.values = values
+        self.subsets = subsets
+        self.header_kinds = header_kinds if header_kinds is not None else array("B", classify_headers(headers))
+
+    def copy(self) -> "SheetData":
+        """
+        A copy sharing the same columns, whose fields can be replaced without affecting this one.
+        """
+        return SheetData(self.headers, self.values, self.subsets, self.header_kinds)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SheetData):
+            return NotImplemented
+        return (self.headers == other.headers and self.subsets == other.subsets
+                and list(self.header_kinds) == list(other.header_kinds)
+                and [list(column) for column in self.values] == [list(column) for column in other.values])
+
+    def __repr__(self) -> str:
+        # Only the contents, so the repr fingerprints the sheet (see incremental_utils)
+        return (f"SheetData(headers={self.headers!r}, values={[list(column) for column in self.values]!r}, "
+                f"subsets={self.subsets!r}, header_kinds={list(self.header_kinds)!r})")
+
+
+def intern_strings(items: list) -> list:
+    """
+    Interns the strings of a list, so equal strings read from different sheets share one object.
+    :param items: Cells of any type; only strings are interned.
+    """
+    return [sys.intern(item) if type(item) is str else item for item in items]
+
+
 def format_headers(headers: list[str]) -> list[str]:
     """
-    Formats the headers to have capitalized first letters on each word.
+    Formats the headers to have capitalized first letters on each word. The results are interned.
     :param headers: List of the respective headers
     """
-    headers = [header.title() for header in headers if isinstance(header, str)]
+    headers = [sys.intern(header.title()) for header in headers if isinstance(header, str)]
     return headers
 
 
-def format_values(values: list[float]) -> list[float]:
+def format_values(values: list[float]) -> list | PercentColumn:
     """
     Formats the values to be rounded based on the common rounding rule and appearing as whole percentages.
+    Columns read by excel_utils (NumericColumn) are rounded in bulk, with NumPy when it is installed, and
+    packed into a PercentColumn.
     :param values: List of the respective values
     """
-    values = [round(value * 100) if isinstance(value, (int, float)) else value for value in values]
-    return values
+    numbers = getattr(values, "numbers", None)
+    if numbers is None:
+        return [round(value * 100) if isinstance(value, (int, float)) else value for value in values]
+
+    # Round the packed numbers in one go, then put the column's few non-numeric cells back.
+    # numpy.rint and round() both round half to even on the same doubles, so the results are identical.
+    formatted = None
+    if numpy is not None and len(numbers) >= NUMPY_MIN_VALUES:
+        scaled = numpy.rint(numpy.frombuffer(numbers, dtype=numpy.float64) * 100)
+        if numpy.abs(scaled).max() < 2 ** 53:
+            formatted = scaled.astype(numpy.int64).tolist()
+    if formatted is None:
+        formatted = [round(number * 100) for number in numbers]
+    text = {}
+    for index, value in values.text.items():
+        if isinstance(value, (int, float)):
+            formatted[index] = round(value * 100)
+        else:
+            formatted[index] = 0
+            text[index] = value
+    packed = pack_percentages(formatted, text)
+    if packed is None:
+        for index, value in text.items():
+            formatted[index] = value
+        return formatted
+    return packed
+
+
+def pack_percentages(percentages: list[int], text: dict[int, object]) -> PercentColumn | None:
+    """
+    Packs a formatted column into the smallest PercentColumn that holds it.
+    :param percentages: The whole percentages, with any value at the rows holding text. Modified.
+    :param text: The text cells by row.
+    :return: The column, or None if its numbers don't fit in 64 bits or it has too many distinct text cells.
+    """
+    codes = {}
+    for value in text.values():
+        codes.setdefault(value, len(codes))
+    if len(codes) > TEXT_CODES:
+        return None
+    low, high = min(percentages, default=0), max(percentages, default=0)
+    for typecode in INTEGER_TYPECODES:
+        base = -2 ** (8 * array(typecode).itemsize - 1)
+        if base + TEXT_CODES <= low and high < -base:
+            for index, value in text.items():
+                percentages[index] = base + codes[value]
+            return PercentColumn(array(typecode, percentages), tuple(codes))
+    return None
 
 
 def add_percentages_to_values(value: str) -> str:
@@ -23,15 +191,34 @@ def add_percentages_to_values(value: str) -> str:
     :param value: The value to be formatted as a percentage.
     :return: The formatted value as a string with a percentage symbol, or the original value if it is in the exception list.
     """
-    percentage_dict = ["--", "*"]
     if str(value).isnumeric():
         return str(value) + "%"
-    elif value is not None or value in percentage_dict:
+    elif value is not None or value in PLACEHOLDERS:
         return str(value)
     else:
         return ""
 
 
+def format_percentages(values: list) -> list[str]:
+    """
+    Formats a whole column of values for display, giving the same strings as add_percentages_to_values
+    for each value. The whole percentages most cells hold are looked up instead of formatted.
+    :param values: Values of one column, as returned by format_values.
+    :return: Display strings in the same order.
+    """
+    strings = []
+    append = strings.append
+    percentages = PERCENTAGE_STRINGS
+    for value in values:
+        if type(value) is int and 0 <= value <= 100:
+            append(percentages[value])
+        elif value is None:
+            append("")
+        else:
+            append(add_percentages_to_values(value))
+    return strings
+
+
 # Copilot assisted with the list comprehension here
 # def move_totals(headers: list[str], values: list[str],direction: str) -> tuple[list[str], list[str]]:
 #     """
@@ -57,29 +244,142 @@ def add_percentages_to_values(value: str) -> str:
 #
 #     return list(reordered_headers), list(reordered_values)
 
-def move_totals(headers: list[str], values: list[list[str]], direction: str) -> tuple[list[str], list[list[str]]]:
+def classify_headers(headers: list[str]) -> list[int]:
+    """
+    Classifies each header once, so reordering and styling don't have to search the header text again.
+    :param headers: List of headers.
+    :return: Per header, a combination of HEADER_DS, HEADER_TOTAL and HEADER_CAPS_TOTAL flags.
+    """
+    kinds = []
+    for header in headers:
+        header = header if isinstance(header, str) else "" if header is None else str(header)
+        lowered = header.lower()
+        kind = (HEADER_DS if "**d/s" in lowered else 0) | (HEADER_TOTAL if "total" in lowered else 0)
+        # Upper-casing can turn non-ASCII characters into ones that spell "total"
+        caps_total = kind & HEADER_TOTAL if header.isascii() else "total" in header.upper().lower()
+        if caps_total:
+            kind |= HEADER_CAPS_TOTAL
+        kinds.append(kind)
+    return kinds
+
+
+def mentions_total(text: str, caps: bool) -> int:
+    """
+    Whether a cell's text gets total styling: as written (after the All Caps text type, if any), and once
+    the cell has been upper-cased as the neighbour of a total.
+    :param text: Text of a cell.
+    :param caps: Whether the text is upper-cased by the All Caps text type.
+    :return: A combination of the MENTIONS_TOTAL and MENTIONS_TOTAL_UPPER flags.
+    """
+    upper = "total" in text.upper().lower() if caps or not text.isascii() else None
+    written = upper if caps else "total" in text.lower()
+    return (MENTIONS_TOTAL if written else 0) | (MENTIONS_TOTAL_UPPER if (written if upper is None else upper) else 0)
+
+
+def header_mentions(kind: int, caps: bool) -> int:
+    """
+    mentions_total for a header, read from its classification.
+    :param kind: Header classification from classify_headers.
+    :param caps: Whether the text is upper-cased by the All Caps text type.
+    """
+    if caps:
+        return MENTIONS_TOTAL | MENTIONS_TOTAL_UPPER if kind & HEADER_CAPS_TOTAL else 0
+    return (MENTIONS_TOTAL if kind & HEADER_TOTAL else 0) | (MENTIONS_TOTAL_UPPER if kind & HEADER_CAPS_TOTAL else 0)
+
+
+def total_mentions(values: list, caps: bool) -> dict[int, int]:
+    """
+    mentions_total for the cells of a value column that can mention a total. Only text cells can, so
+    numbers are skipped without formatting them.
+    :param values: Values of one column.
+    :param caps: Whether the text is upper-cased by the All Caps text type.
+    :return: The non-zero mentions by position in the column.
+    """
+    mentions = {}
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            mention = mentions_total(value, caps)
+            if mention:
+                mentions[i] = mention
+    return mentions
+
+
+def total_order(kinds: list[int], direction: str) -> list[int]:
+    """
+    The header order move_totals produces: D/S rows first, then totals at the top or bottom.
+    :param kinds: Header classification from classify_headers.
+    :param direction: Defines which direction to move the totals (top/bottom).
+    """
+    ds_indices = [i for i, kind in enumerate(kinds) if kind & HEADER_DS]
+    total_indices = [i for i, kind in enumerate(kinds) if kind & HEADER_TOTAL]
+    non_total_indices = [i for i, kind in enumerate(kinds) if not kind & (HEADER_DS | HEADER_TOTAL)]
+
+    if direction == "Bottom":
+        return ds_indices + non_total_indices + total_indices
+    return ds_indices + total_indices + non_total_indices
+
+
+class PermutedColumn:
+    """
+    Read-only view of a column in another order, so reordering a sheet doesn't copy its values.
+    Views of views are flattened into one view of the underlying column. It compares equal to a list or
+    tuple with the same values and, like a list, isn't hashable.
+    """
+    __slots__ = ("column", "order")
+    __hash__ = None
+
+    def __init__(self, column, order: list[int]):
+        if isinstance(column, PermutedColumn):
+            column, order = column.column, [column.order[i] for i in order]
+        self.column = column
+        self.order = order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.column[i] for i in self.order[index]]
+        return self.column[self.order[index]]
+
+    def __iter__(self):
+        return map(self.column.__getitem__, self.order)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, tuple, PermutedColumn)):
+            return NotImplemented
+        return list(self) == list(other)
+
+
+def move_totals(headers: list[str], values: list[list[str]], direction: str,
+                kinds: list[int] | None = None) -> tuple[list[str], list[list[str]]]:
     """
     Moves headers containing "total" and their corresponding values to the bottom of the lists.
     Subsets remain unchanged.
     :param headers: List of headers.
     :param values: List of value arrays corresponding to the headers.
     :param direction: Defines which direction to move the totals (top/bottom).
+    :param kinds: Header classification from classify_headers, worked out from the headers if not given.
     :return: Tuple of reordered headers, values, and subsets.
     """
-
-    # Separate "total" headers and their values
-    ds_indices = [i for i, header in enumerate(headers) if "**d/s" in header.lower()]
-    total_indices = [i for i, header in enumerate(headers) if "total" in header.lower()]
-    non_total_indices = [i for i, header in enumerate(headers) if
-                         "total" not in header.lower() and "**d/s" not in header.lower()]
-
-    if direction == "Bottom":
-        reordered_indices = ds_indices + non_total_indices + total_indices
-    else:
-        reordered_indices = ds_indices + total_indices + non_total_indices
+    reordered_indices = total_order(kinds if kinds is not None else classify_headers(headers), direction)
 
     # Reorder headers and values based on the indices
     reordered_headers = [headers[i] for i in reordered_indices]
     reordered_values = [[value[i] for i in reordered_indices] for value in values]
 
     return reordered_headers, reordered_values
+
+
+def order_totals(content: SheetData, direction: str) -> None:
+    """
+    Moves the totals of a sheet like move_totals, in place and using its stored header classification.
+    The value columns become views in the new order rather than copies.
+    :param content: The sheet's data.
+    :param direction: Defines which direction to move the totals (top/bottom).
+    """
+    kinds = content.header_kinds
+    order = total_order(kinds, direction)
+    content.headers = [content.headers[i] for i in order]
+    content.values = [PermutedColumn(column, order) for column in content.values]
+    content.header_kinds = array("B", [kinds[i] for i in order])
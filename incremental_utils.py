@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import posixpath
+import tempfile
+import zipfile
+from lxml import etree
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from cache_utils import file_digest
+from docx_utils import render_sheet
+from excel_utils import open_workbook, read_sheet, requested_columns, select_sheets
+from options import ReportOptions
+from page_utils import PAGE_BREAK_XML, Paginator, sheet_height
+from profile_utils import span
+from progress_utils import expect_sheets, sheet_done
+from reader_utils import csv_sheets
+from xml_utils import add_report_styles
+
+MANIFEST_VERSION = 3
+# Workbook parts besides the worksheets that the cell values read from them depend on
+SHARED_PARTS = ("xl/sharedStrings.xml", "xl/styles.xml")
+SPREADSHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def manifest_path(output_path: str) -> str:
+    """
+    Path of the manifest kept next to a report, e.g. survey_b.manifest.json for survey_b.docx.
+    :param output_path: Path of the generated Word document.
+    """
+    return os.path.splitext(output_path)[0] + ".manifest.json"
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def worksheet_digests(file_path: str, reader: str = "auto") -> tuple[str, dict[str, str]]:
+    """
+    Fingerprints a workbook's raw parts without parsing any cells. Each CSV file of a directory is one
+    worksheet with no shared parts; a legacy .xls can't be split into parts, so the whole file counts as
+    shared and any edit has every sheet compared by its parsed data.
+    :param file_path: Path to the .xlsx or .xls file, or to a directory of CSV files.
+    :param reader: Reader backend, used to list the sheets of an .xls.
+    :return: Tuple of the digest of the shared parts (strings and styles) and the digest of each worksheet's
+        XML by sheet name.
+    """
+    if os.path.isdir(file_path):
+        return "", {name: file_digest(path) for name, path in csv_sheets(file_path).items()}
+    if not zipfile.is_zipfile(file_path):
+        with open_workbook(file_path, reader) as workbook:
+            return file_digest(file_path), dict.fromkeys(workbook.sheetnames, "")
+    with zipfile.ZipFile(file_path) as archive:
+        names = set(archive.namelist())
+        shared = hashlib.sha256()
+        for part in SHARED_PARTS:
+            if part in names:
+                shared.update(archive.read(part))
+
+        relationships = etree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {}
+        for relationship in relationships.iter(f"{{{PACKAGE_RELATIONSHIPS_NS}}}Relationship"):
+            target = relationship.get("Target")
+            # Targets are relative to xl/ unless they start at the package root
+            targets[relationship.get("Id")] = target.lstrip("/") if target.startswith("/") else \
+                posixpath.normpath(posixpath.join("xl", target))
+
+        workbook = etree.fromstring(archive.read("xl/workbook.xml"))
+        sheets = {}
+        for sheet in workbook.iter(f"{{{SPREADSHEET_NS}}}sheet"):
+            part = targets.get(sheet.get(f"{{{RELATIONSHIPS_NS}}}id"))
+            sheets[sheet.get("name")] = digest(archive.read(part)) if part in names else ""
+    return shared.hexdigest(), sheets
+
+
+def load_manifest(output_path: str, options: ReportOptions) -> dict | None:
+    """
+    Reads the manifest of an earlier run, if it belongs to a report generated with the same options.
+    :param output_path: Path of the generated Word document.
+    :param options: Report options.
+    """
+    path = manifest_path(output_path)
+    if not os.path.exists(path) or not os.path.exists(output_path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("options") != repr(options.rendering()):
+        return None
+    return manifest
+
+
+def save_manifest(output_path: str, manifest: dict) -> None:
+    path = manifest_path(output_path)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(temp_path, path)
+
+
+def write_doc_incremental(file_path: str, output_path: str, options: ReportOptions) -> list[str]:
+    """
+    Generates the report like write_doc, but only re-renders the sheets that changed since the report at
+    output_path was last generated. A manifest next to the report records each sheet's fingerprints, its
+    estimated height, whether a page break went before it and how many body elements it produced.
+    Unchanged sheets keep their elements in the existing document, and changed, added, moved or removed
+    sheets are spliced in or out around them. Page breaks are laid out again from the heights, so an edit
+    that moves a break leaves the sheets around it untouched.
+    A sheet counts as unchanged when its worksheet XML and the shared strings and styles are byte-identical,
+    or, failing that, when the data parsed from it is identical. Without a matching manifest (first run,
+    different options or an edited report) the whole report is generated.
+    :param file_path: Absolute path to the Excel file, or to a directory of CSV files.
+    :param output_path: Path of the Word document to update or create.
+    :param options: Report options.
+    :return: Names of the sheets that were rendered.
+    """
+    shared, raw_digests = worksheet_digests(file_path, options.reader)
+    raw_digests = {name: raw_digests[name] for name in select_sheets(list(raw_digests), options.sheets)}
+    manifest = load_manifest(output_path, options)
+
+    previous = {}
+    document = None
+    if manifest is not None:
+        document = Document(output_path)
+        elements = [child for child in document.element.body if child.tag != qn("w:sectPr")]
+        if len(elements) == sum(entry["elements"] for entry in manifest["sheets"]):
+            position = 0
+            for entry in manifest["sheets"]:
+                # The sheet's elements, without the page break before it
+                previous[entry["name"]] = entry, elements[position + entry["break"]:position + entry["elements"]]
+                position += entry["elements"]
+        else:
+            manifest = None
+    if manifest is None:
+        document = Document()
+    add_report_styles(document, options)
+
+    body = document.element.body
+    for child in list(body):
+        if child.tag != qn("w:sectPr"):
+            body.remove(child)
+    sect_pr = body.sectPr
+
+    columns = requested_columns(options.extra_columns_flag, options.extra_columns)
+    workbook = None
+    scratch = None
+    rendered = []
+    entries = []
+    paginator = Paginator()
+    expect_sheets(len(raw_digests))
+    try:
+        for sheet_name, raw_digest in raw_digests.items():
+            entry, elements = previous.get(sheet_name, (None, None))
+            reusable = entry is not None
+            data_digest = None
+            height = entry["height"] if reusable else None
+            if not (reusable and entry["raw"] == raw_digest and manifest["shared"] == shared):
+                if workbook is None:
+                    workbook = open_workbook(file_path, options.reader)
+                content, pre_data = read_sheet(workbook, sheet_name, columns, options.extra_columns_flag)
+                data_digest = digest(repr((content, pre_data)).encode())
+                if not (reusable and entry["data"] == data_digest):
+                    if scratch is None:
+                        scratch = Document()
+                    height = sheet_height(sheet_name, content, pre_data, options)
+                    # Render straight into a scratch document and move its elements over; both documents
+                    # share the same namespaces, so no serialization round trip is needed
+                    render_sheet(scratch, sheet_name, content, pre_data, False, options)
+                    elements = [child for child in scratch.element.body if child.tag != qn("w:sectPr")]
+                    rendered.append(sheet_name)
+
+            page_break = paginator.place(height)
+            if page_break:
+                elements = [parse_xml(PAGE_BREAK_XML), *elements]
+            for element in elements:
+                if sect_pr is not None:
+                    sect_pr.addprevious(element)
+                else:
+                    body.append(element)
+            entries.append({
+                "name": sheet_name, "raw": raw_digest, "data": data_digest or entry["data"],
+                "height": height, "break": page_break, "elements": len(elements)
+            })
+            sheet_done(sheet_name)
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+    # Write next to the report and swap it in, so an interrupted run never leaves a half-written document
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix=".docx")
+    os.close(fd)
+    try:
+        with span("save"):
+            document.save(temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    save_manifest(output_path, {
+        "version": MANIFEST_VERSION, "options": repr(options.rendering()), "shared": shared, "sheets": entries
+    })
+    return rendered
@@ -1,4 +1,9 @@
-from gui import open_gui
+import sys
 
 if __name__ == "__main__":
+    # With arguments, run headless without importing tkinter; without, open the GUI
+    if len(sys.argv) > 1:
+        from cli import main
+        sys.exit(main())
+    from gui import open_gui
     open_gui()
@@ -0,0 +1,186 @@
+import os
+import re
+from dataclasses import dataclass, replace
+
+# Where "Reuse cached sheets" and --cache keep parsed sheets and rendered tables. Defined here rather than in
+# cache_utils, so the GUI and CLI can offer it without importing the report pipeline.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tablegenerator")
+# Output formats and their file extensions, see render_utils
+FORMATS = {"docx": ".docx", "html": ".html", "csv": ".csv", "md": ".md"}
+# Workbook reader backends, fastest first (see reader_utils); "auto" picks the fastest one that reads the input
+READERS = ("xlsx", "openpyxl", "xls", "csv")
+# Workbook files a report is made from; a directory of .csv files is read as a workbook too
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+# A range of sheet positions in a sheet selection, 1-based and inclusive: #3, #1-5 or #10- (to the last sheet)
+SHEET_RANGE = re.compile(r"#(\d+)(-(\d*))?")
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("", "0", "false", "no", "off")
+
+
+def parse_flag(value: bool | str) -> bool:
+    """
+    Converts an on/off option to a bool. The GUI and CLI pass bools, the report service the strings of a
+    query, where bool("false") would be True.
+    :param value: A bool, or a string such as "true", "1", "no" or "off" in any case.
+    :raises ValueError: If the string isn't one of the accepted values.
+    """
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"expected an on/off value, got {value!r}")
+
+
+def parse_formats(value: str | list[str] | tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Converts the requested output formats to a tuple of FORMATS keys, in the order given without repeats.
+    :param value: A list of formats, or a comma-separated string such as "docx,html".
+    :raises ValueError: If no format, or an unknown one, is given.
+    """
+    names = value.split(",") if isinstance(value, str) else value
+    formats = tuple(dict.fromkeys(name.strip().lower() for name in names if name.strip()))
+    unknown = [name for name in formats if name not in FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"expected formats from {', '.join(FORMATS)}, got {value!r}")
+    return formats
+
+
+def parse_limit(value: int | str) -> int:
+    """
+    Converts a table size limit (see page_utils.table_chunks), where 0 or blank means no limit.
+    :param value: A non-negative number, or its string.
+    :raises ValueError: If the value isn't a non-negative whole number.
+    """
+    limit = int(str(value).strip() or 0)
+    if limit < 0:
+        raise ValueError(f"expected a table size of 0 (no limit) or more, got {value!r}")
+    return limit
+
+
+def parse_reader(value: str) -> str:
+    """
+    Checks the requested workbook reader.
+    :param value: "auto" or one of READERS, in any case.
+    :raises ValueError: If the reader is unknown.
+    """
+    name = str(value).strip().lower() or "auto"
+    if name != "auto" and name not in READERS:
+        raise ValueError(f"expected auto or a reader from {', '.join(READERS)}, got {value!r}")
+    return name
+
+
+def parse_sheets(value: str | list[str] | tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Converts a sheet selection to a tuple of patterns, each one a sheet name, a glob such as "Q1*", a regular
+    expression prefixed with "re:" (e.g. "re:^Banner") or a range of positions such as "#1-5" (see
+    excel_utils.select_sheets). An empty selection selects every sheet.
+    :param value: A list of patterns, or a comma-separated string such as "Summary,#3-7".
+    :raises ValueError: If a regular expression or range is invalid.
+    """
+    names = value.split(",") if isinstance(value, str) else value
+    patterns = tuple(dict.fromkeys(name.strip() for name in names if name.strip()))
+    for pattern in patterns:
+        if pattern.startswith("re:"):
+            try:
+                re.compile(pattern[3:])
+            except re.error as error:
+                raise ValueError(f"invalid sheet pattern {pattern!r}: {error}") from None
+        elif pattern.startswith("#"):
+            match = SHEET_RANGE.fullmatch(pattern)
+            first = int(match.group(1)) if match else 0
+            if first < 1 or (match.group(3) and int(match.group(3)) < first):
+                raise ValueError(f"expected a sheet range such as #3, #1-5 or #10-, got {pattern!r}")
+    return patterns
+
+
+@dataclass(frozen=True)
+class ReportOptions:
+    """
+    Report options, converted once from the args dictionary the GUI and CLI build and passed explicitly
+    through the report engine. Instances are immutable, so one can be shared by reports running at the
+    same time and used as a cache key for state derived from it (see xml_utils.style_plan).
+    """
+    total_position: str = ""
+    ordering: str = ""
+    header_side: str = ""
+    gridlines: bool = False
+    font_size: int = 12
+    font_type: str = ""
+    text_type: str = ""
+    margin: float = 1.0
+    max_table_rows: int = 0
+    max_table_cols: int = 0
+    extra_columns_flag: bool = False
+    extra_columns: int = 0
+    table_engine: str = "XML"
+    named_styles: bool = False
+    workers: int = 1
+    cache_dir: str = ""
+    cache_size_mb: int = 512
+    incremental: bool = False
+    streaming: bool = False
+    trace: bool = False
+    profile: bool = False
+    formats: tuple[str, ...] = ("docx",)
+    reader: str = "auto"
+    sheets: tuple[str, ...] = ()
+
+    @classmethod
+    def from_args(cls, args: dict[str, str]) -> "ReportOptions":
+        """
+        Builds options from the args dictionary, converting the string values the GUI produces.
+        :param args: Dictionary containing report options.
+        :raises ValueError: If a value can't be converted, e.g. a font size that isn't a number.
+        """
+        return cls(
+            total_position=args.get("total_position", ""),
+            ordering=args.get("ordering", ""),
+            header_side=args.get("header_side", ""),
+            gridlines=parse_flag(args.get("gridlines", False)),
+            font_size=int(args.get("font_size", 12)),
+            font_type=args.get("font_type", ""),
+            text_type=args.get("text_type", ""),
+            margin=float(args.get("margin", 1.0)),
+            max_table_rows=parse_limit(args.get("max_table_rows", 0)),
+            max_table_cols=parse_limit(args.get("max_table_cols", 0)),
+            extra_columns_flag=parse_flag(args.get("extra_columns_flag", False)),
+            extra_columns=int(args.get("extra_columns", 0)),
+            table_engine=args.get("table_engine", "XML"),
+            named_styles=parse_flag(args.get("named_styles", False)),
+            workers=int(args.get("workers", 1)),
+            cache_dir=args.get("cache_dir", ""),
+            cache_size_mb=int(args.get("cache_size_mb", 512)),
+            incremental=parse_flag(args.get("incremental", False)),
+            streaming=parse_flag(args.get("streaming", False)),
+            trace=parse_flag(args.get("trace", False)),
+            profile=parse_flag(args.get("profile", False)),
+            formats=parse_formats(args.get("formats", ("docx",))),
+            reader=parse_reader(args.get("reader", "auto")),
+            sheets=parse_sheets(args.get("sheets", ()))
+        )
+
+    def with_ordering(self, ordering: str) -> "ReportOptions":
+        """
+        Returns a copy for one layout of the "All" ordering, which renders a vertical and a horizontal table.
+        :param ordering: "Vertical" or "Horizontal".
+        """
+        return replace(self, ordering=ordering)
+
+    def rendering(self) -> "ReportOptions":
+        """
+        Returns a copy with the options that don't change how a sheet is rendered reset, for comparing and
+        keying rendered output. The sheet selection is reset too: it decides which sheets are rendered, not how.
+        """
+        return replace(self, table_engine="XML", workers=1, cache_dir="", cache_size_mb=0, incremental=False,
+                       streaming=False, trace=False, profile=False, formats=("docx",), reader="auto",
+                       sheets=())
+
+    @property
+    def suffix(self) -> str:
+        """
+        Output file suffix for the ordering: _v, _h or _b (both).
+        """
+        return "_v" if self.ordering == "Vertical" else "_h" if self.ordering == "Horizontal" else "_b"
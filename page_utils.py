@@ -0,0 +1,167 @@
+from array import array
+from math import ceil
+from typing import Iterable, Iterator
+from helpers import PermutedColumn, SheetData, order_totals
+from options import ReportOptions
+
+# Page layout of python-docx's default template, in points: a Letter page with 1" top and bottom and 1.25"
+# side margins, 11pt body text spaced 1.15 lines with 10pt after each paragraph, and 14pt headings with 24pt
+# before them
+PAGE_HEIGHT = 648.0
+PAGE_WIDTH = 432.0
+BODY_FONT_SIZE = 11
+BODY_LINE_SPACING = 1.15
+PARAGRAPH_SPACING = 10.0
+HEADING_FONT_SIZE = 14
+HEADING_SPACING = 24.0
+# Height of a line of text relative to the font size, and the average width of a character
+LINE_HEIGHT = 1.2
+CHAR_WIDTH = 0.5
+# Cell margins on both sides of a table cell, and the borders and padding added to each table row
+CELL_MARGINS = 10.8
+ROW_PADDING = 1.0
+# The paragraph render_sheet adds before a sheet that starts a new page, as docx_utils.splice_fragments takes it
+PAGE_BREAK_XML = (b'<w:p xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                  b'<w:r><w:br w:type="page"/></w:r></w:p>')
+
+
+def table_chunks(content: SheetData, size: int) -> list[SheetData]:
+    """
+    Splits a sheet's table into continuation tables of at most size headers each (rows of a vertical
+    table, columns of a horizontal one). Every chunk keeps the subsets, so the subset row or column is
+    repeated, and its value columns are views of the sheet's.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData), ordered for the table.
+    :param size: Most headers per table, 0 for no limit.
+    :return: The chunks in order; just the content when it fits.
+    """
+    count = len(content.headers)
+    if size <= 0 or count <= size:
+        return [content]
+    chunks = []
+    for start in range(0, count, size):
+        order = list(range(start, min(start + size, count)))
+        chunks.append(SheetData(content.headers[start:start + size],
+                                [PermutedColumn(column, order) for column in content.values], content.subsets,
+                                array("B", content.header_kinds[start:start + size])))
+    return chunks
+
+
+def text_lines(text, width: float, font_size: float) -> int:
+    """
+    Estimates how many lines a text takes when wrapped to a width.
+    :param text: The text; None or anything else is shown as str() would.
+    :param width: Width available in points.
+    :param font_size: Font size in points.
+    """
+    per_line = max(1, int(width / (font_size * CHAR_WIDTH)))
+    return sum(max(1, ceil(len(line) / per_line)) for line in ("" if text is None else str(text)).split("\n"))
+
+
+def paragraph_height(text, font_size: float = BODY_FONT_SIZE) -> float:
+    """
+    Estimated height in points of a body paragraph, including the spacing after it.
+    """
+    lines = text_lines(text, PAGE_WIDTH, font_size)
+    return lines * font_size * LINE_HEIGHT * BODY_LINE_SPACING + PARAGRAPH_SPACING
+
+
+def row_height(texts, width: float, font_size: float) -> float:
+    """
+    Estimated height in points of a table row: its tallest cell.
+    :param texts: Text of each cell.
+    :param width: Width of each cell in points.
+    :param font_size: Font size of the table in points.
+    """
+    lines = max((text_lines(text, width - CELL_MARGINS, font_size) for text in texts), default=1)
+    return lines * font_size * LINE_HEIGHT + ROW_PADDING
+
+
+def vert_table_height(content: SheetData, font_size: float) -> float:
+    """
+    Estimated height in points of a vertical table: a row per header, under the subset row. The values are
+    short percentages, so a row is as tall as its header.
+    """
+    width = PAGE_WIDTH / (1 + len(content.values))
+    height = row_height(content.subsets, width, font_size) if content.subsets else 0.0
+    return height + sum(row_height((header,), width, font_size) for header in content.headers)
+
+
+def horiz_table_height(content: SheetData, font_size: float) -> float:
+    """
+    Estimated height in points of a horizontal table: the header row, as tall as its longest header, and a
+    row per value column.
+    """
+    width = PAGE_WIDTH / max(1, len(content.headers) + bool(content.subsets))
+    height = row_height(content.headers, width, font_size)
+    return height + sum(row_height(content.subsets[j + 1:j + 2] or ("",), width, font_size)
+                        for j in range(len(content.values)))
+
+
+def sheet_height(sheet_name: str, content: SheetData, pre_data: list, options: ReportOptions) -> float:
+    """
+    Estimated height in points of what render_sheet adds for a sheet: its heading, pre-data paragraphs and
+    tables, split as table_chunks splits them with a paragraph between continuation tables.
+    :param sheet_name: Name of the sheet, used as the heading.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData). It isn't modified.
+    :param pre_data: Pre-data content of the sheet.
+    :param options: Report options.
+    """
+    font_size = options.font_size if options.font_type else BODY_FONT_SIZE
+    height = HEADING_SPACING + text_lines(sheet_name, PAGE_WIDTH, HEADING_FONT_SIZE) * HEADING_FONT_SIZE * LINE_HEIGHT
+    height += sum(paragraph_height(line) for line in pre_data)
+    content = content.copy()
+    if options.total_position in ("Top", "Bottom"):
+        order_totals(content, options.total_position)
+    if options.ordering != "Horizontal":
+        chunks = table_chunks(content, options.max_table_rows)
+        height += sum(vert_table_height(chunk, font_size) for chunk in chunks)
+        height += (len(chunks) - 1) * paragraph_height("")
+        if options.ordering == "Vertical":
+            return height
+        # The "All" ordering separates its tables with a paragraph holding a line break
+        height += paragraph_height("\n")
+        if options.total_position != "Inline":
+            order_totals(content, "Top")
+    chunks = table_chunks(content, options.max_table_cols)
+    height += sum(horiz_table_height(chunk, font_size) for chunk in chunks)
+    return height + (len(chunks) - 1) * paragraph_height("")
+
+
+class Paginator:
+    """
+    Decides where page breaks go from the estimated height of each sheet (see sheet_height), in place of a
+    fixed number of sheets per page: a sheet starts a new page when it doesn't fit in what is left of the
+    current one. A sheet taller than a page runs on over the following pages. Sheets are placed in report
+    order, so the report is laid out the same however its sheets were rendered.
+    """
+
+    def __init__(self, page_height: float = PAGE_HEIGHT):
+        """
+        :param page_height: Height available on a page in points.
+        """
+        self.page_height = page_height
+        self.used = 0.0
+
+    def place(self, height: float) -> bool:
+        """
+        Places the next sheet.
+        :param height: Estimated height of the sheet in points.
+        :return: Whether a page break goes before the sheet.
+        """
+        page_break = self.used > 0 and self.used + height > self.page_height
+        if page_break:
+            self.used = 0.0
+        self.used = (self.used + height) % self.page_height
+        return page_break
+
+
+def paginate(fragments: Iterable[tuple[list[bytes], float]]) -> Iterator[list[bytes]]:
+    """
+    Adds the page breaks to sheet fragments rendered without them (see docx_utils.render_sheet_fragment),
+    so spliced fragments lay out like a report rendered in one go.
+    :param fragments: The fragment and estimated height of each sheet, in report order.
+    :return: The fragments, each one starting a new page beginning with a page break.
+    """
+    paginator = Paginator()
+    for fragment, height in fragments:
+        yield [PAGE_BREAK_XML, *fragment] if paginator.place(height) else fragment
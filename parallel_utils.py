@@ -0,0 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+from docx import Document
+from docx_utils import render_sheet_fragment
+from excel_utils import open_workbook, read_sheet, requested_columns, select_sheets
+from options import ReportOptions
+from page_utils import paginate
+from progress_utils import expect_sheets, sheet_done
+from stream_utils import save_fragments
+
+# Per-process state, set up once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(file_path: str, options: ReportOptions) -> None:
+    """
+    Opens the workbook and a scratch document once per worker process.
+    :param file_path: Absolute path to the Excel file.
+    :param options: Report options.
+    """
+    _WORKER["options"] = options
+    _WORKER["workbook"] = open_workbook(file_path, options.reader)
+    _WORKER["columns"] = requested_columns(options.extra_columns_flag, options.extra_columns)
+    _WORKER["document"] = Document()
+
+
+def _render_sheet(sheet_name: str) -> tuple[list[bytes], float]:
+    """
+    Parses one sheet and renders it to a document fragment inside a worker process.
+    :param sheet_name: Name of the sheet.
+    :return: Tuple of the fragment and the sheet's estimated height, see docx_utils.render_sheet_fragment.
+    """
+    options = _WORKER["options"]
+    content, pre_data = read_sheet(_WORKER["workbook"], sheet_name, _WORKER["columns"],
+                                   options.extra_columns_flag)
+    return render_sheet_fragment(_WORKER["document"], sheet_name, content, pre_data, options)
+
+
+def _collect(fragments: Iterable[tuple[list[bytes], float]],
+             sheet_names: list[str]) -> Iterator[tuple[list[bytes], float]]:
+    """
+    Passes the fragments and heights on in sheet order, reporting each sheet as done when its fragment arrives.
+    """
+    for sheet_name, fragment in zip(sheet_names, fragments):
+        sheet_done(sheet_name)
+        yield fragment
+
+
+def write_doc_parallel(file_path: str, output_path: str, options: ReportOptions, workers: int) -> None:
+    """
+    Generates the report with a pool of worker processes. Each worker parses sheets and renders them to
+    XML fragments, which are paginated and spliced into the document in sheet order, so the output matches
+    write_doc.
+    With options.streaming the fragments are written out as they arrive.
+    :param file_path: Absolute path to the Excel file.
+    :param output_path: Path to save the generated Word document.
+    :param options: Report options.
+    :param workers: Number of worker processes.
+    """
+    with open_workbook(file_path, options.reader) as workbook:
+        sheet_names = select_sheets(workbook.sheetnames, options.sheets)
+    expect_sheets(len(sheet_names))
+
+    chunksize = max(1, len(sheet_names) // (workers * 4))
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(file_path, options))
+    try:
+        fragments = executor.map(_render_sheet, sheet_names, chunksize=chunksize)
+        save_fragments(paginate(_collect(fragments, sheet_names)), output_path, options)
+    except BaseException:
+        # A cancelled or failed report drops the queued sheets and doesn't wait for the ones being rendered
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
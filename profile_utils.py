@@ -0,0 +1,190 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Iterator
+
+# The trace being recorded by the current report, if any. A context variable, so reports running in
+# different threads (or the service's event loop) never record into each other's trace.
+_TRACE = ContextVar("trace", default=None)
+# Returned by span() when nothing is being traced, so instrumented code costs one lookup
+NO_SPAN = nullcontext()
+
+
+def peak_rss() -> int | None:
+    """
+    Peak resident memory of this process in bytes, or None where it can't be read. On Linux the kernel's
+    high-water mark is used, since ru_maxrss can carry over the parent's peak through fork and exec.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class Trace:
+    """
+    Spans and counters recorded while one report is generated. Written as a Chrome trace event file, which
+    chrome://tracing and Perfetto display as a timeline, with the time spent per stage, the counters, the
+    caches' hit rates and the peak memory under "otherData".
+    """
+
+    def __init__(self, memory: bool = False):
+        """
+        :param memory: Also record how much each span raised the process's peak memory. Reading it costs
+            a few microseconds per span, so it is left to benchmarks.
+        """
+        self.origin = time.perf_counter()
+        self.memory = memory
+        self.events = []
+        self.counters = {}
+
+    def add_span(self, name: str, start: float, end: float, fields: dict) -> None:
+        """
+        Records a finished span.
+        :param name: Stage name.
+        :param start: perf_counter() at the start of the span.
+        :param end: perf_counter() at the end of the span.
+        :param fields: Details shown with the span, e.g. the sheet name.
+        """
+        self.events.append({
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": round((start - self.origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1), "args": fields
+        })
+
+    def stages(self) -> dict[str, dict[str, float]]:
+        """
+        Total time and number of calls of each stage, and with memory recording how much the stage raised
+        the peak memory. Nested stages are included in their parents' figures.
+        """
+        stages = {}
+        for event in self.events:
+            stage = stages.setdefault(event["name"], {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += event["dur"] / 1e6
+            stage["calls"] += 1
+            if "peak_rss_growth" in event["args"]:
+                stage["peak_rss_growth"] = stage.get("peak_rss_growth", 0) + event["args"]["peak_rss_growth"]
+        for stage in stages.values():
+            stage["seconds"] = round(stage["seconds"], 6)
+        return stages
+
+    def hit_rates(self) -> dict[str, float]:
+        """
+        Share of lookups that hit, of every cache counted as <name>_hits and <name>_misses, e.g. "cell_cache"
+        for the cells reused within the document (see xml_utils.CellCache).
+        """
+        rates = {}
+        for name, hits in self.counters.items():
+            if name.endswith("_hits"):
+                cache = name[:-len("_hits")]
+                lookups = hits + self.counters.get(cache + "_misses", 0)
+                if lookups:
+                    rates[cache] = round(hits / lookups, 4)
+        return rates
+
+    def write(self, path: str) -> None:
+        """
+        Saves the trace as JSON.
+        :param path: Path of the trace file.
+        """
+        trace = {
+            "traceEvents": self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"stages": self.stages(), "counters": self.counters, "hit_rates": self.hit_rates(),
+                          "peak_rss_bytes": peak_rss()}
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(trace, file, indent=1)
+
+
+class Span:
+    """
+    Times a block of code into the trace it was created for.
+    """
+    __slots__ = ("trace", "name", "fields", "start", "start_rss")
+
+    def __init__(self, trace: Trace, name: str, fields: dict):
+        self.trace = trace
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self) -> "Span":
+        if self.trace.memory:
+            self.start_rss = peak_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        end = time.perf_counter()
+        if self.trace.memory and self.start_rss is not None:
+            self.fields["peak_rss_growth"] = peak_rss() - self.start_rss
+        self.trace.add_span(self.name, self.start, end, self.fields)
+
+
+def span(name: str, **fields):
+    """
+    Context manager timing a stage of the report, e.g. `with span("render_sheet", sheet=sheet_name):`.
+    Does nothing unless a trace is being recorded.
+    :param name: Stage name.
+    :param fields: Details shown with the span.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        return NO_SPAN
+    return Span(trace, name, fields)
+
+
+def count(name: str, amount: int = 1) -> None:
+    """
+    Adds to a counter of the trace being recorded, if any.
+    :param name: Counter name, e.g. "rows".
+    :param amount: Amount to add.
+    """
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + amount
+
+
+@contextmanager
+def tracing(trace_path: str = "", profile_path: str = "", memory: bool = False) -> Iterator[Trace | None]:
+    """
+    Records the spans and counters of the code run inside the block and writes them to trace_path, and/or
+    runs it under cProfile and writes the statistics to profile_path (for pstats or snakeviz). With neither
+    path it does nothing. Worker processes started inside the block aren't traced.
+    :param trace_path: Path of the JSON trace, or "" for none.
+    :param profile_path: Path of the cProfile output, or "" for none.
+    :param memory: Record how much each span raised the peak memory (see Trace).
+    """
+    if not trace_path and not profile_path:
+        yield None
+        return
+
+    trace = Trace(memory)
+    token = _TRACE.set(trace)
+    profiler = None
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with Span(trace, "report", {}):
+            yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        _TRACE.reset(token)
+        if trace_path:
+            trace.write(trace_path)
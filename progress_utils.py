@@ -0,0 +1,99 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+# The progress of the report being generated in this thread, if anyone is watching it
+_PROGRESS = ContextVar("progress", default=None)
+
+
+class ReportCancelled(Exception):
+    """
+    Raised between sheets when the report being generated was cancelled. No output is written.
+    """
+
+
+class Progress:
+    """
+    Progress of one report, shared between the thread generating it and the thread showing it (e.g. the GUI).
+    The generating thread updates it through expect_sheets and sheet_done; any thread may cancel it.
+    """
+
+    def __init__(self, on_update: Callable[["Progress"], None] | None = None):
+        """
+        :param on_update: Called from the generating thread whenever the progress changes.
+        """
+        self.on_update = on_update
+        self.total = 0
+        self.done = 0
+        self.sheet_name = ""
+        self.started = time.perf_counter()
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """
+        Asks the report to stop once the sheet being generated is finished.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def eta(self) -> float | None:
+        """
+        Estimated seconds until the last sheet is done, from the average time per sheet so far.
+        """
+        if not self.done or not self.total:
+            return None
+        elapsed = time.perf_counter() - self.started
+        return elapsed / self.done * (self.total - self.done)
+
+    def update(self) -> None:
+        if self.on_update is not None:
+            self.on_update(self)
+
+
+@contextmanager
+def reporting(progress: Progress) -> Iterator[Progress]:
+    """
+    Reports the progress of the report generated inside the block to progress, and stops it with
+    ReportCancelled between sheets once progress is cancelled.
+    :param progress: Progress to update.
+    """
+    token = _PROGRESS.set(progress)
+    try:
+        yield progress
+    finally:
+        _PROGRESS.reset(token)
+
+
+def expect_sheets(total: int) -> None:
+    """
+    Sets the number of sheets of the report being generated, once the workbook's sheets are known.
+    :param total: Number of sheets.
+    """
+    progress = _PROGRESS.get()
+    if progress is None:
+        return
+    if progress.cancelled:
+        raise ReportCancelled()
+    progress.total = total
+    progress.started = time.perf_counter()
+    progress.update()
+
+
+def sheet_done(sheet_name: str = "") -> None:
+    """
+    Counts a finished sheet, then stops the report if it was cancelled.
+    :param sheet_name: Name of the sheet.
+    """
+    progress = _PROGRESS.get()
+    if progress is None:
+        return
+    progress.done += 1
+    progress.sheet_name = sheet_name
+    progress.update()
+    if progress.cancelled:
+        raise ReportCancelled()
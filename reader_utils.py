@@ -0,0 +1,526 @@
+import csv
+import importlib.util
+import io
+import mmap
+import os
+import re
+import stat
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator
+from warnings import warn
+from options import READERS as READER_NAMES
+from profile_utils import count
+
+# Parts of a worksheet's XML the fast .xlsx reader leaves to openpyxl: formulas, rich text, comments, CDATA,
+# processing instructions, elements with a namespace prefix and single-quoted attributes
+UNSUPPORTED_XML = re.compile(rb"<f[\s/>]|<r[\s>]|<rPh[\s>]|<!|<\?|<[A-Za-z_][\w.-]*:|=\s*'")
+XML_ENCODING = re.compile(rb"<\?xml[^>]*encoding=[\"']([^\"']+)")
+SPREADSHEET_NS = b'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+# A row's start tag, or a whole cell: the row's tag; the cell's leading r attribute, its column letters and its
+# other attributes; then a lone <v> value's text, a plain inline string or any other content
+ROW_OR_CELL = re.compile(rb"(<row\b[^>]*?)/?>|<c\b(\s+r=\"([A-Z]+)\d+\")?([^>]*?)"
+                         rb"(?:/>|>(?:<v>([^<]*)</v>|(<is><t>[^<]*</t></is>)|(.*?))</c>)", re.S)
+ATTRIBUTE = re.compile(rb"([\w:.-]+)\s*=\s*\"([^\"]*)\"")
+VALUE = re.compile(rb"<v\b[^>]*?(?:/>|>([^<]*)</v>)")
+INLINE_STRING = re.compile(rb"<is\b[^>]*>\s*(?:<t\b[^>]*?(?:/>|>([^<]*)</t>)\s*)?</is>")
+ENTITY = re.compile(r"&(#x[0-9a-fA-F]+|#[0-9]+|amp|lt|gt|quot|apos);")
+ENTITIES = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'"}
+# Leading bytes of a workbook read from memory: .xlsx and .xlsm files are zip packages, legacy .xls files OLE2
+# compound files
+ZIP_SIGNATURE = b"PK\x03\x04"
+OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+CSV_NUMBER = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+DIGITS = re.compile(r"(\d+)")
+
+
+class WorkbookReader:
+    """
+    Reader backend: opens one workbook and reads the first columns of its sheets row by row, giving every
+    row as the tuple of cell values openpyxl's iter_rows(values_only=True) would, so all backends produce
+    the same sheets (see excel_utils.read_sheet). open_workbook picks the backend. Used as a context manager
+    or closed with close().
+    """
+    name = ""
+    # Package a backend needs beyond the report's own dependencies
+    requires = ""
+
+    def __init__(self, file_path: str | BinaryIO):
+        """
+        :param file_path: Path of the workbook, or the workbook as a seekable binary file (see workbook_file).
+        """
+        self.file_path = file_path
+        self.sheetnames = []
+
+    @staticmethod
+    def accepts(file_path: str | BinaryIO) -> bool:
+        """
+        Whether the backend reads this kind of workbook.
+        :param file_path: Path of the workbook, or the workbook as a seekable binary file.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def available(cls) -> bool:
+        """
+        Whether the backend's dependencies are installed.
+        """
+        return not cls.requires or importlib.util.find_spec(cls.requires) is not None
+
+    def rows(self, sheet_name: str, num_cols: int) -> Iterable[tuple]:
+        """
+        Reads a sheet row by row.
+        :param sheet_name: Name of the sheet.
+        :param num_cols: Number of columns to read, from column A.
+        :return: Every row from the first, as a tuple of num_cols cell values, None for empty cells.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Releases the workbook.
+        """
+
+    def __enter__(self) -> "WorkbookReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class OpenpyxlReader(WorkbookReader):
+    """
+    Reads .xlsx workbooks with openpyxl in read-only (streaming) mode, which only reads a sheet as its rows
+    are iterated.
+    """
+    name = "openpyxl"
+
+    def __init__(self, file_path: str | BinaryIO):
+        super().__init__(file_path)
+        import openpyxl
+        self.workbook = openpyxl.load_workbook(file_path, read_only=True)
+        self.sheetnames = self.workbook.sheetnames
+
+    @staticmethod
+    def accepts(file_path: str | BinaryIO) -> bool:
+        return workbook_extension(file_path) in (".xlsx", ".xlsm")
+
+    def rows(self, sheet_name: str, num_cols: int) -> Iterable[tuple]:
+        return self.workbook[sheet_name].iter_rows(min_col=1, max_col=num_cols, values_only=True)
+
+    def close(self) -> None:
+        # Read-only workbooks keep the archive open until closed
+        self.workbook.close()
+
+
+class FastXlsxReader(OpenpyxlReader):
+    """
+    Reads .xlsx workbooks like OpenpyxlReader, but scans each worksheet's XML for its cells directly instead
+    of building an element per cell. openpyxl still reads the workbook structure, shared strings, date
+    styles and sheet dimensions, and the cell values are converted the way it converts them. A sheet using
+    anything the scan doesn't handle (formulas, rich text, namespace prefixes, ...) is read by openpyxl.
+    """
+    name = "xlsx"
+
+    def rows(self, sheet_name: str, num_cols: int) -> Iterable[tuple]:
+        sheet = self.workbook[sheet_name]
+        xml = self.workbook._archive.read(sheet._worksheet_path)
+        start = xml.find(b"<sheetData")
+        encoding = XML_ENCODING.match(xml)
+        end = xml.find(b"</sheetData>", start)
+        if (start < 0 or SPREADSHEET_NS not in xml[:start] or b"<!" in xml[:start]
+                or (encoding and encoding.group(1).lower() not in (b"utf-8", b"utf8"))
+                or UNSUPPORTED_XML.search(xml, start + 1, end if end >= 0 else len(xml))):
+            count("reader_fallbacks")
+            return super().rows(sheet_name, num_cols)
+        return self.scan(xml[start:end] if end >= 0 else b"", sheet, num_cols)
+
+    def scan(self, sheet_data: bytes, sheet, num_cols: int) -> Iterator[tuple]:
+        """
+        Reads the rows of a worksheet's <sheetData>, filling in missing rows and stopping at the sheet's
+        dimension like openpyxl's read-only worksheets.
+        :param sheet_data: The <sheetData> element's XML.
+        :param sheet: The openpyxl read-only worksheet.
+        :param num_cols: Number of columns to read.
+        """
+        max_row = sheet.max_row
+        empty_row = (None,) * num_cols
+        counter = row_index = 1
+        for row_index, values in self.parse_rows(sheet_data, sheet, num_cols):
+            if max_row is not None and row_index > max_row:
+                break
+            for _ in range(counter, row_index):
+                counter += 1
+                yield empty_row
+            if counter <= row_index:
+                counter += 1
+                yield tuple(values)
+        if max_row is not None and max_row < row_index:
+            for _ in range(counter, max_row + 1):
+                yield empty_row
+
+    def parse_rows(self, sheet_data: bytes, sheet, num_cols: int) -> Iterator[tuple[int, list]]:
+        """
+        Parses every <row> of a worksheet's <sheetData> in one scan of its rows and cells.
+        :return: Iterator of the row number and the values of its first num_cols cells, as in the XML: rows
+            may be missing, repeated or out of order.
+        """
+        workbook = self.workbook
+        shared_strings, epoch = sheet._shared_strings, workbook.epoch
+        date_formats, timedelta_formats = workbook._date_formats, workbook._timedelta_formats
+        columns = {}
+        # Type and style of the few distinct attribute lists left once the cell reference is taken out
+        kinds = {}
+        values = None
+        row_index = column = 0
+        for row_tag, reference, letters, rest, value, inline, content in ROW_OR_CELL.findall(sheet_data):
+            if row_tag:
+                if values is not None:
+                    yield row_index, values
+                number = dict(ATTRIBUTE.findall(row_tag)).get(b"r")
+                row_index = row_number(number) if number is not None else row_index + 1
+                values = [None] * num_cols
+                column = 0
+                continue
+            kind = kinds.get(rest)
+            if kind is None:
+                attributes = dict(ATTRIBUTE.findall(rest))
+                if b"r" in attributes:
+                    letters = attributes[b"r"].rstrip(b"0123456789")
+                else:
+                    kind = kinds[rest] = attributes.get(b"t", b"n"), style_id(attributes)
+            if letters:
+                column = columns.get(letters)
+                if column is None:
+                    column = columns[letters] = column_index(letters)
+            else:
+                column += 1
+            if column > num_cols or values is None:
+                continue
+            data_type, style = kind or (attributes.get(b"t", b"n"), style_id(attributes))
+            if value and data_type == b"n" and style not in date_formats:
+                value = value.decode()
+                values[column - 1] = float(value) if "." in value or "E" in value or "e" in value else int(value)
+            elif value and data_type == b"s":
+                values[column - 1] = shared_strings[int(value)]
+            elif inline and data_type == b"inlineStr":
+                values[column - 1] = xml_text(inline[7:-9])
+            else:
+                content = b"<v>" + value + b"</v>" if value else inline or content
+                values[column - 1] = cell_value(content, dict(ATTRIBUTE.findall(reference + rest)), shared_strings,
+                                                epoch, date_formats, timedelta_formats)
+        if values is not None:
+            yield row_index, values
+
+
+class XlsReader(WorkbookReader):
+    """
+    Reads legacy .xls workbooks with xlrd, loading one sheet at a time. Whole numbers come back as ints and
+    dates as datetimes, as openpyxl reads them from .xlsx. xlrd takes a workbook from memory as bytes, so a
+    binary file is read in whole.
+    """
+    name = "xls"
+    requires = "xlrd"
+
+    def __init__(self, file_path: str | BinaryIO):
+        super().__init__(file_path)
+        import xlrd
+        if isinstance(file_path, str):
+            self.book = xlrd.open_workbook(file_path, on_demand=True)
+        else:
+            file_path.seek(0)
+            self.book = xlrd.open_workbook(file_contents=file_path.read(), on_demand=True)
+        self.sheetnames = self.book.sheet_names()
+
+    @staticmethod
+    def accepts(file_path: str | BinaryIO) -> bool:
+        return workbook_extension(file_path) == ".xls"
+
+    def rows(self, sheet_name: str, num_cols: int) -> Iterator[tuple]:
+        from xlrd import XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_ERROR, XL_CELL_NUMBER, XL_CELL_TEXT
+        from xlrd.biffh import error_text_from_code
+        from xlrd.xldate import XLDateError, xldate_as_datetime
+
+        sheet = self.book.sheet_by_name(sheet_name)
+        try:
+            for index in range(sheet.nrows):
+                values = [None] * num_cols
+                for column, cell in enumerate(sheet.row_slice(index, 0, min(num_cols, sheet.row_len(index)))):
+                    if cell.ctype == XL_CELL_TEXT:
+                        values[column] = cell.value
+                    elif cell.ctype == XL_CELL_NUMBER:
+                        values[column] = int(cell.value) if cell.value.is_integer() else cell.value
+                    elif cell.ctype == XL_CELL_DATE:
+                        try:
+                            values[column] = xldate_as_datetime(cell.value, self.book.datemode)
+                        except (XLDateError, OverflowError, ValueError):
+                            values[column] = "#VALUE!"
+                    elif cell.ctype == XL_CELL_BOOLEAN:
+                        values[column] = bool(cell.value)
+                    elif cell.ctype == XL_CELL_ERROR:
+                        values[column] = error_text_from_code.get(cell.value)
+                yield tuple(values)
+        finally:
+            self.book.unload_sheet(sheet_name)
+
+    def close(self) -> None:
+        self.book.release_resources()
+
+
+class CsvDirectoryReader(WorkbookReader):
+    """
+    Reads a directory of CSV files as a workbook, one sheet per file named after it, in file name order
+    (see csv_sheets). Numbers are converted like openpyxl converts them and empty fields are empty cells.
+    """
+    name = "csv"
+
+    def __init__(self, file_path: str):
+        super().__init__(file_path)
+        self.paths = csv_sheets(file_path)
+        self.sheetnames = list(self.paths)
+
+    @staticmethod
+    def accepts(file_path: str | BinaryIO) -> bool:
+        return isinstance(file_path, str) and os.path.isdir(file_path)
+
+    def rows(self, sheet_name: str, num_cols: int) -> Iterator[tuple]:
+        with open(self.paths[sheet_name], newline="", encoding="utf-8-sig") as file:
+            for row in csv.reader(file):
+                values = [csv_value(field) for field in row[:num_cols]]
+                values.extend([None] * (num_cols - len(values)))
+                yield tuple(values)
+
+
+# Backends by name, fastest first: open_workbook picks the first one that reads the file and is installed
+READERS = {reader.name: reader for reader in (FastXlsxReader, OpenpyxlReader, XlsReader, CsvDirectoryReader)}
+assert tuple(READERS) == READER_NAMES
+
+
+def reader_for(file_path: str | BinaryIO, name: str = "auto") -> type[WorkbookReader]:
+    """
+    Chooses the backend for a workbook.
+    :param file_path: Path of the workbook, or of a directory of CSV files, or the workbook as a seekable
+        binary file.
+    :param name: A key of READERS, or "auto" for the fastest installed backend that reads the file.
+    :raises ValueError: If no backend reads the file, the chosen one doesn't, or its dependency is missing.
+    """
+    label = file_path if isinstance(file_path, str) else "the workbook"
+    if name != "auto":
+        reader = READERS[name]
+        if not reader.accepts(file_path):
+            raise ValueError(f"The {name} reader can't read {label}")
+        candidates = [reader]
+    else:
+        candidates = [reader for reader in READERS.values() if reader.accepts(file_path)]
+        if not candidates:
+            raise ValueError(f"Invalid input file: {label}")
+    for reader in candidates:
+        if reader.available():
+            return reader
+    raise ValueError(f"Reading {label} needs {candidates[0].requires} (pip install {candidates[0].requires})")
+
+
+def workbook_extension(file_path: str | BinaryIO) -> str:
+    """
+    The kind of workbook a path or file holds, as its lowercase file extension. A file read from memory has
+    no name, so its leading bytes decide: ".xlsx" for a zip package and ".xls" for an OLE2 compound file.
+    :param file_path: Path of the workbook, or the workbook as a seekable binary file.
+    :return: The extension, or "" for a file that is neither.
+    """
+    if isinstance(file_path, str):
+        return os.path.splitext(file_path)[1].lower()
+    position = file_path.tell()
+    file_path.seek(0)
+    head = file_path.read(len(OLE2_SIGNATURE))
+    file_path.seek(position)
+    return ".xlsx" if head.startswith(ZIP_SIGNATURE) else ".xls" if head == OLE2_SIGNATURE else ""
+
+
+class BufferFile(io.RawIOBase):
+    """
+    Read-only, seekable binary file over a buffer (bytearray, memoryview, mmap, ...), which reads the buffer in
+    place where io.BytesIO would copy it first. The buffer must not change while the file is open.
+    """
+
+    def __init__(self, buffer):
+        """
+        :param buffer: Object supporting the buffer protocol.
+        """
+        super().__init__()
+        self.buffer = memoryview(buffer).cast("B")
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        data = self.buffer[self.position:self.position + len(target)]
+        size = len(data)
+        target[:size] = data
+        self.position += size
+        return size
+
+    def readall(self) -> bytes:
+        data = self.buffer[self.position:].tobytes()
+        self.position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = (0, self.position, len(self.buffer))[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self) -> None:
+        if not self.closed:
+            self.buffer.release()
+        super().close()
+
+
+@contextmanager
+def workbook_file(workbook) -> Iterator[BinaryIO]:
+    """
+    Presents a workbook held in memory as the seekable binary file the backends read, without copying it where
+    possible: bytes are wrapped as they are and other buffers read in place (see BufferFile). A file object
+    backed by a file on disk is memory-mapped, so its pages are only loaded as the workbook's parts are read.
+    Other seekable file objects are used as they are, and anything else is read in first.
+    :param workbook: The .xlsx, .xlsm or .xls file's contents as bytes or another buffer, or a binary file object.
+    """
+    if isinstance(workbook, bytes):
+        yield io.BytesIO(workbook)
+        return
+    try:
+        buffer = memoryview(workbook)
+    except TypeError:
+        buffer = None
+    if buffer is not None:
+        with buffer, BufferFile(buffer) as file:
+            yield file
+        return
+    try:
+        descriptor = workbook.fileno()
+        mappable = stat.S_ISREG(os.fstat(descriptor).st_mode) and os.fstat(descriptor).st_size > 0
+    except (AttributeError, OSError, ValueError):
+        mappable = False
+    if mappable:
+        with mmap.mmap(descriptor, 0, access=mmap.ACCESS_READ) as mapping:
+            with BufferFile(mapping) as file:
+                yield file
+    elif workbook.seekable():
+        yield workbook
+    else:
+        yield io.BytesIO(workbook.read())
+
+
+def csv_sheets(directory: str) -> dict[str, str]:
+    """
+    The sheets of a directory read as a workbook: every .csv file in it, named after the file without its
+    extension, in natural order (Table 2.csv before Table 10.csv).
+    :param directory: Path of the directory.
+    :return: Path of each sheet's file by sheet name.
+    """
+    names = sorted((name for name in os.listdir(directory)
+                    if name.lower().endswith(".csv") and os.path.isfile(os.path.join(directory, name))),
+                   key=lambda name: [int(part) if part.isdigit() else part.lower() for part in DIGITS.split(name)])
+    return {os.path.splitext(name)[0]: os.path.join(directory, name) for name in names}
+
+
+def csv_value(field: str):
+    """
+    Converts a CSV field to a cell value: None when empty, an int or float for a number, the text otherwise.
+    """
+    if not field:
+        return None
+    if CSV_NUMBER.fullmatch(field):
+        return float(field) if "." in field or "e" in field or "E" in field else int(field)
+    return field
+
+
+def style_id(attributes: dict[bytes, bytes]) -> int | None:
+    """
+    A cell's style id as openpyxl reads it: 0 without an s attribute, None (no style) when it is empty.
+    """
+    style = attributes.get(b"s")
+    return int(style) if style else 0 if style is None else None
+
+
+def row_number(value: bytes) -> int:
+    """
+    Parses a row's r attribute, which some writers give as a float.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{value.decode()} is not a valid row number")
+        return int(number)
+
+
+def column_index(letters: bytes) -> int:
+    """
+    The 1-based index of a column from its letters, e.g. 1 for A and 28 for AB.
+    """
+    from openpyxl.utils import column_index_from_string
+    return column_index_from_string(letters.decode())
+
+
+def xml_text(raw: bytes) -> str:
+    """
+    Decodes the character data of an element: line ends are normalized as an XML parser does, then
+    character and predefined entity references are replaced.
+    """
+    text = raw.decode("utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if "&" in text:
+        text = ENTITY.sub(lambda match: ENTITIES.get(match.group(1)) or chr(
+            int(match.group(1)[2:], 16) if match.group(1)[1] == "x" else int(match.group(1)[1:])), text)
+    return text
+
+
+def cell_value(content: bytes, attributes: dict[bytes, bytes], shared_strings, epoch, date_formats,
+               timedelta_formats):
+    """
+    Converts one cell the way openpyxl's worksheet parser does.
+    :param content: The XML inside the <c> element.
+    :param attributes: The cell's attributes.
+    :param shared_strings: The workbook's shared strings.
+    :param epoch: The workbook's date epoch.
+    :param date_formats: Style ids formatted as dates.
+    :param timedelta_formats: Style ids formatted as durations.
+    """
+    from openpyxl.utils.datetime import from_excel, from_ISO8601
+
+    data_type = attributes.get(b"t", b"n")
+    if data_type == b"inlineStr":
+        inline = INLINE_STRING.search(content)
+        return xml_text(inline.group(1) or b"") if inline is not None else None
+    value = VALUE.search(content)
+    value = value.group(1) if value is not None else None
+    if not value:
+        return None
+    if data_type == b"n":
+        value = value.decode()
+        value = float(value) if "." in value or "E" in value or "e" in value else int(value)
+        style = style_id(attributes)
+        if style in date_formats:
+            try:
+                return from_excel(value, epoch, timedelta=style in timedelta_formats)
+            except (OverflowError, ValueError):
+                coordinate = attributes.get(b"r", b"").decode()
+                warn(f"Cell {coordinate} is marked as a date but the serial value {value} is outside the limits "
+                     f"for dates. The cell will be treated as an error.")
+                return "#VALUE!"
+        return value
+    if data_type == b"s":
+        return shared_strings[int(value)]
+    if data_type == b"b":
+        return bool(int(value))
+    if data_type == b"d":
+        return from_ISO8601(xml_text(value))
+    return xml_text(value)
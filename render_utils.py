@@ -0,0 +1,362 @@
+import csv
+import html
+import io
+import os
+import re
+import tempfile
+from contextlib import ExitStack
+from typing import BinaryIO, Iterable
+from docx import Document
+from docx_utils import render_sheet
+from helpers import SheetData, order_totals
+from options import ReportOptions
+from page_utils import Paginator, sheet_height, table_chunks
+from profile_utils import span
+from progress_utils import sheet_done
+from stream_utils import DocumentStream
+from xml_utils import ALIGN, TEXT, TOTAL, add_report_styles, horiz_table_layout, vert_table_layout
+
+CSS_UNSAFE = re.compile(r'["\\<>]')
+MARKDOWN_SPECIAL = re.compile(r"[\\|*_`]")
+MARKDOWN_ALIGNMENT = {"left": ":---", "right": "---:", "center": ":---:", None: "---"}
+
+
+def sheet_tables(content: SheetData, options: ReportOptions) -> list[tuple[list[list[list]], int]]:
+    """
+    The styled cell layouts of a sheet's tables, in the order and with the totals placed as render_sheet
+    puts them in the .docx: one table for the vertical and horizontal orderings, both for "All", each split
+    into its continuation tables (see page_utils.table_chunks).
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData). It isn't modified.
+    :param options: Report options.
+    :return: The cell layout (see xml_utils.vert_table_cells) and number of columns of each table.
+    """
+    content = content.copy()
+    if options.total_position in ("Top", "Bottom"):
+        order_totals(content, options.total_position)
+    tables = []
+    if options.ordering != "Horizontal":
+        for chunk in table_chunks(content, options.max_table_rows):
+            rows, num_cols, _ = vert_table_layout(chunk, options)
+            tables.append((rows, num_cols))
+        if options.ordering == "Vertical":
+            return tables
+        if options.total_position != "Inline":
+            order_totals(content, "Top")
+    for chunk in table_chunks(content, options.max_table_cols):
+        rows, num_cols, _ = horiz_table_layout(chunk, options)
+        tables.append((rows, num_cols))
+    return tables
+
+
+class Renderer:
+    """
+    Output backend turning parsed sheets (see excel_utils.iter_workbook) into one report file. Sheets are
+    added one at a time in workbook order. Used as a context manager: the report is written to a temporary
+    file next to output_path and only replaces it once complete, so a failed or cancelled report leaves any
+    earlier one in place. Given a stream instead, the report is written straight into it.
+    """
+    format = ""
+
+    def __init__(self, output_path: str | BinaryIO, options: ReportOptions):
+        """
+        :param output_path: Path to save the report, or a writable binary stream, which is left open.
+        :param options: Report options.
+        """
+        self.output_path = output_path
+        self.options = options
+        if isinstance(output_path, str):
+            fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)),
+                                                  suffix=os.path.splitext(output_path)[1])
+            os.close(fd)
+        else:
+            self.temp_path = None
+
+    def add_sheet(self, sheet_name: str, content: SheetData, pre_data: list[str], page_break: bool) -> None:
+        """
+        Adds one sheet to the report.
+        :param sheet_name: Name of the sheet, used as the heading.
+        :param content: The sheet's headers, values and subsets (see helpers.SheetData); may be reordered.
+        :param pre_data: Pre-data content of the sheet.
+        :param page_break: Whether the sheet starts a new page, from page_utils.Paginator.
+        """
+        raise NotImplementedError
+
+    def save(self) -> None:
+        """
+        Finishes the report in the temporary file.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Finishes the report and moves it to output_path.
+        """
+        self.save()
+        if self.temp_path is not None:
+            os.replace(self.temp_path, self.output_path)
+
+    def discard(self) -> None:
+        """
+        Abandons the report, removing the temporary file.
+        """
+        if self.temp_path is not None and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    @property
+    def target(self) -> str | BinaryIO:
+        """
+        Where the report is written until it is complete: the temporary file, or the stream.
+        """
+        return self.temp_path or self.output_path
+
+    @property
+    def title(self) -> str:
+        """
+        Name of the report, from the output file's name; "report" for a stream.
+        """
+        if isinstance(self.output_path, str):
+            return os.path.splitext(os.path.basename(self.output_path))[0]
+        return "report"
+
+    def __enter__(self) -> "Renderer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.discard()
+            return
+        try:
+            self.close()
+        except BaseException:
+            self.discard()
+            raise
+
+
+class DocxRenderer(Renderer):
+    """
+    The Word report write_sheets produces, streamed into the file sheet by sheet with options.streaming.
+    """
+    format = "docx"
+
+    def __init__(self, output_path: str | BinaryIO, options: ReportOptions):
+        super().__init__(output_path, options)
+        if options.streaming:
+            self.stream = DocumentStream(self.target)
+            self.document = self.stream.document
+        else:
+            self.stream = None
+            self.document = Document()
+        add_report_styles(self.document, options)
+
+    def add_sheet(self, sheet_name: str, content: SheetData, pre_data: list[str], page_break: bool) -> None:
+        render_sheet(self.document, sheet_name, content, pre_data, page_break, self.options)
+        if self.stream is not None:
+            self.stream.flush()
+
+    def save(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            return
+        with span("save"):
+            self.document.save(self.target)
+
+    def discard(self) -> None:
+        if self.stream is not None:
+            self.stream.discard()
+        super().discard()
+
+
+class TextRenderer(Renderer):
+    """
+    Base of the text backends, which write each sheet out as soon as it is added, so memory doesn't grow
+    with the workbook.
+    """
+
+    def __init__(self, output_path: str | BinaryIO, options: ReportOptions):
+        super().__init__(output_path, options)
+        if self.temp_path is not None:
+            self.file = open(self.temp_path, "w", encoding="utf-8", newline="")
+        else:
+            self.file = io.TextIOWrapper(output_path, encoding="utf-8", newline="")
+        self.begin()
+
+    def begin(self) -> None:
+        """
+        Writes what comes before the first sheet.
+        """
+
+    def end(self) -> None:
+        """
+        Writes what comes after the last sheet.
+        """
+
+    def write_sheet(self, sheet_name: str, pre_data: list[str], tables: list[tuple[list[list[list]], int]],
+                    page_break: bool) -> None:
+        """
+        Writes one sheet.
+        :param sheet_name: Name of the sheet.
+        :param pre_data: Pre-data content of the sheet.
+        :param tables: The sheet's tables, from sheet_tables.
+        :param page_break: Whether the sheet starts a new page in the .docx.
+        """
+        raise NotImplementedError
+
+    def add_sheet(self, sheet_name: str, content: SheetData, pre_data: list[str], page_break: bool) -> None:
+        with span("render_" + self.format, sheet=sheet_name):
+            pre_data = ["" if line is None else str(line) for line in pre_data]
+            self.write_sheet(sheet_name, pre_data, sheet_tables(content, self.options), page_break)
+
+    def save(self) -> None:
+        self.end()
+        self.release()
+
+    def discard(self) -> None:
+        self.release()
+        super().discard()
+
+    def release(self) -> None:
+        """
+        Closes the temporary file, or flushes the text written to a stream and leaves the stream open.
+        """
+        if self.temp_path is not None:
+            self.file.close()
+        elif not self.file.closed:
+            self.file.flush()
+            self.file.detach()
+
+
+class HtmlRenderer(TextRenderer):
+    """
+    A standalone HTML page with the report's headings, pre-data and tables, styled from the options.
+    """
+    format = "html"
+
+    def begin(self) -> None:
+        options = self.options
+        # <style> content isn't unescaped, so characters that could end the string or the element are dropped
+        font = f'font-family: "{CSS_UNSAFE.sub("", options.font_type)}"; ' if options.font_type else ""
+        border = "1px solid #000" if options.gridlines else "none"
+        if options.total_position == "Inline":
+            total = "font-weight: bold; text-decoration: underline;"
+        else:
+            total = "font-weight: bold; font-style: italic;"
+        title = html.escape(self.title)
+        self.file.write(
+            f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n<style>\n'
+            f"body {{ {font}font-size: {options.font_size}pt; }}\n"
+            f"table {{ border-collapse: collapse; margin: 0 0 1em; }}\n"
+            f"td {{ border: {border}; padding: 0 0.4em; }}\n"
+            f"td.total {{ {total} }}\n"
+            f".page-break {{ break-after: page; }}\n"
+            f"</style>\n</head>\n<body>\n"
+        )
+
+    def end(self) -> None:
+        self.file.write("</body>\n</html>\n")
+
+    def write_sheet(self, sheet_name: str, pre_data: list[str], tables: list[tuple[list[list[list]], int]],
+                    page_break: bool) -> None:
+        parts = ['<div class="page-break"></div>\n'] if page_break else []
+        parts.append(f"<h1>{html.escape(sheet_name)}</h1>\n")
+        parts.extend(f"<p>{html_text(line)}</p>\n" for line in pre_data)
+        for rows, _ in tables:
+            parts.append("<table>\n")
+            for row in rows:
+                parts.append("<tr>")
+                for cell in row:
+                    attributes = ' class="total"' if cell[TOTAL] else ""
+                    if cell[ALIGN]:
+                        attributes += f' style="text-align: {cell[ALIGN]}"'
+                    parts.append(f"<td{attributes}>{html_text(cell[TEXT] or '')}</td>")
+                parts.append("</tr>\n")
+            parts.append("</table>\n")
+        self.file.write("".join(parts))
+
+
+class CsvRenderer(TextRenderer):
+    """
+    Every sheet's name, pre-data and table rows in one CSV file, with a blank row after each table.
+    """
+    format = "csv"
+
+    def begin(self) -> None:
+        self.writer = csv.writer(self.file)
+
+    def write_sheet(self, sheet_name: str, pre_data: list[str], tables: list[tuple[list[list[list]], int]],
+                    page_break: bool) -> None:
+        self.writer.writerow([sheet_name])
+        self.writer.writerows([line] for line in pre_data)
+        for rows, _ in tables:
+            self.writer.writerows([cell[TEXT] or "" for cell in row] for row in rows)
+            self.writer.writerow([])
+
+
+class MarkdownRenderer(TextRenderer):
+    """
+    Every sheet as a level 1 heading, its pre-data as paragraphs and its tables as pipe tables. Markdown
+    tables need a header row, so a table's first row is used as one. Totals are shown in bold.
+    """
+    format = "md"
+
+    def write_sheet(self, sheet_name: str, pre_data: list[str], tables: list[tuple[list[list[list]], int]],
+                    page_break: bool) -> None:
+        parts = [f"# {markdown_text(sheet_name)}\n\n"]
+        parts.extend(f"{markdown_text(line)}\n\n" for line in pre_data if line.strip())
+        for rows, num_cols in tables:
+            if not rows or not num_cols:
+                continue
+            alignments = [next((row[col][ALIGN] for row in rows[1:] if row[col][ALIGN]), None)
+                          for col in range(num_cols)]
+            lines = [markdown_row(rows[0]), "| " + " | ".join(MARKDOWN_ALIGNMENT[align] for align in alignments) + " |"]
+            lines.extend(markdown_row(row) for row in rows[1:])
+            parts.append("\n".join(lines) + "\n\n")
+        self.file.write("".join(parts))
+
+
+def html_text(text: str) -> str:
+    """
+    Escapes text for HTML, keeping its line breaks.
+    """
+    return html.escape(text).replace("\r\n", "<br>").replace("\n", "<br>").replace("\r", "<br>")
+
+
+def markdown_text(text: str) -> str:
+    """
+    Escapes text for a Markdown paragraph or table cell: pipes and emphasis characters are escaped and line
+    breaks become <br>.
+    """
+    return MARKDOWN_SPECIAL.sub(r"\\\g<0>", text).replace("\r\n", "<br>").replace("\n", "<br>").replace("\r", "<br>")
+
+
+def markdown_row(row: list[list]) -> str:
+    """
+    Formats a row of cells as a pipe table row, with totals in bold.
+    """
+    cells = []
+    for cell in row:
+        text = markdown_text(cell[TEXT] or "").strip()
+        cells.append(f"**{text}**" if cell[TOTAL] and text else text)
+    return "| " + " | ".join(cells) + " |"
+
+
+RENDERERS = {renderer.format: renderer for renderer in (DocxRenderer, HtmlRenderer, CsvRenderer, MarkdownRenderer)}
+
+
+def write_formats(sheets: Iterable[tuple[str, SheetData, list[str]]], outputs: dict[str, str | BinaryIO],
+                  options: ReportOptions) -> None:
+    """
+    Writes the report in several formats from a single read of the workbook: each sheet is parsed once and
+    passed to every backend before the next one is read.
+    :param sheets: Sheet name, data and pre-data of each sheet, in workbook order.
+    :param outputs: Output path, or writable binary stream, by format (keys of options.FORMATS).
+    :param options: Report options.
+    """
+    with ExitStack() as stack:
+        renderers = [stack.enter_context(RENDERERS[name](path, options)) for name, path in outputs.items()]
+        paginator = Paginator()
+        for sheet_name, content, pre_data in sheets:
+            page_break = paginator.place(sheet_height(sheet_name, content, pre_data, options))
+            for renderer in renderers:
+                # render_sheet reorders the content it is given, so each backend gets its own copy
+                renderer.add_sheet(sheet_name, content.copy(), pre_data, page_break)
+            sheet_done(sheet_name)
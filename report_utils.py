@@ -1,21 +1,127 @@
-from docx_utils import write_doc
-from excel_utils import read_excel, get_question_data
+import os
+from dataclasses import replace
+from typing import BinaryIO
+from options import FORMATS, WORKBOOK_EXTENSIONS, ReportOptions
+from profile_utils import tracing
 
-def run_report(file_path: str, args: dict[str, str]) -> None:
+# The report pipeline is imported by run_report rather than here: python-docx, openpyxl and lxml take a good
+# part of a second to import, which the GUI would otherwise spend before showing its window and the CLI before
+# even parsing its arguments. Each write path imports only the modules it uses.
+
+
+def preload() -> None:
+    """
+    Imports the report pipeline and loads python-docx's default template, so the first report doesn't wait
+    for them. The GUI calls it on a background thread while the user picks options, and the report service
+    in each worker process.
+    """
+    import cache_utils  # noqa: F401
+    import docx_utils  # noqa: F401
+    import excel_utils  # noqa: F401
+    import incremental_utils  # noqa: F401
+    import parallel_utils  # noqa: F401
+    import render_utils  # noqa: F401
+    import stream_utils  # noqa: F401
+    from docx import Document
+    Document()
+
+
+def run_report(file_path: str, args: dict[str, str] | ReportOptions) -> str:
     """
     Runs the report generation process by reading the Excel file, extracting data,
     and writing it to a Word document.
-    :param file_path: Absolute path to the Excel file.
-    :param args: Dictionary containing report options such as total position, font type, font size, and custom title.
-    """
-    suffix = "_v" if args.get("ordering") == "Vertical" else "_h" if args.get("ordering") == "Horizontal" else "_b"
-    excel_data = read_excel(file_path, args.get("extra_columns_flag", False), int(args.get("extra_columns", 0)))
-    if file_path.lower().endswith('.xlsx'):
-        output_file_path = file_path[:-5] + suffix + ".docx"
-    elif file_path.lower().endswith('.xls'):
-        output_file_path = file_path[:-4] + suffix + ".docx"
+    :param file_path: Absolute path to the Excel file (.xlsx, .xlsm or .xls), or to a directory of CSV files, one
+        per sheet; the report is written next to it (survey/ gives survey_b.docx).
+    :param args: Dictionary containing report options such as total position, font type, font size, and custom title,
+        or the equivalent ReportOptions. Setting "workers" above 1 parses and renders the sheets in that many processes.
+        Setting "cache_dir" reuses parsed sheets and rendered tables from earlier runs kept in that directory; the
+        cached path runs in this process, so "workers" is ignored with it.
+        Setting "incremental" updates an existing report in place, re-rendering only the sheets that changed.
+        Setting "streaming" writes each sheet to the file as soon as it is rendered, keeping memory flat for very
+        large workbooks; it combines with "workers" and "cache_dir".
+        Setting "trace" writes the time spent in each stage and sheet, row and cell counts and peak memory to
+        a JSON trace next to the report (e.g. survey_b.trace.json), and "profile" writes cProfile statistics
+        (survey_b.prof).
+        Setting "formats" (e.g. "docx,html,csv,md") writes the report in each of those formats from a single read
+        of the workbook, e.g. survey_b.docx and survey_b.html. "workers", "cache_dir" and "incremental" only apply
+        to .docx-only reports.
+        Setting "sheets" (e.g. "Summary,Q1*,re:^Banner,#3-7") only reports the sheets matching one of the names, globs,
+        "re:" regular expressions or "#" position ranges, in workbook order; the others are never parsed.
+        Setting "reader" picks the workbook reader backend (see reader_utils); by default the fastest installed one
+        that reads the file is used.
+        Setting "max_table_rows" or "max_table_cols" splits longer vertical or wider horizontal tables into
+        continuation tables of at most that many rows or columns (see page_utils).
+    :return: Path of the generated report, in the first of the requested formats.
+    :raises ValueError: If the file is not an .xlsx, .xlsm or .xls workbook or a directory, reading it needs a
+        reader backend that isn't installed (xlrd for .xls), or the sheet selection matches no sheet.
+    """
+    options = args if isinstance(args, ReportOptions) else ReportOptions.from_args(args)
+    suffix = options.suffix
+    if os.path.isdir(file_path):
+        base_path = file_path.rstrip("/" + os.sep) + suffix
+    elif file_path.lower().endswith(WORKBOOK_EXTENSIONS):
+        base_path = os.path.splitext(file_path)[0] + suffix
+    else:
+        raise ValueError(f"Invalid input file: {file_path}")
+    outputs = {name: base_path + FORMATS[name] for name in options.formats}
+    with tracing(base_path + ".trace.json" if options.trace else "", base_path + ".prof" if options.profile else ""):
+        write_outputs(file_path, outputs, options)
+    return outputs[options.formats[0]]
+
+
+def write_report(workbook, output: BinaryIO, args: dict[str, str] | ReportOptions) -> None:
+    """
+    Generates a report like run_report from a workbook held in memory and writes it to a stream, so a service
+    can answer with the report without writing either file to disk.
+    :param workbook: The .xlsx, .xlsm or .xls file's contents as bytes or another buffer (bytearray,
+        memoryview, mmap), or a binary file object; one backed by a file on disk is memory-mapped rather than
+        read in (see reader_utils.workbook_file).
+    :param output: Writable binary stream receiving the report, e.g. an io.BytesIO or a response body. It needn't
+        be seekable and is left open.
+    :param args: Report options, as for run_report. The report is written in the first of "formats". "cache_dir"
+        works as in run_report; the sheets are rendered in this process whatever "workers" is, and
+        "incremental", "trace" and "profile", which work on files next to the report, are ignored.
+    :raises ValueError: If the workbook is neither an .xlsx/.xlsm nor an .xls file, or as run_report.
+    """
+    from reader_utils import workbook_file
+
+    options = args if isinstance(args, ReportOptions) else ReportOptions.from_args(args)
+    options = replace(options, workers=1, incremental=False, formats=options.formats[:1])
+    with workbook_file(workbook) as file:
+        write_outputs(file, {options.formats[0]: output}, options)
+
+
+def write_outputs(file_path: str | BinaryIO, outputs: dict[str, str | BinaryIO], options: ReportOptions) -> None:
+    """
+    Writes the report through the write path the options call for.
+    :param file_path: Absolute path to the Excel file or the directory of CSV files, or the workbook as a
+        seekable binary file.
+    :param outputs: Output path, or writable binary stream, by format, in the order of options.formats.
+    :param options: Report options.
+    """
+    output_file_path = outputs[options.formats[0]]
+    if options.formats != ("docx",):
+        from excel_utils import iter_workbook
+        from render_utils import write_formats
+        sheets = iter_workbook(file_path, options.extra_columns_flag, options.extra_columns, options.reader,
+                               options.sheets)
+        write_formats(sheets, outputs, options)
+    elif options.incremental:
+        from incremental_utils import write_doc_incremental
+        write_doc_incremental(file_path, output_file_path, options)
+    elif options.cache_dir:
+        from cache_utils import write_doc_cached
+        write_doc_cached(file_path, output_file_path, options)
+    elif options.workers > 1:
+        from parallel_utils import write_doc_parallel
+        write_doc_parallel(file_path, output_file_path, options, options.workers)
     else:
-        exit("Invalid input file")
-    pre_data = get_question_data(file_path)
-    write_doc(excel_data, pre_data, output_file_path, args)
-    print(f"Report written to {output_file_path}")
+        from excel_utils import iter_workbook
+        sheets = iter_workbook(file_path, options.extra_columns_flag, options.extra_columns, options.reader,
+                               options.sheets)
+        if options.streaming:
+            from stream_utils import write_doc_streaming
+            write_doc_streaming(sheets, output_file_path, options)
+        else:
+            from docx_utils import write_sheets
+            write_sheets(sheets, output_file_path, options)
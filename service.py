@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import json
+import io
+import os
+import sys
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from urllib.parse import parse_qsl, urlsplit
+from options import ReportOptions
+from report_utils import preload
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+STAGES = ("receive", "queue", "report", "total")
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _render_report(workbook: bytes, options: ReportOptions) -> tuple[bytes, dict[str, float]]:
+    """
+    Runs write_report on workbook bytes inside a worker process, in memory from request to response.
+    :param workbook: Contents of the .xlsx or .xls file.
+    :param options: Report options.
+    :return: Tuple of the .docx bytes and the seconds spent in each stage.
+    """
+    from report_utils import write_report
+
+    start = time.perf_counter()
+    output = io.BytesIO()
+    write_report(workbook, output, options)
+    return output.getvalue(), {"report": time.perf_counter() - start}
+
+
+def args_from_query(query: str) -> dict[str, str]:
+    """
+    Converts the request's query string into the args dictionary run_report takes,
+    e.g. ?ordering=All&font_type=Arial&gridlines=true. On/off values are converted, and rejected if invalid,
+    by ReportOptions.from_args.
+    :param query: URL query string.
+    """
+    return dict(parse_qsl(query))
+
+
+class ReportService:
+    """
+    Resident report generator. Requests wait for one of a fixed number of slots and are then rendered by a
+    pool of warmed-up worker processes; queue depth and per-stage latencies are kept for /stats.
+    """
+
+    def __init__(self, workers: int, max_queue: int, max_body: int, cache_dir: str = "", cache_size_mb: int = 512,
+                 history: int = 1000):
+        """
+        :param workers: Number of worker processes rendering reports.
+        :param max_queue: Requests allowed to wait for a worker before new ones are rejected with 503.
+        :param max_body: Largest accepted workbook in bytes.
+        :param cache_dir: Directory of the parsed sheet and rendered table cache, empty to disable it.
+        :param cache_size_mb: Size the cache is trimmed back to after each request.
+        :param history: Number of recent requests the latency statistics cover.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.cache_dir = cache_dir
+        self.cache_size_mb = cache_size_mb
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=preload)
+        self.slots = asyncio.Semaphore(workers)
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latencies = {stage: deque(maxlen=history) for stage in STAGES}
+
+    async def render(self, workbook: bytes, options: ReportOptions) -> tuple[bytes, dict[str, float]]:
+        """
+        Waits for a free worker and renders one report.
+        :param workbook: Contents of the .xlsx or .xls file.
+        :param options: Report options.
+        :return: Tuple of the .docx bytes and the seconds spent in each stage.
+        """
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.queued -= 1
+        timings = {"queue": time.perf_counter() - start}
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            document, worker_timings = await loop.run_in_executor(self.executor, _render_report, workbook, options)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+        timings.update(worker_timings)
+        return document, timings
+
+    async def start(self) -> None:
+        """
+        Starts the worker processes up front, so the first requests don't wait for them to import the pipeline.
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)))
+
+    def record(self, timings: dict[str, float]) -> None:
+        """
+        Adds one request's stage timings to the statistics.
+        :param timings: Seconds spent in each stage.
+        """
+        for stage, seconds in timings.items():
+            self.latencies[stage].append(seconds)
+
+    def stats(self) -> dict:
+        """
+        Current queue depth, request counters and latency percentiles (in milliseconds) per stage.
+        """
+        latency = {}
+        for stage, samples in self.latencies.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            latency[stage] = {
+                "count": len(ordered),
+                "mean_ms": round(1000 * sum(ordered) / len(ordered), 3),
+                "p50_ms": round(1000 * ordered[len(ordered) // 2], 3),
+                "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max_ms": round(1000 * ordered[-1], 3)
+            }
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency": latency
+        }
+
+    async def handle(self, method: str, target: str, body: bytes,
+                     received: float) -> tuple[int, str, bytes, dict[str, str]]:
+        """
+        Routes one request.
+        POST /report takes the workbook as the body and the options as query parameters and returns the .docx.
+        GET /stats returns the statistics as JSON.
+        :param method: HTTP method.
+        :param target: Request target, path and query string.
+        :param body: Request body.
+        :param received: Seconds spent receiving the request.
+        :return: Tuple of the status code, content type, response body and extra headers.
+        """
+        url = urlsplit(target)
+        if url.path == "/stats":
+            if method != "GET":
+                return 405, "text/plain", b"Use GET\n", {}
+            return 200, "application/json", json.dumps(self.stats(), indent=2).encode(), {}
+        if url.path != "/report":
+            return 404, "text/plain", b"Not found\n", {}
+        if method != "POST":
+            return 405, "text/plain", b"Use POST\n", {}
+        if not body:
+            return 400, "text/plain", b"Send the workbook as the request body\n", {}
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            return 503, "text/plain", b"Queue is full, retry later\n", {"Retry-After": "1"}
+
+        start = time.perf_counter()
+        try:
+            # Parallelism comes from the service's pool, so each report runs in a single process. The cache
+            # location and size are the service's, never the client's. The response is always a .docx.
+            options = replace(ReportOptions.from_args(args_from_query(url.query)), workers=1,
+                              cache_dir=self.cache_dir, cache_size_mb=self.cache_size_mb, formats=("docx",))
+        except ValueError as e:
+            return 400, "text/plain", f"Invalid options: {e}\n".encode(), {}
+        try:
+            document, timings = await self.render(body, options)
+        except Exception:
+            self.failed += 1
+            return 500, "text/plain", traceback.format_exc(limit=-3).encode(), {}
+
+        self.completed += 1
+        timings["receive"] = received
+        timings["total"] = received + time.perf_counter() - start
+        self.record(timings)
+        stage_header = ", ".join(f"{stage};dur={1000 * timings[stage]:.1f}" for stage in STAGES if stage in timings)
+        filename = "report" + options.suffix + ".docx"
+        return 200, DOCX_CONTENT_TYPE, document, {
+            "Content-Disposition": f'attachment; filename="{filename}"', "Server-Timing": stage_header
+        }
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Reads one HTTP/1.1 request from the connection, answers it and closes the connection.
+        :param reader: Stream of the incoming request.
+        :param writer: Stream for the response.
+        """
+        try:
+            start = time.perf_counter()
+            request_line = (await reader.readline()).decode("latin-1").split()
+            if len(request_line) != 3:
+                raise ValueError("malformed request line")
+            method, target, _ = request_line
+            headers = {}
+            while line := (await reader.readline()).decode("latin-1").strip():
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", 0))
+            if length > self.max_body:
+                response = 413, "text/plain", b"Workbook too large\n", {}
+            else:
+                body = await reader.readexactly(length) if length else b""
+                response = await self.handle(method.upper(), target, body, time.perf_counter() - start)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except ValueError:
+            response = 400, "text/plain", b"Malformed request\n", {}
+
+        status, content_type, payload, extra_headers = response
+        head = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(payload)}", "Connection: close"]
+        head.extend(f"{name}: {value}" for name, value in extra_headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+async def serve(host: str, port: int, socket_path: str | None, workers: int, max_queue: int, max_body: int,
+                cache_dir: str = "", cache_size_mb: int = 512) -> None:
+    """
+    Runs the report service until cancelled.
+    :param host: Interface to listen on.
+    :param port: TCP port to listen on.
+    :param socket_path: Unix socket to listen on instead of a TCP port.
+    :param workers: Number of worker processes rendering reports.
+    :param max_queue: Requests allowed to wait for a worker.
+    :param max_body: Largest accepted workbook in bytes.
+    :param cache_dir: Directory of the parsed sheet and rendered table cache, empty to disable it.
+    :param cache_size_mb: Size limit of the cache.
+    """
+    service = ReportService(workers, max_queue, max_body, cache_dir, cache_size_mb)
+    await service.start()
+    if socket_path:
+        server = await asyncio.start_unix_server(service.serve_connection, path=socket_path)
+        address = socket_path
+    else:
+        server = await asyncio.start_server(service.serve_connection, host, port)
+        address = f"http://{host}:{port}"
+    print(f"Serving reports on {address} with {workers} workers", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Entry point for the resident report service.
+    :param argv: Command-line arguments, defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description="Serve Word table reports over a local HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes rendering reports")
+    parser.add_argument("--max-queue", type=int, default=64, help="Requests allowed to wait for a worker")
+    parser.add_argument("--max-body", type=int, default=100 * 1024 * 1024, help="Largest accepted workbook in bytes")
+    parser.add_argument("--cache-dir", default="",
+                        help="Reuse parsed sheets and rendered tables of repeated workbooks from this directory")
+    parser.add_argument("--cache-size", type=int, default=512, metavar="MB", help="Size limit of the cache")
+    options = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(options.host, options.port, options.socket, max(1, options.workers), options.max_queue,
+                          options.max_body, options.cache_dir, options.cache_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
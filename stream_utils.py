@@ -0,0 +1,154 @@
+import io
+import os
+import tempfile
+import zipfile
+from typing import BinaryIO, Iterable
+from docx import Document
+from docx.opc.oxml import serialize_part_xml
+from docx_utils import render_sheet, splice_fragments
+from helpers import SheetData
+from options import ReportOptions
+from page_utils import Paginator, sheet_height
+from profile_utils import span
+from progress_utils import sheet_done
+from xml_utils import add_report_styles
+
+BODY_START = b"<w:body>"
+SECT_PR_START = b"<w:sectPr"
+
+
+class DocumentStream:
+    """
+    Writes a .docx whose body is streamed into word/document.xml inside the zip while it is generated.
+    Content is added to a scratch document with the usual python-docx calls and written out by flush(),
+    which empties the scratch body again, so memory holds one sheet at a time however long the report is.
+    The other package parts (styles, relationships, properties) are taken from the scratch document when
+    the stream is closed. Used as a context manager. The document is written to a temporary file next to
+    output_path and only replaces it once complete, so a failed or cancelled report leaves any earlier
+    report in place. Given a stream instead, the package is written straight into it, which needs no
+    seeking, so a response body or pipe works too.
+    """
+
+    def __init__(self, output_path: str | BinaryIO):
+        """
+        :param output_path: Path to save the generated Word document, or a writable binary stream, which is
+            left open.
+        """
+        self.output_path = output_path
+        self.document = Document()
+        if isinstance(output_path, str):
+            fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix=".docx")
+            os.close(fd)
+        else:
+            self.temp_path = None
+        self.archive = zipfile.ZipFile(self.temp_path or output_path, "w", zipfile.ZIP_DEFLATED)
+        self.stream = self.archive.open(self.document.part.partname.membername, "w")
+        head, _, self.tail = self.split_body()
+        self.stream.write(head)
+
+    def split_body(self) -> tuple[bytes, bytes, bytes]:
+        """
+        Serializes the scratch document the way document.save does and splits it around the body content,
+        so the body elements are written exactly as they would be inside the whole document.
+        :return: Tuple of the XML up to <w:body>, the body content and the final section properties onwards.
+        """
+        xml = serialize_part_xml(self.document.element)
+        start = xml.index(BODY_START) + len(BODY_START)
+        end = xml.rindex(SECT_PR_START)
+        return xml[:start], xml[start:end], xml[end:]
+
+    def flush(self) -> None:
+        """
+        Writes the content added to the scratch document since the last flush and removes it from the body.
+        """
+        with span("write_xml"):
+            _, content, _ = self.split_body()
+            self.stream.write(content)
+        body = self.document.element.body
+        # The section properties always come last. Deleting the rest as one slice is much faster than removing
+        # children one at a time, which makes lxml move each removed subtree to a document of its own.
+        del body[:len(body) - (body.sectPr is not None)]
+
+    def close(self) -> None:
+        """
+        Finishes word/document.xml, adds the remaining package parts and moves the file to output_path.
+        """
+        self.flush()
+        with span("save"):
+            self.stream.write(self.tail)
+            self.stream.close()
+            package = io.BytesIO()
+            self.document.save(package)
+            with zipfile.ZipFile(package) as parts:
+                for info in parts.infolist():
+                    if info.filename != self.document.part.partname.membername:
+                        self.archive.writestr(info, parts.read(info))
+            self.archive.close()
+        if self.temp_path is not None:
+            os.replace(self.temp_path, self.output_path)
+
+    def __enter__(self) -> "DocumentStream":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.discard()
+            return
+        try:
+            self.close()
+        except BaseException:
+            self.discard()
+            raise
+
+    def discard(self) -> None:
+        """
+        Abandons the document, removing the temporary file. What was already written to a stream stays there.
+        """
+        self.stream.close()
+        self.archive.close()
+        if self.temp_path is not None:
+            os.remove(self.temp_path)
+
+
+def write_doc_streaming(sheets: Iterable[tuple[str, SheetData, list[str]]], output_path: str | BinaryIO,
+                        options: ReportOptions) -> None:
+    """
+    Writes the report like write_doc, streaming each sheet into the file as soon as it is rendered.
+    Given sheets read lazily (excel_utils.iter_workbook), peak memory doesn't grow with the number of sheets.
+    :param sheets: Sheet name, data and pre-data of each sheet, in workbook order.
+    :param output_path: Path to save the generated Word document, or a writable binary stream.
+    :param options: Report options.
+    """
+    with DocumentStream(output_path) as stream:
+        add_report_styles(stream.document, options)
+        paginator = Paginator()
+        for sheet_name, content, pre_data in sheets:
+            page_break = paginator.place(sheet_height(sheet_name, content, pre_data, options))
+            render_sheet(stream.document, sheet_name, content, pre_data, page_break, options)
+            stream.flush()
+            sheet_done(sheet_name)
+
+
+def save_fragments(fragments: Iterable[list[bytes]], output_path: str | BinaryIO, options: ReportOptions) -> None:
+    """
+    Saves sheet fragments made by docx_utils.render_sheet_fragment as a document, in the order given.
+    :param fragments: One list of serialized body elements per sheet, with its page break (see
+        page_utils.paginate).
+    :param output_path: Path to save the generated Word document, or a writable binary stream.
+    :param options: Report options the fragments were rendered with. With options.streaming each fragment is
+        written out as it arrives instead of building the whole document first.
+    """
+    if not options.streaming:
+        document = Document()
+        add_report_styles(document, options)
+        with span("splice_fragments"):
+            splice_fragments(document, fragments)
+        with span("save"):
+            document.save(output_path)
+        return
+
+    with DocumentStream(output_path) as stream:
+        add_report_styles(stream.document, options)
+        for fragment in fragments:
+            splice_fragments(stream.document, [fragment])
+            stream.flush()
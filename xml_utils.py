@@ -0,0 +1,507 @@
+import re
+import weakref
+from collections import OrderedDict
+from copy import deepcopy
+from functools import lru_cache
+from xml.sax.saxutils import escape
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.shared import Emu, Inches, Pt
+from docx.table import Table
+from helpers import (MENTIONS_TOTAL, MENTIONS_TOTAL_UPPER, SheetData, format_percentages, header_mentions,
+                     mentions_total, total_mentions)
+from options import ReportOptions
+from profile_utils import count
+
+# The python-docx table markup, see CT_Tbl._tbl_xml
+TBL_LOOK_XML = ('<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" w:noHBand="0" '
+                'w:noVBand="1" w:val="04A0"/>')
+NO_BORDERS_XML = (
+    '<w:tblBorders>'
+    '<w:top w:val="none" w:sz="0" w:space="0" w:color="auto"/>'
+    '<w:left w:val="none" w:sz="0" w:space="0" w:color="auto"/>'
+    '<w:bottom w:val="none" w:sz="0" w:space="0" w:color="auto"/>'
+    '<w:right w:val="none" w:sz="0" w:space="0" w:color="auto"/>'
+    '<w:insideH w:val="none" w:sz="0" w:space="0" w:color="auto"/>'
+    '<w:insideV w:val="none" w:sz="0" w:space="0" w:color="auto"/>'
+    '</w:tblBorders>'
+)
+RUN_BREAKS = re.compile(r"([\t\r\n])")
+# Style IDs of the named styles, see report_styles_xml
+TEXT_STYLE = "ReportText"
+TOTAL_STYLE = "ReportTotal"
+TEXT_TOTAL_STYLE = "ReportTextTotal"
+TABLE_STYLE = "ReportTable"
+
+# Cell fields: text (None for a bare <w:p/>), alignment, total styling, plain (written after styling)
+TEXT, ALIGN, TOTAL, PLAIN = range(4)
+# Most cells a document's CellCache keeps, least recently used dropped first
+CELL_CACHE_SIZE = 4096
+# CellCache of each document, by its part, so it is dropped with the document
+CELL_CACHES = weakref.WeakKeyDictionary()
+
+
+class CellCache:
+    """
+    Bounded LRU of a document's rendered cells. Survey workbooks repeat the same answer labels, percentages
+    and "--" or "*" cells on hundreds of sheets, so most cells of a report are built once and reused: the XML
+    engine's cells by their text, alignment, width and run properties, and the python-docx engine's run
+    properties as parsed elements, cloned for every run they go in. hits and misses count the lookups.
+    """
+
+    def __init__(self, max_size: int = CELL_CACHE_SIZE):
+        """
+        :param max_size: Most entries kept.
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: tuple):
+        """
+        The entry stored under the key, or None, marking it as the most recently used.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key: tuple, entry) -> None:
+        """
+        Stores an entry, dropping the least recently used one when the cache is full.
+        """
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def cell_xml(self, text: str | None, align: str | None, width: int, properties: str) -> str:
+        """
+        A table cell's <w:tc> XML, see cell_xml.
+        """
+        key = ("tc", text, align, width, properties)
+        xml = self.lookup(key)
+        if xml is None:
+            xml = cell_xml(text, align, width, properties)
+            self.store(key, xml)
+        return xml
+
+    def run_properties(self, properties: str):
+        """
+        A new <w:rPr> element holding the run properties, cloned from the parsed one.
+        :param properties: Content of the element, from run_properties_xml.
+        """
+        key = ("rPr", properties)
+        element = self.lookup(key)
+        if element is None:
+            element = parse_xml(f'<w:rPr {nsdecls("w")}>{properties}</w:rPr>')
+            self.store(key, element)
+        return deepcopy(element)
+
+    def counted(self, hits: int, misses: int) -> None:
+        """
+        Adds the lookups since an earlier reading of hits and misses to the report's cell_cache_hits and
+        cell_cache_misses counters (see profile_utils.Trace.hit_rates).
+        """
+        count("cell_cache_hits", self.hits - hits)
+        count("cell_cache_misses", self.misses - misses)
+
+
+def cell_cache(part) -> CellCache:
+    """
+    The CellCache of a document, made on first use.
+    :param part: The document's part, e.g. document.part or table.part.
+    """
+    cache = CELL_CACHES.get(part)
+    if cache is None:
+        cache = CELL_CACHES[part] = CellCache()
+    return cache
+
+
+def run_content_xml(text: str) -> str:
+    """
+    Builds the content of a run the way python-docx's run.text setter does: tabs become <w:tab/>,
+    line breaks become <w:br/> and the rest goes in <w:t>, preserving surrounding spaces.
+    :param text: The text of the run.
+    """
+    xml = []
+    for part in RUN_BREAKS.split(text) if ("\t" in text or "\n" in text or "\r" in text) else (text,):
+        if not part:
+            continue
+        if part == "\t":
+            xml.append("<w:tab/>")
+        elif part == "\r" or part == "\n":
+            xml.append("<w:br/>")
+        elif len(part.strip()) < len(part):
+            xml.append(f'<w:t xml:space="preserve">{escape(part)}</w:t>')
+        else:
+            xml.append(f"<w:t>{escape(part)}</w:t>")
+    return "".join(xml)
+
+
+def vert_table_cells(content: SheetData, header_side: str, caps: bool = False) -> list[list[list]]:
+    """
+    Lays out the cells of a vertical table as gen_vert_table and populate_subset_row do. The total field
+    of a cell holds its total mentions (see helpers.mentions_total), taken from the sheet's header
+    classification instead of searching the text of every cell; style_cells works out the final total
+    styling from them.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param header_side: Whether the headers go in the first ("Left") or last ("Right") column.
+    :param caps: Whether the text is upper-cased by the All Caps text type.
+    :return: Rows of cells, each cell being [text, alignment, total, plain].
+    """
+    num_cols = 2 + len(content.values) - 1
+    rows = []
+    subsets = content.subsets
+    if subsets:
+        row = [[None, None, False, False] for _ in range(num_cols)]
+        if header_side == "Right":
+            for col, subset in enumerate(subsets[1:]):
+                row[col][TEXT], row[col][ALIGN] = subset, "center"
+            row[len(subsets) - 1][TEXT], row[len(subsets) - 1][ALIGN] = subsets[0], "center"
+        elif header_side == "Left":
+            for col, subset in enumerate(subsets):
+                row[col][TEXT], row[col][ALIGN] = subset, "center"
+        for cell in row:
+            cell[TOTAL] = mentions_total(cell[TEXT], caps) if cell[TEXT] is not None else 0
+        rows.append(row)
+
+    value_offset = 0 if header_side == "Right" else 1
+    mentioned_values = {}
+    for col, column in enumerate(content.values):
+        for index, mention in total_mentions(column, caps).items():
+            mentioned_values.setdefault(index, []).append((col + value_offset, mention))
+
+    columns = zip(*map(format_percentages, content.values))
+    for index, (header, kind, values) in enumerate(zip(content.headers, content.header_kinds, columns)):
+        header_text = str(header) if header is not None else ""
+        if header_side == "Right":
+            row = [[value, "right", False, False] for value in values]
+            row.extend([None, None, False, False] for _ in range(num_cols - len(row)))
+            row[num_cols - 1] = [header_text, None, header_mentions(kind, caps), False]
+        else:
+            row = [[header_text, None, header_mentions(kind, caps), False]]
+            row.extend([value, "left", False, False] for value in values)
+            row.extend([None, None, False, False] for _ in range(num_cols - len(row)))
+        for col, mention in mentioned_values.get(index, ()):
+            row[col][TOTAL] = mention
+        rows.append(row)
+
+    return rows
+
+
+def horiz_table_cells(content: SheetData, caps: bool = False) -> list[list[list]]:
+    """
+    Lays out the cells of a horizontal table as gen_horiz_table does. Cells are addressed in row-major
+    order like table.cell(), so the grid keeps its exact shape. Total fields are set as in vert_table_cells.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param caps: Whether the text is upper-cased by the All Caps text type.
+    :return: Rows of cells, each cell being [text, alignment, total, plain].
+    """
+    num_cols = len(content.headers) + (1 if content.subsets else 0)
+    num_rows = 2 + len(content.values) - 1
+    cells = [[None, None, False, False] for _ in range(num_rows * num_cols)]
+    for col, (header, kind) in enumerate(zip(content.headers, content.header_kinds)):
+        cells[col][TEXT] = str(header) if header is not None else "  "
+        cells[col][TOTAL] = header_mentions(kind, caps)
+    for row, values in enumerate(map(format_percentages, content.values)):
+        for col, value in enumerate(values):
+            cell = cells[(row + 1) * num_cols + col]
+            cell[TEXT], cell[ALIGN] = value, "center"
+    for row, column in enumerate(content.values):
+        for col, mention in total_mentions(column, caps).items():
+            cells[(row + 1) * num_cols + col][TOTAL] = mention
+    return [cells[row * num_cols:(row + 1) * num_cols] for row in range(num_rows)]
+
+
+def total_cells(rows: list[list[list]]) -> list[list[int]]:
+    """
+    The total mentions of every cell of a cell layout, row by row, for style_table.
+    :param rows: Cell layout from vert_table_cells or horiz_table_cells.
+    """
+    return [[cell[TOTAL] for cell in row] for row in rows]
+
+
+@lru_cache(maxsize=64)
+def style_plan(options: ReportOptions) -> dict:
+    """
+    Compiles the report options into the styling decisions made for every cell of a table, so they are
+    worked out once instead of once per cell. Shared by style_table and the table builder, and cached per
+    options so reports with the same options reuse it. The returned plan must not be modified.
+    :param options: Report options; options.ordering is the layout of the table being styled.
+    """
+    vertical = options.ordering == "Vertical"
+    inline = options.total_position == "Inline"
+    font_name = escape(options.font_type, {'"': "&quot;"})
+    plan = {
+        "margin": Inches(options.margin) if vertical else None,
+        "margin_first": vertical and options.header_side == "Right",
+        "margin_rest": vertical and options.header_side == "Left",
+        "table_indent": options.margin if vertical and options.header_side == "Left" else None,
+        "remove_borders": not options.gridlines and not options.named_styles,
+        "table_style": TABLE_STYLE if options.named_styles and not options.gridlines else "TableGrid",
+        "caps": options.text_type == "All Caps",
+        "font_name": options.font_type,
+        "font_size": Pt(options.font_size),
+        "total_underline": inline,
+        "total_italic": not inline,
+        "total_upper": not inline,
+        "connect_offset": -1 if vertical and options.header_side == "Right" else 1,
+        # Pre-rendered run properties, in the child order <w:rPr> requires: rFonts, b, i, sz, u
+        "font_xml": (f'<w:rFonts w:ascii="{font_name}" w:hAnsi="{font_name}"/>',
+                     f'<w:sz w:val="{int(Pt(options.font_size).pt * 2)}"/>') if options.font_type else ("", ""),
+        "total_xml": ("<w:b/>", "" if inline else "<w:i/>", '<w:u w:val="single"/>' if inline else ""),
+        "named_styles": options.named_styles
+    }
+    # With named styles a run refers to one of the styles add_report_styles defines, by (font, total)
+    font_style = TEXT_STYLE if options.font_type else None
+    plan["run_styles"] = {(False, False): None, (True, False): font_style, (False, True): TOTAL_STYLE,
+                          (True, True): TEXT_TOTAL_STYLE if options.font_type else TOTAL_STYLE}
+    return plan
+
+
+def run_properties_xml(plan: dict, font: bool, total: bool) -> str:
+    """
+    Builds the <w:rPr> content for a run with the plan's font and/or total styling: the properties
+    themselves, or with named styles a reference to the style holding them.
+    :param plan: Style plan from style_plan.
+    :param font: Whether the run gets the font name and size.
+    :param total: Whether the run gets the total styling.
+    """
+    if plan["named_styles"]:
+        style = plan["run_styles"][(font, total)]
+        return f'<w:rStyle w:val="{style}"/>' if style else ""
+    rfonts, size = plan["font_xml"] if font else ("", "")
+    bold, italic, underline = plan["total_xml"] if total else ("", "", "")
+    return f"{rfonts}{bold}{italic}{size}{underline}"
+
+
+def report_styles_xml(plan: dict) -> list[str]:
+    """
+    The named styles cells refer to with options.named_styles: the font as a character style, the total
+    styling with and without it, and a table style without borders.
+    :param plan: Style plan from style_plan.
+    :return: The <w:style> elements to add to the document's styles part.
+    """
+    rfonts, size = plan["font_xml"]
+    bold, italic, underline = plan["total_xml"]
+    total = f"{bold}{italic}{underline}"
+    styles = [(TOTAL_STYLE, "Report Total", "", total)]
+    if rfonts:
+        styles.append((TEXT_STYLE, "Report Text", "", f"{rfonts}{size}"))
+        styles.append((TEXT_TOTAL_STYLE, "Report Text Total", f'<w:basedOn w:val="{TEXT_STYLE}"/>', total))
+    xml = [f'<w:style {nsdecls("w")} w:type="character" w:customStyle="1" w:styleId="{style_id}">'
+           f'<w:name w:val="{name}"/>{based_on}<w:rPr>{properties}</w:rPr></w:style>'
+           for style_id, name, based_on, properties in styles]
+    if plan["table_style"] == TABLE_STYLE:
+        xml.append(f'<w:style {nsdecls("w")} w:type="table" w:customStyle="1" w:styleId="{TABLE_STYLE}">'
+                   f'<w:name w:val="Report Table"/><w:basedOn w:val="TableGrid"/>'
+                   f'<w:tblPr>{NO_BORDERS_XML}</w:tblPr></w:style>')
+    return xml
+
+
+def add_report_styles(document: Document, options: ReportOptions) -> None:
+    """
+    Adds the named styles of options.named_styles to the document, once per document before its tables
+    are added or spliced in. Styles of the same name left by an earlier report are replaced.
+    :param document: The Word document object.
+    :param options: Report options.
+    """
+    if not options.named_styles:
+        return
+    styles = document.styles.element
+    for xml in report_styles_xml(style_plan(options)):
+        style = parse_xml(xml)
+        existing = styles.get_by_id(style.styleId)
+        if existing is not None:
+            styles.remove(existing)
+        styles.append(style)
+
+
+def total_marks(mentions: list[list[int]], plan: dict) -> set[tuple[int, int | None]]:
+    """
+    Finds what gets total styling in a row: each paragraph mentioning "total", and the whole cell connected
+    to it (the value next to it). Cells are visited left to right, and a connected cell that is upper-cased
+    before it is visited is checked as upper-cased, which can make it a total in turn.
+    :param mentions: Total mentions (see helpers.mentions_total) of each paragraph of each cell in the row.
+    :param plan: Style plan from style_plan.
+    :return: Set of (cell, paragraph) pairs, where a paragraph of None stands for every paragraph of the cell.
+    """
+    marked = set()
+    upper_cased = set()
+    num_cells = len(mentions)
+    for i, paragraphs in enumerate(mentions):
+        flag = MENTIONS_TOTAL_UPPER if i in upper_cased else MENTIONS_TOTAL
+        for n, mention in enumerate(paragraphs):
+            if mention & flag:
+                marked.add((i, n))
+                connected = i + plan["connect_offset"]
+                if connected < num_cells:
+                    marked.add((connected % num_cells, None))
+                    if plan["total_upper"]:
+                        upper_cased.add(connected % num_cells)
+    return marked
+
+
+def style_cells(rows: list[list[list]], plan: dict) -> None:
+    """
+    Applies the text changes and total styling of the plan to the cell layout, before any XML exists.
+    :param rows: Cell layout from vert_table_cells or horiz_table_cells, laid out with the plan's caps setting.
+    :param plan: Style plan from style_plan.
+    """
+    for row in rows:
+        if plan["caps"]:
+            for cell in row:
+                cell[TEXT] = cell[TEXT].upper() if cell[TEXT] is not None else ""
+        marked = {i for i, _ in total_marks([[cell[TOTAL]] if cell[TEXT] is not None else [] for cell in row], plan)}
+        for i, cell in enumerate(row):
+            cell[TOTAL] = i in marked and cell[TEXT] is not None
+            if cell[TOTAL] and plan["total_upper"]:
+                cell[TEXT] = cell[TEXT].upper()
+
+
+def table_xml(rows: list[list[list]], num_cols: int, block_width: int, plan: dict,
+              cells: CellCache | None = None) -> str:
+    """
+    Serializes a styled cell layout into a complete <w:tbl> element.
+    :param rows: Styled cell layout.
+    :param num_cols: Number of grid columns.
+    :param block_width: Width available to the table in EMU; split evenly across the columns.
+    :param plan: Style plan from style_plan.
+    :param cells: Cache of the document's cells to reuse them from, see cell_cache.
+    """
+    col_width = (Emu(block_width // num_cols) if num_cols > 0 else Emu(0)).twips
+    widths = [col_width] * num_cols
+    if plan["margin_first"] and num_cols:
+        widths[0] = plan["margin"].twips
+    elif plan["margin_rest"]:
+        widths[1:] = [plan["margin"].twips] * (num_cols - 1)
+    tbl_pr = [f'<w:tblPr><w:tblStyle w:val="{plan["table_style"]}"/><w:tblW w:type="auto" w:w="0"/>{TBL_LOOK_XML}']
+    if plan["table_indent"] is not None:
+        tbl_pr.append(f'<w:tblInd w:w="{int(plan["table_indent"] * 1440)}" w:type="dxa"/>')
+    if plan["remove_borders"]:
+        tbl_pr.append(NO_BORDERS_XML)
+    tbl_pr.append("</w:tblPr>")
+
+    # python-docx's template leaves its indentation inside a grid and rows without any columns
+    empty = "\n  " if num_cols == 0 else ""
+    xml = [f"<w:tbl {nsdecls('w')}>", *tbl_pr, "<w:tblGrid>", empty]
+    xml.extend(f'<w:gridCol w:w="{col_width}"/>' for _ in range(num_cols))
+    xml.append("</w:tblGrid>")
+    properties = {(font, total): run_properties_xml(plan, font, total) for font in (False, True)
+                  for total in (False, True)}
+    hits, misses = (cells.hits, cells.misses) if cells is not None else (0, 0)
+    for row in rows:
+        xml.append("<w:tr>" + empty)
+        for col, (text, align, total, plain) in enumerate(row):
+            if cells is not None:
+                xml.append(cells.cell_xml(text, align, widths[col], properties[not plain, total]))
+            else:
+                xml.append(cell_xml(text, align, widths[col], properties[not plain, total]))
+        xml.append("</w:tr>")
+    xml.append("</w:tbl>")
+    if cells is not None:
+        cells.counted(hits, misses)
+    return "".join(xml)
+
+
+def cell_xml(text: str | None, align: str | None, width: int, properties: str) -> str:
+    """
+    Serializes one table cell.
+    :param text: Text of the cell, None for a cell holding a bare <w:p/>.
+    :param align: Paragraph alignment, e.g. "center", or None.
+    :param width: Width of the cell in twips.
+    :param properties: Content of the run's <w:rPr>, from run_properties_xml.
+    """
+    if text is None:
+        return f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/></w:tcPr><w:p/></w:tc>'
+    paragraph = f'<w:p><w:pPr><w:jc w:val="{align}"/></w:pPr><w:r>' if align else "<w:p><w:r>"
+    run_properties = f"<w:rPr>{properties}</w:rPr>" if properties else ""
+    return (f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/></w:tcPr>{paragraph}{run_properties}'
+            f'{run_content_xml(text)}</w:r></w:p></w:tc>')
+
+
+def block_width(document: Document) -> int:
+    """
+    Width between the margins of the document's last section in EMU, which python-docx gives new tables.
+    :param document: The Word document object.
+    """
+    section = document.sections[-1]
+    return section.page_width - section.left_margin - section.right_margin
+
+
+def append_table(document: Document, xml: str) -> Table:
+    """
+    Parses a <w:tbl> string and appends it to the end of the document body.
+    :param document: The Word document object.
+    :param xml: Complete table XML from table_xml.
+    :return: The appended table.
+    """
+    tbl = parse_xml(xml)
+    body = document.element.body
+    if body.sectPr is not None:
+        body.sectPr.addprevious(tbl)
+    else:
+        body.append(tbl)
+    return Table(tbl, document._body)
+
+
+def vert_table_layout(content: SheetData, options: ReportOptions) -> tuple[list[list[list]], int, dict]:
+    """
+    The styled cells of a vertical table, before any XML is written. Shared by the .docx table builder
+    and the text renderers in render_utils.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
+    :return: Tuple of the styled cell layout, the number of grid columns and the style plan.
+    """
+    num_cols = 2 + len(content.values) - 1
+    plan = style_plan(options.with_ordering("Vertical"))
+    rows = vert_table_cells(content, options.header_side, plan["caps"])
+    style_cells(rows, plan)
+    return rows, num_cols, plan
+
+
+def horiz_table_layout(content: SheetData, options: ReportOptions) -> tuple[list[list[list]], int, dict]:
+    """
+    The styled cells of a horizontal table with its subset column, before any XML is written.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
+    :return: Tuple of the styled cell layout, the number of grid columns and the style plan.
+    """
+    num_cols = len(content.headers) + (1 if content.subsets else 0)
+    plan = style_plan(options.with_ordering("Horizontal"))
+    rows = horiz_table_cells(content, plan["caps"])
+    style_cells(rows, plan)
+    for j, subset in enumerate(content.subsets):
+        rows[j][num_cols - 1] = [subset, "center", False, True]
+    return rows, num_cols, plan
+
+
+def build_vert_table(document: Document, content: SheetData, options: ReportOptions) -> Table:
+    """
+    Builds a styled vertical table in one pass and appends it to the document. Produces the same table
+    as gen_vert_table followed by style_table.
+    :param document: The Word document object where the table will be added.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
+    :return: The appended table.
+    """
+    rows, num_cols, plan = vert_table_layout(content, options)
+    return append_table(document, table_xml(rows, num_cols, block_width(document), plan, cell_cache(document.part)))
+
+
+def build_horiz_table(document: Document, content: SheetData, options: ReportOptions) -> Table:
+    """
+    Builds a styled horizontal table in one pass and appends it to the document. Produces the same table
+    as gen_horiz_table followed by style_table and the subset column write_doc fills in.
+    :param document: The Word document object where the table will be added.
+    :param content: The sheet's headers, values and subsets (see helpers.SheetData).
+    :param options: Report options.
+    :return: The appended table.
+    """
+    rows, num_cols, plan = horiz_table_layout(content, options)
+    return append_table(document, table_xml(rows, num_cols, block_width(document), plan, cell_cache(document.part)))